@@ -1,42 +1,204 @@
 #!/usr/bin/env python3
 
+import hashlib
 import json
 import os
+import sys
 import time
+import urllib.parse
 from datetime import datetime
+from captures import CaptureWriter
+from driver_stats import DriverStats
+from driver_stats import InstrumentedPage
 from playwright.sync_api import TimeoutError as PWTimeoutError
+from tracing import CycleTracer
 import logging
 
 WAIT_TIMEOUT = 30000  # milliseconds
+VIEWPORT = {"width": 1366, "height": 768}
+SOFT_REFRESH_TIMEOUT = 5000  # milliseconds
+LIVE_POLL_TIMEOUT = 1000  # milliseconds
+
+# Reports titles that appear on or disappear from the list page, compared with
+# the known titles it's given (or the current ones). Installed once per page,
+# later calls only reset what is known.
+LIVE_OBSERVER_SCRIPT = """
+(known) => {
+  const titles = () => Array.from(document.querySelectorAll('.virtual-list .item-title'), el => el.innerText);
+  window.__alexa2anylistKnown = new Set(known || titles());
+  if (!window.__alexa2anylistCheck) {
+    let timer = null;
+    window.__alexa2anylistCheck = () => {
+      if (timer !== null) return;
+      timer = setTimeout(() => {
+        timer = null;
+        const current = new Set(titles());
+        const known = window.__alexa2anylistKnown;
+        const added = [...current].filter(t => !known.has(t));
+        const removed = [...known].filter(t => !current.has(t));
+        window.__alexa2anylistKnown = current;
+        if (added.length || removed.length) window.alexa2anylistChanged(added, removed);
+      }, 250);
+    };
+    new MutationObserver(window.__alexa2anylistCheck)
+      .observe(document.body, {childList: true, subtree: true, characterData: true});
+  }
+  window.__alexa2anylistCheck();
+}
+"""
 
 logger = logging.getLogger(__name__)
 
 
 class AlexaShoppingList:
 
-    def __init__(self, amazon_url: str = "amazon.co.uk", cookies_path: str = ""):
+    # How many titles from the top of the list the change probe compares
+    PROBE_ITEMS = 8
+
+    _last_signature = None
+    _page_fresh = False
+    # Overrides https://www.{amazon_url}, e.g. to point at a local test page
+    base_url = None
+    # Playwright calls and sleeps since the cycle started, see start_cycle
+    stats = None
+    last_cycle_stats = None
+    # Set when tracing is enabled, see CycleTracer
+    tracer = None
+    # Writes get_screenshot captures, created on first use
+    captures = None
+    # The current sync cycle's deadline, see set_deadline
+    deadline = None
+    # A running browser to attach to instead of launching one, see browser_server.py
+    browser_endpoint = None
+    _playwright = None
+    # False when the context came with a browser we attached to, and is left open for the next run
+    _owns_context = True
+    # The list page is reloaded in full every this many refreshes, see _refresh_list
+    full_reload_every = 10
+    _soft_refreshes = 0
+    # Paths of the JSON the list page fetched, a soft refresh waits for one of them
+    _list_fetches = None
+    # Cleared when the page didn't fetch its items again when asked to
+    _soft_refresh_works = True
+    # How often the list page fetches its items while wait_for_changes watches it
+    live_refresh_seconds = 30
+    # The page alexa2anylistChanged was exposed to, and what it reported since
+    _live_page = None
+    _live_changes = None
+
+    def __init__(self, amazon_url: str = "amazon.co.uk", cookies_path: str = "", base_url: str = None,
+                 trace_dir: str = None, trace_slow_seconds: float = 60, trace_max_mb: float = 200,
+                 browser_endpoint: str = None, full_reload_every: int = 10):
         self.amazon_url = amazon_url
         self.cookies_path = cookies_path
+        self.base_url = base_url
+        self.browser_endpoint = browser_endpoint
+        self.full_reload_every = full_reload_every
         self.is_authenticated = False
+        self.stats = DriverStats()
         self._setup_browser()
+        if trace_dir:
+            self.tracer = CycleTracer(
+                self._context,
+                trace_dir,
+                slow_seconds=trace_slow_seconds,
+                max_bytes=int(trace_max_mb * 1024 * 1024),
+            )
 
     def _setup_browser(self):
-        from cloakbrowser import launch
-
-        headed = os.environ.get("HEADED", "0") == "1"
-        self._browser = launch(headless=not headed)
-        self._context = self._browser.new_context(viewport={"width": 1366, "height": 768})
-        self._page = self._context.new_page()
-
-        self._page.goto(f"https://www.{self.amazon_url}", wait_until="domcontentloaded")
+        if self.browser_endpoint:
+            self._connect_browser()
+        else:
+            from cloakbrowser import launch
+
+            headed = os.environ.get("HEADED", "0") == "1"
+            self._browser = launch(headless=not headed)
+            self._context = self._browser.new_context(viewport=VIEWPORT)
+            self._owns_context = True
+        page = self._context.new_page()
+        if not self._owns_context:
+            page.set_viewport_size(VIEWPORT)
+        self._watch_list_fetches(page)
+        self._page = InstrumentedPage(page, self.stats, self)
+
+        self._page.goto(self._home_url(), wait_until="domcontentloaded")
         self._load_cookies()
 
         if self._page.locator('.nav-action-signin-button').count() == 0:
             self.is_authenticated = True
 
+    def _connect_browser(self):
+        """Attaches to an already running browser, reusing its context if it has one."""
+        from playwright.sync_api import sync_playwright
+
+        self._playwright = sync_playwright().start()
+        endpoint = self.browser_endpoint
+        if endpoint.startswith(("ws://", "wss://")) and "/devtools/" not in endpoint:
+            # A Playwright browser server
+            self._browser = self._playwright.chromium.connect(endpoint, timeout=WAIT_TIMEOUT)
+        else:
+            self._browser = self._playwright.chromium.connect_over_cdp(endpoint, timeout=WAIT_TIMEOUT)
+
+        if self._browser.contexts:
+            # The browser's own context, its cookies survive our restarts
+            self._context = self._browser.contexts[0]
+            self._owns_context = False
+        else:
+            self._context = self._browser.new_context(viewport=VIEWPORT)
+            self._owns_context = True
+        print(f"Attached to the browser at {endpoint}")
+
+    def _close_context(self):
+        if self._owns_context:
+            self._context.close()
+        else:
+            # Leave the shared context for the next run, only our page goes
+            self._page.close()
+
     # ============================================================
     # Helpers
 
+    def _home_url(self):
+        return (self.base_url or f"https://www.{self.amazon_url}").rstrip("/")
+
+    def _sleep(self, seconds):
+        caller = sys._getframe(1).f_code.co_name
+        if self.deadline is not None:
+            seconds = self.deadline.timeout(seconds, f"Alexa {caller}")
+        if self.stats is not None:
+            self.stats.record_sleep(caller, seconds)
+        time.sleep(seconds)
+
+    def _timeout(self, timeout_ms):
+        """A Playwright timeout, cut short if the cycle's deadline is closer."""
+        if self.deadline is None:
+            return timeout_ms
+        return self.deadline.timeout_ms(timeout_ms, f"Alexa {sys._getframe(1).f_code.co_name}")
+
+    def set_deadline(self, deadline):
+        """Called by the server around each sync cycle, None once it's done."""
+        self.deadline = deadline
+        context = getattr(self, "_context", None)
+        if context is not None:
+            # For the calls that don't pass their own timeout
+            context.set_default_timeout(WAIT_TIMEOUT if deadline is None else deadline.timeout_ms(WAIT_TIMEOUT))
+
+    def start_cycle(self):
+        """Called by the Synchronizer when a sync cycle starts."""
+        if self.stats is not None:
+            self.stats.reset()
+        if self.tracer is not None:
+            self.tracer.start_cycle()
+
+    def finish_cycle(self, failed=False):
+        """Called by the Synchronizer when a sync cycle is done, whether or not it failed."""
+        if self.tracer is not None:
+            self.tracer.finish_cycle(failed=failed)
+        if self.stats is None:
+            return
+        self.last_cycle_stats = self.stats.summary()
+        print(f"Alexa driver cycle{' (failed)' if failed else ''}: {self.stats.format_summary()}")
+
     def _get_file_location(self):
         return os.path.dirname(os.path.realpath(__file__))
 
@@ -61,35 +223,134 @@ class AlexaShoppingList:
         with open(path, "r") as f:
             cookies = json.load(f)
         self._context.add_cookies(cookies)
-        self._page.goto(f"https://www.{self.amazon_url}", wait_until="domcontentloaded")
+        self._page.goto(self._home_url(), wait_until="domcontentloaded")
         try:
-            self._page.wait_for_selector('#nav-link-accountList', timeout=WAIT_TIMEOUT)
+            self._page.wait_for_selector('#nav-link-accountList', timeout=self._timeout(WAIT_TIMEOUT))
         except PWTimeoutError:
             pass
 
+    # ============================================================
+    # Recovery, cheapest first
+
+    def reload_list(self):
+        """Loads the shopping list page again, forgetting what was read from it."""
+        self._page_fresh = False
+        self._last_signature = None
+        self._soft_refreshes = 0
+        self._page.goto(self._list_url(), wait_until="domcontentloaded")
+        self._page.wait_for_selector('.list-header', timeout=self._timeout(WAIT_TIMEOUT))
+
+    def recreate_context(self):
+        """Replaces the browser context and page, keeping the browser and the session cookies."""
+        self._save_session()
+        if self.tracer is not None:
+            self.tracer.stop()
+        try:
+            self._close_context()
+        except Exception as e:
+            print(f"Could not close the old browser context: {e}")
+        self._page_fresh = False
+        self._last_signature = None
+        self._context = self._browser.new_context(viewport=VIEWPORT)
+        self._owns_context = True
+        page = self._context.new_page()
+        self._watch_list_fetches(page)
+        self._page = InstrumentedPage(page, self.stats, self)
+        if self.tracer is not None:
+            self.tracer = CycleTracer(self._context, self.tracer.out_dir, self.tracer.slow_seconds, self.tracer.max_bytes)
+        self._page.goto(self._home_url(), wait_until="domcontentloaded")
+        self._load_cookies()
+        if self.requires_login():
+            self.is_authenticated = False
+
     def _clear_driver(self):
         self._save_session()
-        self._context.close()
+        if self.captures is not None:
+            self.captures.flush()
+        if self.tracer is not None:
+            self.tracer.stop()
+        self._close_context()
+        # Only disconnects from a browser we attached to
         self._browser.close()
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+    # ============================================================
+    # Live changes
+
+    def _on_live_change(self, added, removed):
+        if self._live_changes is not None:
+            self._live_changes.append((added, removed))
+
+    def _install_live_observer(self, known=None):
+        if self._live_page is not self._page:
+            self._page.expose_function("alexa2anylistChanged", self._on_live_change)
+            self._live_page = self._page
+        self._page.evaluate(LIVE_OBSERVER_SCRIPT, known)
+
+    def wait_for_changes(self, seconds):
+        """Waits up to seconds for items to appear on or disappear from the list page.
+
+        Returns whether they did. Playwright only hands over the page's events
+        while it's being called, so this keeps it busy with short waits, and
+        has the page fetch its items every live_refresh_seconds so changes made
+        elsewhere (e.g. by voice) show up.
+        """
+        self._live_changes = []
+        try:
+            self._ensure_on_alexa_list()
+            self._page.evaluate("() => window.scrollTo(0, 0)")
+            self._install_live_observer()
+            expires_at = time.monotonic() + seconds
+            next_refresh = time.monotonic() + self.live_refresh_seconds
+            while not self._live_changes:
+                now = time.monotonic()
+                if now >= expires_at:
+                    return False
+                if now >= next_refresh:
+                    known = self._page.evaluate("() => Array.from(window.__alexa2anylistKnown || [])")
+                    self._refresh_list()
+                    # A full reload loses the observer, changes it missed are still reported
+                    self._install_live_observer(known)
+                    next_refresh = time.monotonic() + self.live_refresh_seconds
+                self._page.wait_for_timeout(min(LIVE_POLL_TIMEOUT, max(1, int((expires_at - now) * 1000))))
+            added = [title for change in self._live_changes for title in change[0]]
+            removed = [title for change in self._live_changes for title in change[1]]
+            print(f"Alexa list changed: added {added}, removed {removed}")
+            # The page now shows the change, the scrape can use it as it is. The
+            # change may be below the probed titles, so the next cycle scrapes it all
+            self._page_fresh = True
+            self._last_signature = None
+            return True
+        finally:
+            self._live_changes = None
 
     # ============================================================
     # Screenshots (errors only)
 
-    def get_screenshot(self, caption=None):
+    def _capture_writer(self):
         out_dir = os.environ.get("SCREENSHOT_PATH", "/screenshots" if os.name != "nt" else "")
         if not out_dir:
             out_dir = os.path.join(self._get_file_location(), "screenshots")
-        os.makedirs(out_dir, exist_ok=True)
+        if self.captures is None or self.captures.out_dir != out_dir:
+            self.captures = CaptureWriter(
+                out_dir,
+                max_files=int(os.environ.get("SCREENSHOT_MAX_FILES", 50)),
+                max_bytes=int(float(os.environ.get("SCREENSHOT_MAX_MB", 100)) * 1024 * 1024),
+            )
+        return self.captures
+
+    def get_screenshot(self, caption=None):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S.%f")
         if caption:
             caption = caption.replace(" ", "_").replace("/", "_").replace("\\", "_")
             timestamp += f"_{caption}"
-        screenshot_path = os.path.join(out_dir, f"{timestamp}_screenshot.png")
-        self._page.screenshot(path=screenshot_path, full_page=True)
-        with open(os.path.join(out_dir, f"{timestamp}_content.html"), "w", encoding="utf-8") as f:
-            f.write(self._page.content())
-        print(f"Saved screenshot to {screenshot_path}")
-        return screenshot_path
+        # Only what's in the viewport, a full page PNG of a long list can be several MB.
+        # The files are written (and old ones deleted) in the background.
+        png = self._page.screenshot(full_page=False)
+        html = self._page.content()
+        return self._capture_writer().submit(timestamp, png, html)
 
     # ============================================================
     # Authentication
@@ -122,7 +383,7 @@ class AlexaShoppingList:
         pw_field = self._page.locator('#ap_password')
         if pw_field.count() == 0:
             pw_field = self._page.locator('input[type="password"]')
-        pw_field.wait_for(state="visible", timeout=15000)
+        pw_field.wait_for(state="visible", timeout=self._timeout(15000))
 
         # Amazon can move focus for passkey/WebAuthn flows, so always target the
         # field directly and verify the value before submitting.
@@ -184,7 +445,7 @@ class AlexaShoppingList:
                     });
                     return mfa || nav || puzzle || wrongPw || cookieWarn || visibleAlert || !hasPw;
                 }""",
-                timeout=timeout_ms,
+                timeout=self._timeout(timeout_ms),
             )
 
         def _attempt_submit(action_name: str, action):
@@ -193,7 +454,7 @@ class AlexaShoppingList:
             try:
                 with self._page.expect_response(
                     lambda r: "/ap/signin" in r.url and r.request.method == "POST",
-                    timeout=6000,
+                    timeout=self._timeout(6000),
                 ):
                     action()
                 saw_post = True
@@ -287,7 +548,7 @@ class AlexaShoppingList:
         try:
             self._page.wait_for_function(
                 "() => !document.body.innerText.includes('Solve this puzzle to protect your account')",
-                timeout=300000
+                timeout=self._timeout(300000)
             )
             print(" -> Puzzle appears solved, continuing...")
             self._page.wait_for_load_state("domcontentloaded")
@@ -309,16 +570,16 @@ class AlexaShoppingList:
         if remember.count() > 0:
             remember.click()
         self._page.locator('input[type="submit"]').click()
-        time.sleep(5)
+        self._sleep(5)
         if not self.login_requires_mfa():
             self._login_successful()
 
     def login(self, email: str, password: str):
         # Navigate to homepage only if not already there
-        home = f"https://www.{self.amazon_url}"
+        home = self._home_url()
         if not self._page.url.startswith(home):
             self._page.goto(home, wait_until="domcontentloaded")
-        self._page.wait_for_selector('#nav-link-accountList', timeout=WAIT_TIMEOUT)
+        self._page.wait_for_selector('#nav-link-accountList', timeout=self._timeout(WAIT_TIMEOUT))
 
         signin_url = self._page.get_attribute('a[data-nav-role="signin"]', "href")
         if not signin_url:
@@ -334,7 +595,7 @@ class AlexaShoppingList:
             self._login_successful()
             return
 
-        self._page.wait_for_selector('input[type="email"]', timeout=WAIT_TIMEOUT)
+        self._page.wait_for_selector('input[type="email"]', timeout=self._timeout(WAIT_TIMEOUT))
 
         self.email = email
         self.password = password
@@ -380,22 +641,163 @@ class AlexaShoppingList:
     # ============================================================
     # Alexa lists
 
+    def _list_url(self):
+        return f"{self._home_url()}/alexaquantum/sp/alexaShoppingList?ref=nav_asl"
+
     def _ensure_on_alexa_list(self, refresh: bool = False):
-        list_url = f"https://www.{self.amazon_url}/alexaquantum/sp/alexaShoppingList?ref=nav_asl"
+        list_url = self._list_url()
         if self._page.url != list_url:
             self._page.goto(list_url, wait_until="domcontentloaded")
             try:
-                self._page.wait_for_selector('.list-header', timeout=WAIT_TIMEOUT)
+                self._page.wait_for_selector('.list-header', timeout=self._timeout(WAIT_TIMEOUT))
             except PWTimeoutError:
                 self.get_screenshot("alexa_list_load_failed")
                 raise
+            self._soft_refreshes = 0
         elif refresh:
-            self._page.reload(wait_until="domcontentloaded")
-            self._page.wait_for_selector('.list-header', timeout=WAIT_TIMEOUT)
+            self._refresh_list()
+
+    def _watch_list_fetches(self, page):
+        self._list_fetches = set()
+        page.on("response", self._record_list_fetch)
+
+    def _record_list_fetch(self, response):
+        """Remembers the JSON the list page loads its items from."""
+        try:
+            request = response.request
+            if request.method != "GET" or request.resource_type not in ("fetch", "xhr"):
+                return
+            if "json" not in response.headers.get("content-type", ""):
+                return
+            if urllib.parse.urlsplit(self._page.url).path != urllib.parse.urlsplit(self._list_url()).path:
+                return
+            self._list_fetches.add(urllib.parse.urlsplit(response.url).path)
+        except Exception as e:
+            print(f"Could not look at the response for {response.url}: {e}")
+
+    def _response_has_titles(self, response, titles):
+        """Whether the JSON of response names any of titles, i.e. it's the list's items."""
+        try:
+            pending = [response.json()]
+        except Exception:
+            return False
+        while pending:
+            value = pending.pop()
+            if isinstance(value, dict):
+                pending.extend(value.values())
+            elif isinstance(value, list):
+                pending.extend(value)
+            elif isinstance(value, str) and value.strip() in titles:
+                return True
+        return False
+
+    def _soft_refresh(self):
+        """Has the list page fetch its items again without reloading it, returns whether it did."""
+        fetches = set(self._list_fetches or ())
+        if not fetches:
+            return False
+        titles = {title.strip() for title in self._rendered_titles()}
+        try:
+            with self._page.expect_response(
+                lambda response: response.request.method == "GET"
+                and urllib.parse.urlsplit(response.url).path in fetches,
+                timeout=self._timeout(SOFT_REFRESH_TIMEOUT),
+            ) as response_info:
+                # What the app sees when its tab is shown again
+                self._page.evaluate(
+                    "() => { document.dispatchEvent(new Event('visibilitychange'));"
+                    " window.dispatchEvent(new Event('focus')); }"
+                )
+        except PWTimeoutError:
+            return False
+        response = response_info.value
+        if titles and not self._response_has_titles(response, titles):
+            # Something else the page polls, e.g. notifications, the list may well be stale
+            path = urllib.parse.urlsplit(response.url).path
+            print(f"{path} doesn't have the list's items, not waiting for it again")
+            self._list_fetches.discard(path)
+            return False
+        # Give it a moment to render what it fetched, and start from the top like a reload would
+        self._sleep(1)
+        self._page.evaluate("() => window.scrollTo(0, 0)")
+        return True
+
+    def _refresh_list(self, allow_full_reload=True):
+        """Brings the list page up to date, reloading it in full only every full_reload_every times.
+
+        In between the page is asked to fetch its items again, which saves
+        loading all of Amazon's assets. If it doesn't, the page is reloaded
+        every time from then on. Without allow_full_reload the periodic full
+        reload is left for the next refresh that allows it.
+        """
+        if self._soft_refresh_works and (not allow_full_reload or self._soft_refreshes + 1 < self.full_reload_every):
+            fetches = set(self._list_fetches or ())
+            if self._soft_refresh():
+                self._soft_refreshes += 1
+                return
+            # Unless it just turned out to be waiting for the wrong fetch
+            if self._list_fetches and self._list_fetches == fetches:
+                print("The list page didn't fetch its items again when asked, reloading it instead from now on")
+                self._soft_refresh_works = False
+        self._page.reload(wait_until="domcontentloaded")
+        self._page.wait_for_selector('.list-header', timeout=self._timeout(WAIT_TIMEOUT))
+        self._soft_refreshes = 0
+
+    def _list_signature(self, titles):
+        return self._probe_signature(titles[:self.PROBE_ITEMS], len(titles), titles[-1] if titles else None)
+
+    def _probe_signature(self, top, count, last):
+        return f"{count}:" + hashlib.sha1("\n".join(top + [last or ""]).encode("utf-8")).hexdigest()
+
+    def _rendered_titles(self):
+        return self._page.evaluate(
+            "() => Array.from(document.querySelectorAll('.virtual-list .item-title'), el => el.innerText)"
+        )
+
+    def alexa_list_unchanged(self):
+        """Cheaply checks whether the list looks the same as after the last scrape.
+
+        Has the page fetch its items again without reloading it, and compares
+        the titles at the top of the list, its length and its last title, so
+        only edits in the middle of the list go unnoticed until the next full
+        scrape.
+        """
+        if self._last_signature is None:
+            return False
+
+        if self._page.url != self._list_url():
+            self._ensure_on_alexa_list()
+        else:
+            self._refresh_list(allow_full_reload=False)
+        try:
+            self._page.wait_for_selector('.virtual-list .item-title', timeout=self._timeout(5000))
+        except PWTimeoutError:
+            pass
+        top = self._rendered_titles()
+        # The list is virtual, its length comes from its height and its end from jumping there
+        count = self._page.evaluate(
+            "() => { const list = document.querySelector('.virtual-list');"
+            " const row = list && list.querySelector('.inner');"
+            " return row ? Math.round(list.offsetHeight / row.offsetHeight) : 0; }"
+        )
+        bottom = top
+        if count > len(top):
+            self._page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
+            self._sleep(1)
+            bottom = self._rendered_titles()
+            self._page.evaluate("() => window.scrollTo(0, 0)")
+            self._sleep(0.5)
+        signature = self._probe_signature(top[:self.PROBE_ITEMS], count, bottom[-1] if bottom else None)
+        # The page was just refreshed, a full scrape right after this can use it as is
+        self._page_fresh = True
+        return signature == self._last_signature
 
     def get_alexa_list(self, refresh: bool = True):
-        self._ensure_on_alexa_list(refresh)
-        time.sleep(5)
+        page_fresh = self._page_fresh
+        self._page_fresh = False
+        self._ensure_on_alexa_list(refresh and not page_fresh)
+        if not page_fresh:
+            self._sleep(5)
 
         found = []
         last_text = None
@@ -412,7 +814,7 @@ class AlexaShoppingList:
             last_text = texts[-1]
             print("Scrolling...")
             items[-1].scroll_into_view_if_needed()
-            time.sleep(1)
+            self._sleep(1)
 
         if not refresh:
             # Scroll back to top
@@ -426,13 +828,18 @@ class AlexaShoppingList:
                     break
                 first_text = t
                 self._page.mouse.wheel(0, -1000)
-                time.sleep(0.5)
+                self._sleep(0.5)
 
+        self._last_signature = self._list_signature(found)
         return found
 
     def _get_alexa_list_item_element(self, item: str):
+        # The page is about to change, the next scrape has to refresh it
+        self._page_fresh = False
         self._ensure_on_alexa_list(False)
-        time.sleep(5)
+        # A scrape with refresh leaves the page at the bottom of the list
+        self._page.evaluate("() => window.scrollTo(0, 0)")
+        self._sleep(5)
 
         last_text = None
         while True:
@@ -447,21 +854,24 @@ class AlexaShoppingList:
                 return None
             last_text = texts[-1]
             containers[-1].scroll_into_view_if_needed()
-            time.sleep(1)
+            self._sleep(1)
+
+    # The mutations return the list as it is afterwards, or with scrape=False
+    # just whether they found what to change, without the scrape
 
-    def add_alexa_list_item(self, item: str):
+    def add_alexa_list_item(self, item: str, scrape: bool = True):
         if self._get_alexa_list_item_element(item) is not None:
-            return self.get_alexa_list(False)
+            return self.get_alexa_list(False) if scrape else True
 
         self._page.locator('.list-header .add-symbol').click()
         self._page.locator('.list-header .input-box input').fill(item)
         self._page.locator('.list-header .add-to-list button').click()
         self._page.locator('.list-header .cancel-input').click()
-        time.sleep(1)
+        self._sleep(1)
 
-        return self.get_alexa_list(False)
+        return self.get_alexa_list(False) if scrape else True
 
-    def update_alexa_list_item(self, old: str, new: str):
+    def update_alexa_list_item(self, old: str, new: str, scrape: bool = True):
         element = self._get_alexa_list_item_element(old)
         if element is None:
             return None
@@ -470,16 +880,16 @@ class AlexaShoppingList:
         field = element.locator('.input-box input')
         field.fill(new)
         element.locator('.item-actions-2 button').click()
-        time.sleep(1)
+        self._sleep(1)
 
-        return self.get_alexa_list(False)
+        return self.get_alexa_list(False) if scrape else True
 
-    def remove_alexa_list_item(self, item: str):
+    def remove_alexa_list_item(self, item: str, scrape: bool = True):
         element = self._get_alexa_list_item_element(item)
         if element is None:
             return None
 
         element.locator('.item-actions-2 button').click()
-        time.sleep(1)
+        self._sleep(1)
 
-        return self.get_alexa_list(False)
+        return self.get_alexa_list(False) if scrape else True
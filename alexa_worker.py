@@ -0,0 +1,268 @@
+import importlib
+import logging
+import multiprocessing
+import pickle
+import traceback
+
+from deadline import Deadline
+from driver_stats import DRIVER_CALLS
+from driver_stats import DRIVER_SECONDS
+from driver_stats import DRIVER_SLEEP_SECONDS
+from metrics import REGISTRY
+
+
+WORKER_RESTARTS = REGISTRY.counter(
+    "alexa2anylist_alexa_worker_starts_total",
+    "Alexa browser worker processes started, by why.",
+)
+
+
+class AlexaWorkerError(Exception):
+    pass
+
+
+def _load_driver(path):
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _worker_main(conn, driver_path, args, kwargs):
+    """Runs in the worker process: owns the browser and answers calls until told to stop."""
+    try:
+        driver = _load_driver(driver_path)(*args, **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        conn.send(("error", _picklable(e), None))
+        return
+    conn.send(("ok", None, driver.is_authenticated))
+
+    while True:
+        try:
+            method, call_args, call_kwargs = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            if method == "_getattr":
+                result = getattr(driver, call_args[0], None)
+            elif method == "set_deadline":
+                seconds = call_args[0]
+                result = driver.set_deadline(None if seconds is None else Deadline(seconds))
+            else:
+                result = getattr(driver, method)(*call_args, **call_kwargs)
+            conn.send(("ok", result, driver.is_authenticated))
+        except Exception as e:
+            traceback.print_exc()
+            conn.send(("error", _picklable(e), driver.is_authenticated))
+
+        if method == "_clear_driver":
+            break
+
+
+def _picklable(error):
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return AlexaWorkerError(f"{type(error).__name__}: {error}")
+
+
+class AlexaWorkerClient:
+    """Runs AlexaShoppingList in a separate process and forwards calls to it.
+
+    A browser that crashes or hangs then only takes the worker down: a call
+    that doesn't get an answer in time kills the worker and raises, and the next
+    call starts a new one. The Synchronizer, the Anylist client and the server
+    loop keep their state either way.
+    """
+
+    # How long a call may take when there is no deadline, the login can wait minutes for a puzzle
+    CALL_TIMEOUT = 600
+    # Extra time past the deadline before the worker is considered stuck
+    DEADLINE_GRACE = 30
+    # Bookkeeping that has to work past the deadline too, e.g. to report a cycle that ran out of time
+    UNTIMED_CALLS = ("_getattr", "set_deadline", "start_cycle", "finish_cycle")
+
+    def __init__(self, *args, driver="alexa:AlexaShoppingList", **kwargs):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self._driver = driver
+        self._args = args
+        self._kwargs = kwargs
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._deadline = None
+        self._aborted = False
+        self.is_authenticated = False
+        self._start("initial")
+
+    # ============================================================
+    # Worker process
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    def _start(self, reason):
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self._driver, self._args, self._kwargs),
+            name="alexa-worker",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        WORKER_RESTARTS.inc(reason=reason)
+        self.log.info(f"Started Alexa worker {self._process.pid} ({reason})")
+        self._receive("startup", self.CALL_TIMEOUT)
+
+    def _kill(self):
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join(timeout=5)
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def abort(self):
+        """Kills the worker from another thread, the call waiting on it fails and the next one starts a new one."""
+        process = self._process
+        if process is not None and process.is_alive():
+            self._aborted = True
+            process.kill()
+
+    def _timeout(self):
+        if self._deadline is None:
+            return self.CALL_TIMEOUT
+        return max(0, self._deadline.remaining()) + self.DEADLINE_GRACE
+
+    def _receive(self, method, timeout):
+        try:
+            if not self._conn.poll(timeout):
+                pid = self._process.pid
+                self._kill()
+                raise AlexaWorkerError(f"Alexa worker {pid} hung in {method} for {timeout:.0f}s and was killed")
+            status, result, is_authenticated = self._conn.recv()
+        except (EOFError, OSError):
+            exitcode = self._process.exitcode if self._process is not None else None
+            pid = self._process.pid if self._process is not None else None
+            self._kill()
+            if self._aborted:
+                self._aborted = False
+                raise AlexaWorkerError(f"Alexa worker {pid} was killed in {method}, the cycle was stuck")
+            raise AlexaWorkerError(f"Alexa worker crashed in {method} (exit code {exitcode})")
+
+        if is_authenticated is not None:
+            self.is_authenticated = is_authenticated
+        if status == "error":
+            raise result
+        return result
+
+    def _call(self, method, *args, **kwargs):
+        return self._request(method, args, kwargs, None)
+
+    def _request(self, method, args, kwargs, timeout):
+        if self._deadline is not None and method not in self.UNTIMED_CALLS:
+            # Checked here, a worker told it has no time left would fail its calls the same way
+            self._deadline.check(f"Alexa {method}")
+        if self._process is None or not self._process.is_alive():
+            if self._process is not None:
+                self.log.warning(f"Alexa worker {self._process.pid} is gone (exit code {self._process.exitcode})")
+                self._kill()
+            self._start("restart")
+            if self._deadline is not None:
+                # A new worker doesn't know about the cycle it's joining
+                self._send_deadline()
+        try:
+            self._conn.send((method, args, kwargs))
+        except (BrokenPipeError, OSError):
+            self._kill()
+            raise AlexaWorkerError(f"Alexa worker crashed before {method}")
+        return self._receive(method, self._timeout() if timeout is None else timeout)
+
+    # ============================================================
+    # AlexaShoppingList API
+
+    def login(self, email, password):
+        return self._call("login", email, password)
+
+    def login_requires_mfa(self):
+        return self._call("login_requires_mfa")
+
+    def submit_mfa(self, code):
+        return self._call("submit_mfa", code)
+
+    def requires_login(self):
+        return self._call("requires_login")
+
+    def get_alexa_list(self, refresh=True):
+        return self._call("get_alexa_list", refresh)
+
+    def alexa_list_unchanged(self):
+        return self._call("alexa_list_unchanged")
+
+    def add_alexa_list_item(self, item, scrape=True):
+        return self._call("add_alexa_list_item", item, scrape=scrape)
+
+    def update_alexa_list_item(self, old, new, scrape=True):
+        return self._call("update_alexa_list_item", old, new, scrape=scrape)
+
+    def remove_alexa_list_item(self, item, scrape=True):
+        return self._call("remove_alexa_list_item", item, scrape=scrape)
+
+    def get_screenshot(self, caption=None):
+        return self._call("get_screenshot", caption)
+
+    def reload_list(self):
+        return self._call("reload_list")
+
+    def recreate_context(self):
+        return self._call("recreate_context")
+
+    def wait_for_changes(self, seconds):
+        # Outside of sync cycles, so it gets the time it waits plus the usual allowance
+        return self._request("wait_for_changes", (seconds,), {}, seconds + self.CALL_TIMEOUT)
+
+    def start_cycle(self):
+        return self._call("start_cycle")
+
+    def finish_cycle(self, failed=False):
+        self._call("finish_cycle", failed=failed)
+        # The worker counted its calls in its own registry, add them to ours
+        summary = self.last_cycle_stats
+        for call in (summary or {}).get("by_call", []):
+            DRIVER_CALLS.inc(call["count"], caller=call["caller"], method=call["method"])
+            DRIVER_SECONDS.inc(call["seconds"], caller=call["caller"], method=call["method"])
+        for sleep in (summary or {}).get("by_sleep", []):
+            DRIVER_SLEEP_SECONDS.inc(sleep["seconds"], caller=sleep["caller"])
+
+    @property
+    def last_cycle_stats(self):
+        return self._call("_getattr", "last_cycle_stats")
+
+    def set_deadline(self, deadline):
+        self._deadline = deadline
+        return self._send_deadline()
+
+    def _send_deadline(self):
+        # Only the time left goes across, the worker has its own clock. Once it's
+        # all gone the calls fail here instead, see _request
+        seconds = None if self._deadline is None else self._deadline.remaining()
+        return self._call("set_deadline", seconds if seconds is not None and seconds > 0 else None)
+
+    def _clear_driver(self):
+        if self._process is None:
+            return
+        try:
+            if self._process.is_alive():
+                self._conn.send(("_clear_driver", (), {}))
+                self._receive("_clear_driver", self.CALL_TIMEOUT if self._deadline is None else self._timeout())
+        except Exception as e:
+            self.log.warning(f"Alexa worker didn't shut down cleanly: {e}")
+        finally:
+            self._kill()
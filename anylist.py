@@ -1,3 +1,4 @@
+import base64
 import os
 import uuid
 import requests
@@ -23,13 +24,19 @@ class AnyList:
     CREDENTIALS_LAST_UPDATED = 'lastUpdated'
     CREDENTIALS_LAST_UPDATED_METHOD = 'lastUpdatedMethod'
     ANYLIST_API = 'www.anylist.com'
+    # Cached access tokens this close to expiring are refreshed before they're used
+    TOKEN_EXPIRY_MARGIN = 60
+    # Seconds before giving up on a request, less if the sync cycle's deadline is closer
+    REQUEST_TIMEOUT = 30
 
-    def __init__(self, email, password, credential_cache = None):
+    def __init__(self, email, password, credential_cache = None, api_url = None):
         self.log = logging.getLogger(__name__)
         self.log.setLevel(logging.DEBUG)
         self.email = email
         self.password = password
         self.credentials_cache = credential_cache
+        # Point api_url at e.g. http://127.0.0.1:8080 to talk to a local stand-in server
+        self.api_url = (api_url or f'https://{AnyList.ANYLIST_API}').rstrip('/')
         self.client_id = uuid.uuid4().hex
         self.access_token = None
         self.refresh_token = None
@@ -41,6 +48,13 @@ class AnyList:
         self._ws_thread = None
         self.ws_connected = False
         self._state_lock = threading.RLock()
+        # Bumped for every change the websocket tells us about; the cached lists
+        # are current while they were fetched at the latest generation
+        self.generation = 0
+        self._fetched_generation = None
+        # The current sync cycle's deadline and the thread running it, see set_deadline
+        self.deadline = None
+        self._deadline_thread = None
 
     def _sanitize_response_text(self, text, max_length=240):
         sanitized = (text or '').replace('\n', ' ').replace('\r', ' ').strip()
@@ -54,8 +68,12 @@ class AnyList:
             json.dump(payload, file)
 
     def login(self):
-        if not self._load_credentials():
+        if not self._load_credentials() or not self.refresh_token:
             self._fetch_tokens()
+        elif self._token_expires_soon(self.access_token):
+            # Cheaper than a password login, and falls back to one if the refresh token is no good
+            self.log.info("Cached access token has expired, refreshing it")
+            self._refresh_tokens(reconnect_websocket=False)
         self._setup_websocket()
         self._get_user_data()
         self.get_lists()
@@ -101,13 +119,29 @@ class AnyList:
 
         return True
 
+    def _token_expiry(self, token):
+        """The exp claim of a JWT access token, None if the token isn't one."""
+        try:
+            payload = token.split('.')[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            return float(claims['exp'])
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def _token_expires_soon(self, token):
+        if not token:
+            return True
+        expiry = self._token_expiry(token)
+        # Tokens we can't read are tried as they are, _post refreshes them if they're rejected
+        return expiry is not None and expiry - time.time() < AnyList.TOKEN_EXPIRY_MARGIN
+
     def _fetch_tokens(self):
-        response = requests.post(f'https://{AnyList.ANYLIST_API}/auth/token', data={
+        response = requests.post(f'{self.api_url}/auth/token', data={
             'email': self.email,
             'password': self.password,
         }, headers = {
             'X-AnyLeaf-API-Version': '3',
-        })
+        }, timeout = self._request_timeout())
         if response.status_code != 200:
             raise Exception(f"Failed to fetch tokens: {self._sanitize_response_text(response.text)}")
 
@@ -117,12 +151,12 @@ class AnyList:
         self._save_credentials(method = 'fetch')
         self.log.info("Fetched tokens")
 
-    def _refresh_tokens(self):
-        response = requests.post(f'https://{AnyList.ANYLIST_API}/auth/token/refresh', data={
+    def _refresh_tokens(self, reconnect_websocket=True):
+        response = requests.post(f'{self.api_url}/auth/token/refresh', data={
             'refresh_token': self.refresh_token,
         }, headers = {
             'X-AnyLeaf-API-Version': '3',
-        })
+        }, timeout = self._request_timeout())
 
         if response.status_code != 200:
             self.log.warning(f"Failed to refresh tokens: {self._sanitize_response_text(response.text)}")
@@ -134,7 +168,23 @@ class AnyList:
         self.refresh_token = result['refresh_token']
         self._save_credentials(method = 'refresh')
         self.log.info("Refreshed tokens")
-        self._setup_websocket(force_reconnect=True)
+        if reconnect_websocket:
+            self._setup_websocket(force_reconnect=True)
+
+    def _bump_generation(self):
+        with self._state_lock:
+            self.generation += 1
+
+    def lists_are_current(self):
+        with self._state_lock:
+            return bool(self.lists) and self.ws_connected and self._fetched_generation == self.generation
+
+    def _websocket_url(self):
+        if self.api_url.startswith('https://'):
+            return 'wss://' + self.api_url[len('https://'):]
+        if self.api_url.startswith('http://'):
+            return 'ws://' + self.api_url[len('http://'):]
+        return self.api_url
 
     def _close_websocket(self):
         with self._state_lock:
@@ -143,6 +193,7 @@ class AnyList:
             self.ws = None
             self._ws_thread = None
             self.ws_connected = False
+            self._fetched_generation = None
 
         if ws is not None:
             try:
@@ -170,17 +221,20 @@ class AnyList:
             self.log.debug(f"Received message: {message}")
             if (message == 'refresh-shopping-lists'):
                 self.log.debug('Refreshing shopping lists')
+                self._bump_generation()
                 self.get_lists(refresh_cache=True)
 
         def on_error(ws, error):
             self.log.error(f"WebSocket error: {error}")
             with self._state_lock:
                 self.ws_connected = False
+                self._fetched_generation = None
             self._refresh_tokens()
 
         def on_close(ws, close_status_code, close_msg):
             with self._state_lock:
                 self.ws_connected = False
+                self._fetched_generation = None
             if close_status_code or close_msg:
                 self.log.info(f"WebSocket closed: {close_status_code} {close_msg}")
             else:
@@ -189,6 +243,8 @@ class AnyList:
         def on_open(ws):
             with self._state_lock:
                 self.ws_connected = True
+                # We may have missed changes while we weren't listening
+                self._fetched_generation = None
             self.log.info("WebSocket connection opened")
 
             # def send_heartbeat():
@@ -212,7 +268,7 @@ class AnyList:
         #     self.log.debug(f"Received pong: {data}")
 
         ws = websocket.WebSocketApp(
-            f'wss://{AnyList.ANYLIST_API}/data/add-user-listener',
+            f'{self._websocket_url()}/data/add-user-listener',
             header={
                 'Authorization': f'Bearer {self.access_token}',
                 'X-AnyLeaf-Client-Identifier': self.client_id,
@@ -234,6 +290,26 @@ class AnyList:
             self._ws_thread = ws_thread
         ws_thread.start()
 
+    def set_deadline(self, deadline):
+        """Called by the server around each sync cycle, None once it's done.
+
+        Only requests made from the thread that set it are held to it, the
+        websocket thread's own requests aren't part of the cycle.
+        """
+        self.deadline = deadline
+        self._deadline_thread = threading.get_ident()
+
+    def _cycle_deadline(self):
+        if self._deadline_thread != threading.get_ident():
+            return None
+        return self.deadline
+
+    def _request_timeout(self):
+        deadline = self._cycle_deadline()
+        if deadline is None:
+            return AnyList.REQUEST_TIMEOUT
+        return deadline.timeout(AnyList.REQUEST_TIMEOUT, "AnyList request")
+
     def teardown(self):
         self._close_websocket()
 
@@ -246,16 +322,17 @@ class AnyList:
             } | headers
 
             if files:
-                return requests.post(f'https://{AnyList.ANYLIST_API}{path}', files=files, headers=request_headers)
+                return requests.post(f'{self.api_url}{path}', files=files, headers=request_headers, timeout=self._request_timeout())
 
-            return requests.post(f'https://{AnyList.ANYLIST_API}{path}', data=data, headers=request_headers)
+            return requests.post(f'{self.api_url}{path}', data=data, headers=request_headers, timeout=self._request_timeout())
 
         response = _request()
         if response.status_code != 200:
             self.log.warning(f"Failed to send request, will retry: {self._sanitize_response_text(response.text)}")
             # Try refreshing the tokens and try again
             self._refresh_tokens()
-            time.sleep(5)
+            deadline = self._cycle_deadline()
+            time.sleep(5 if deadline is None else deadline.timeout(5, f"AnyList {path}"))
             response = _request()
             if response.status_code != 200:
                 raise Exception(f"Failed to send request: {self._sanitize_response_text(response.text)}")
@@ -268,6 +345,8 @@ class AnyList:
             if self._user_data and not refresh_cache:
                 return self._user_data
 
+        with self._state_lock:
+            generation = self.generation
         response = self._post('/data/user-data/get')
 
         user_data = pcov_pb2.PBUserDataResponse()
@@ -275,6 +354,7 @@ class AnyList:
         with self._state_lock:
             self._user_data = user_data
             self.last_updated = time.time()
+            self._fetched_generation = generation
             return self._user_data
 
     def get_lists(self, refresh_cache=False):
@@ -284,7 +364,20 @@ class AnyList:
 
         self._get_user_data(refresh_cache)
         with self._state_lock:
-            self.lists = [List(self, l) for l in self._user_data.shoppingListsResponse.newLists]
+            # Update the lists we already have in place, so anyone holding on
+            # to them sees the changes and only new items get allocated
+            existing = {lst.identifier: lst for lst in self.lists}
+            lists = []
+            for list_data in self._user_data.shoppingListsResponse.newLists:
+                lst = existing.get(list_data.identifier)
+                if lst is None:
+                    lst = List(self, list_data)
+                else:
+                    delta = lst._merge(list_data)
+                    if delta:
+                        self.log.debug(f"Refreshed {lst}: {delta}")
+                lists.append(lst)
+            self.lists = lists
             return self.lists
 
     def get_list_by_id(self, identifier):
@@ -299,6 +392,20 @@ class AnyList:
         return self.recent_items.get(list_id, [])
 
 
+class ListDelta:
+
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+    def __repr__(self) -> str:
+        return f"ListDelta({len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed)"
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
 class List:
 
     def __init__(self, api, list_data):
@@ -310,6 +417,31 @@ class List:
         self.name = list_data.name
         self.items = [Item(self, i) for i in list_data.items]
         self.creator = list_data.creator
+        # What the last refresh changed, see _merge
+        self.last_delta = ListDelta(added=self.items[:])
+
+    def _merge(self, list_data):
+        self._pb = list_data
+        self.name = list_data.name
+        self.creator = list_data.creator
+
+        current = {item.identifier: item for item in self.items}
+        items = []
+        added = []
+        changed = []
+        for item_data in list_data.items:
+            item = current.pop(item_data.identifier, None)
+            if item is None:
+                item = Item(self, item_data)
+                added.append(item)
+            elif item._merge(item_data):
+                changed.append(item)
+            items.append(item)
+
+        # Swap the items in one go, so anyone iterating over them isn't affected
+        self.items = items
+        self.last_delta = ListDelta(added, list(current.values()), changed)
+        return self.last_delta
 
     def __repr__(self) -> str:
         return f"List('{self.name}', {len(self.items)} items, {self.identifier})"
@@ -337,6 +469,13 @@ class List:
         })
 
     def refresh(self):
+        # While the websocket is connected it tells us about every change, so
+        # if it didn't since the last download the cached list is current
+        if self._api.lists_are_current():
+            cached = self._api.get_list_by_id(self.identifier)
+            if cached is not None:
+                return cached
+
         self._api.get_lists(refresh_cache=True)
         refreshed = self._api.get_list_by_id(self.identifier)
         if refreshed is None:
@@ -471,6 +610,18 @@ class Item:
         'manualSortIndex': 'set-list-item-sort-order',
     }
 
+    MERGE_FIELDS = (
+        'listId',
+        'name',
+        'quantity',
+        'details',
+        'checked',
+        'category',
+        'userId',
+        'categoryMatchId',
+        'manualSortIndex',
+    )
+
     def __init__(self, lst, item_data):
         self.log = logging.getLogger(__name__)
         self.log.setLevel(logging.DEBUG)
@@ -490,6 +641,21 @@ class Item:
         self._fieldsToUpdate = []
         self._original_values = {}
 
+    def _merge(self, item_data):
+        changed = False
+        for field in Item.MERGE_FIELDS:
+            # Leave fields alone that we've changed locally but not saved yet
+            if field in self._fieldsToUpdate:
+                continue
+            value = getattr(item_data, field)
+            if field == 'listId':
+                value = value or self._listId
+            if getattr(self, f'_{field}') != value:
+                setattr(self, f'_{field}', value)
+                changed = True
+        self._pb = item_data
+        return changed
+
     def _track_update(self, field, current_value):
         if field not in self._original_values:
             self._original_values[field] = current_value
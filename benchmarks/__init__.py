@@ -0,0 +1 @@
+"""Benchmarks for alexa2anylist."""
@@ -0,0 +1,139 @@
+"""Benchmarks the Alexa browser driver against the local fixture page.
+
+Measures a full scrape (get_alexa_list), finding the last item on the list and
+adding, renaming and removing an item, at a few list sizes:
+
+    python -m benchmarks.bench_alexa_driver --sizes 10 100 1000 --repeat 3
+
+Needs cloakbrowser, same as the server. alexa.py waits with fixed sleeps
+between steps, those are counted separately and can be scaled down with
+--sleep-scale to see what the browser work itself costs. Scaled down sleeps
+can be too short for the page to catch up, so every scrape is checked against
+the fixture and mismatches are reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import alexa
+from alexa import AlexaShoppingList
+from tests.fake_alexa_server import FakeAlexaServer
+
+
+OPERATIONS = ("scrape", "lookup", "add", "rename", "remove")
+
+
+class ScaledTime:
+    """Stands in for the time module in alexa.py, to meter and scale its sleeps."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.requested = 0.0
+
+    def sleep(self, seconds):
+        self.requested += seconds
+        time.sleep(seconds * self.scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def _measure(clock, func):
+    requested = clock.requested
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    slept = (clock.requested - requested) * clock.scale
+    return result, {"wall": elapsed, "slept": slept, "work": elapsed - slept}
+
+
+def bench_size(driver, server, clock, size, repeat):
+    names = [f"Item {i:04d}" for i in range(size)]
+    samples = {op: [] for op in OPERATIONS}
+    mismatches = 0
+
+    for _ in range(repeat):
+        server.set_items(names)
+
+        found, sample = _measure(clock, lambda: driver.get_alexa_list(refresh=True))
+        samples["scrape"].append(sample)
+        if found != server.items():
+            mismatches += 1
+
+        _, sample = _measure(clock, lambda: driver._get_alexa_list_item_element(names[-1]))
+        samples["lookup"].append(sample)
+
+        for op, func in (
+            ("add", lambda: driver.add_alexa_list_item("Benchmark item")),
+            ("rename", lambda: driver.update_alexa_list_item("Benchmark item", "Benchmark renamed")),
+            ("remove", lambda: driver.remove_alexa_list_item("Benchmark renamed")),
+        ):
+            _, sample = _measure(clock, func)
+            samples[op].append(sample)
+        if server.items() != names:
+            mismatches += 1
+
+    result = {"size": size, "repeat": repeat, "mismatches": mismatches}
+    for op, op_samples in samples.items():
+        result[op] = {
+            key: statistics.median(sample[key] for sample in op_samples)
+            for key in ("wall", "slept", "work")
+        }
+    return result
+
+
+def print_results(results):
+    print(f"{'size':>6}  {'operation':<8} {'wall s':>8} {'slept s':>8} {'work s':>8}")
+    for result in results:
+        for op in OPERATIONS:
+            timing = result[op]
+            print(f"{result['size']:>6}  {op:<8} {timing['wall']:>8.3f} {timing['slept']:>8.3f} {timing['work']:>8.3f}")
+        if result["mismatches"]:
+            print(f"{result['size']:>6}  WARNING: {result['mismatches']} runs didn't match the fixture")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sleep-scale", type=float, default=1.0, help="multiplier for the driver's fixed sleeps")
+    parser.add_argument("--render-delay", type=float, default=0.05, help="seconds the page takes to re-render")
+    parser.add_argument("--network-delay", type=float, default=0.1, help="seconds added to every API call")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the driver's output")
+    args = parser.parse_args(argv)
+
+    clock = ScaledTime(args.sleep_scale)
+    results = []
+    with FakeAlexaServer(render_delay=args.render_delay, network_delay=args.network_delay) as server, \
+            tempfile.TemporaryDirectory() as cookies_path, \
+            patch.object(alexa, "time", clock):
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            driver = AlexaShoppingList(cookies_path=cookies_path, base_url=server.url)
+        try:
+            for size in args.sizes:
+                with output:
+                    results.append(bench_size(driver, server, clock, size, args.repeat))
+                print(f"Finished {size} items", file=sys.stderr)
+        finally:
+            with output:
+                driver._clear_driver()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
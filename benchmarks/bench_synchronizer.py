@@ -0,0 +1,330 @@
+"""Benchmarks the Synchronizer against in-memory Anylist and Alexa lists.
+
+For each list size a synthetic list is generated, the Synchronizer is started
+in sync, then a mix of changes is made on both sides (adds, checks, renames and
+deletes on Anylist, adds, deletes and renames by voice on Alexa) and one cycle
+is run phase by phase. A second scenario starts with Alexa out of sync to time
+the clobber. Each phase reports its time, its peak memory (measured in a
+separate run under tracemalloc) and how many backend calls it made.
+
+    python -m benchmarks.bench_synchronizer --sizes 10 100 1000 10000
+    python -m benchmarks.bench_synchronizer --json before.json
+    python -m benchmarks.bench_synchronizer --json after.json --compare before.json
+
+The workloads are seeded, so runs on different commits do the same work and
+--compare shows how each phase moved.
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+from synchronizer import Synchronizer  # noqa: E402
+
+
+PHASES = {
+    "cycle": ("_are_lists_equal", "_prepare_transaction", "_commit_transaction"),
+    "clobber": ("_are_lists_equal", "_clobber_alexa"),
+    "idle": ("_are_lists_equal",),
+}
+
+
+class BenchItem:
+    def __init__(self, identifier, name, checked=False):
+        self.identifier = identifier
+        self.name = name
+        self.checked = checked
+
+
+class BenchAnyList:
+    """Stands in for both AnyList and its List, with dict lookups so it doesn't skew the numbers."""
+
+    def __init__(self, names, identifier="bench-list"):
+        self.identifier = identifier
+        self.calls = collections.Counter()
+        self._ids = itertools.count()
+        self.items = [BenchItem(f"id-{next(self._ids)}", name) for name in names]
+        self._by_id = {item.identifier: item for item in self.items}
+
+    def refresh(self):
+        self.calls["refresh"] += 1
+        return self
+
+    def __iter__(self):
+        yield from self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item.identifier in self._by_id
+
+    def get_item_by_id(self, identifier):
+        return self._by_id.get(identifier)
+
+    def get_item_by_name(self, name):
+        return next((item for item in self.items if item.name == name), None)
+
+    def add_item(self, name):
+        item = BenchItem(f"id-{next(self._ids)}", name)
+        self.items.append(item)
+        self._by_id[item.identifier] = item
+        return item
+
+    def delete_item(self, item):
+        self.items.remove(item)
+        del self._by_id[item.identifier]
+
+    def add_or_uncheck_item(self, name):
+        self.calls["add_or_uncheck_item"] += 1
+        item = self.get_item_by_name(name)
+        if item is None:
+            self.add_item(name)
+        else:
+            item.checked = False
+
+    def check_item(self, name):
+        self.calls["check_item"] += 1
+        self.get_item_by_name(name).checked = True
+
+
+class BenchAlexa:
+    """Stands in for AlexaShoppingList. Like the driver, every change returns the whole list."""
+
+    def __init__(self, names):
+        self.items = list(names)
+        self.calls = collections.Counter()
+
+    def get_alexa_list(self, refresh=True):
+        self.calls["get_alexa_list"] += 1
+        return self.items[:]
+
+    def add_alexa_list_item(self, item):
+        self.calls["add_alexa_list_item"] += 1
+        self.items.insert(0, item)
+        return self.items[:]
+
+    def remove_alexa_list_item(self, item):
+        self.calls["remove_alexa_list_item"] += 1
+        self.items.remove(item)
+        return self.items[:]
+
+    def update_alexa_list_item(self, old, new):
+        self.calls["update_alexa_list_item"] += 1
+        self.items[self.items.index(old)] = new
+        return self.items[:]
+
+
+def make_names(rng, count, prefix="item"):
+    return [f"{prefix} {rng.randrange(16 ** 6):06x} {i}" for i in range(count)]
+
+
+def apply_changes(rng, anylist, alexa, count):
+    """Makes count changes, spread over both sides, like users would between two cycles.
+
+    Every change touches a different item, conflicting changes are a different
+    workload.
+    """
+    kinds = ("anylist_add", "anylist_check", "anylist_rename", "anylist_delete",
+             "alexa_add", "alexa_delete", "alexa_rename")
+    made = collections.Counter()
+    new_names = iter(make_names(rng, count, prefix="new"))
+    untouched = [item for item in anylist.items if not item.checked and item.name in set(alexa.items)]
+    rng.shuffle(untouched)
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        if kind == "anylist_add":
+            anylist.add_item(next(new_names))
+        elif kind == "alexa_add":
+            alexa.items.insert(0, next(new_names))
+        elif not untouched:
+            continue
+        else:
+            item = untouched.pop()
+            if kind == "anylist_check":
+                item.checked = True
+            elif kind == "anylist_rename":
+                item.name = item.name + " x"
+            elif kind == "anylist_delete":
+                anylist.delete_item(item)
+            elif kind == "alexa_delete":
+                alexa.items.remove(item.name)
+            elif kind == "alexa_rename":
+                alexa.items[alexa.items.index(item.name)] = item.name + " y"
+        made[kind] += 1
+    return made
+
+
+def build(scenario, size, changes, seed, journal_file=None):
+    rng = random.Random(f"{seed}-{scenario}-{size}")
+    names = make_names(rng, size)
+    anylist = BenchAnyList(names)
+    alexa = BenchAlexa(names)
+    syncer = Synchronizer(anylist, alexa, journal_file=journal_file)
+
+    # For a cycle these are changes since the baseline, for a clobber Alexa
+    # missed some changes and got some of its own without a baseline to go on
+    apply_changes(rng, anylist, alexa, changes)
+    # What Synchronizer.sync() starts with, it's not a phase of its own
+    syncer._anylist_list, syncer._alexa_list = syncer._get_fresh_lists()
+    for backend in (anylist, alexa):
+        backend.calls.clear()
+    return syncer, anylist, alexa
+
+
+def run_phases(scenario, syncer):
+    """Runs the scenario's phases in order, yielding each one with its time once it's done."""
+    for phase in PHASES[scenario]:
+        start = time.perf_counter()
+        if phase == "_are_lists_equal":
+            syncer._are_lists_equal(syncer._anylist_list, syncer._alexa_list)
+        else:
+            getattr(syncer, phase)()
+        yield phase, time.perf_counter() - start
+
+
+def bench(scenario, size, changes, seed, repeat, journal_file=None):
+    times = collections.defaultdict(list)
+    calls = {}
+    in_sync = True
+    for _ in range(repeat):
+        syncer, anylist, alexa = build(scenario, size, changes, seed, journal_file)
+        before = anylist.calls + alexa.calls
+        for phase, elapsed in run_phases(scenario, syncer):
+            times[phase].append(elapsed)
+            after = anylist.calls + alexa.calls
+            calls[phase] = dict(after - before)
+            before = after
+        in_sync = in_sync and syncer._are_lists_equal(anylist, alexa.items)
+
+    # Memory in a separate run, tracemalloc slows everything down
+    peaks = {}
+    syncer, _, _ = build(scenario, size, changes, seed, journal_file)
+    tracemalloc.start()
+    try:
+        phases = run_phases(scenario, syncer)
+        while True:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            try:
+                phase, _ = next(phases)
+            except StopIteration:
+                break
+            peaks[phase] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return [
+        {
+            "scenario": scenario,
+            "size": size,
+            "changes": changes,
+            "phase": phase,
+            "time_s": statistics.median(times[phase]),
+            "min_time_s": min(times[phase]),
+            "peak_kib": round(peaks.get(phase, 0) / 1024, 1),
+            "calls": calls.get(phase, {}),
+            "in_sync": in_sync,
+        }
+        for phase in PHASES[scenario]
+    ]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result):
+    return (result["scenario"], result["size"], result["changes"], result["phase"])
+
+
+def print_results(results, compare=None):
+    previous = {_key(result): result for result in (compare or [])}
+    header = f"{'scenario':<8} {'size':>6} {'chg':>5} {'phase':<21} {'time ms':>10} {'peak KiB':>10} {'calls':>6}"
+    if previous:
+        header += f" {'vs base':>8}"
+    print(header)
+    for result in results:
+        line = (
+            f"{result['scenario']:<8} {result['size']:>6} {result['changes']:>5} {result['phase']:<21} "
+            f"{result['time_s'] * 1000:>10.2f} {result['peak_kib']:>10.1f} {sum(result['calls'].values()):>6}"
+        )
+        base = previous.get(_key(result))
+        if base and base["time_s"]:
+            line += f" {result['time_s'] / base['time_s']:>7.2f}x"
+        print(line)
+        if not result["in_sync"] and result["phase"] == PHASES[result["scenario"]][-1]:
+            print(f"{result['scenario']:<8} {result['size']:>6} WARNING: lists not in sync after the cycle")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(PHASES), default=["idle", "cycle", "clobber"])
+    parser.add_argument("--change-ratio", type=float, default=0.05,
+                        help="changes per cycle as a fraction of the list size (at least 7, one of each kind)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", default="alexa2anylist")
+    parser.add_argument("--journal", action="store_true",
+                        help="write the journal and baseline to disk like the server does")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    # The sync engine logs every list it sees, keep that out of the output
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    with tempfile.TemporaryDirectory() as config_path, patch.dict(os.environ, {"CONFIG_PATH": config_path}):
+        for scenario in args.scenarios:
+            for size in args.sizes:
+                changes = 0 if scenario == "idle" else max(7, int(size * args.change_ratio))
+                journal_file = "bench-journal.json" if args.journal else None
+                results.extend(bench(scenario, size, changes, args.seed, args.repeat, journal_file))
+                print(f"Finished {scenario} with {size} items", file=sys.stderr)
+
+    compare = None
+    if args.compare:
+        with open(args.compare) as f:
+            compare = json.load(f)["results"]
+    print_results(results, compare)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "time": time.time(),
+                "args": vars(args),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
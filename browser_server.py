@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def _default_executable():
+    # The same patched Chromium AlexaShoppingList launches, downloaded on first use
+    from cloakbrowser.download import ensure_binary
+
+    return ensure_binary()
+
+
+def browser_command(executable, port=9222, user_data_dir=None, headless=True):
+    """The command line for a Chromium that takes CDP connections on localhost:port."""
+    command = [
+        executable,
+        f"--remote-debugging-port={port}",
+        # CDP has no authentication, it must not be reachable from elsewhere
+        "--remote-debugging-address=127.0.0.1",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--window-size=1366,768",
+    ]
+    if user_data_dir:
+        command.append(f"--user-data-dir={user_data_dir}")
+    if headless:
+        command.append("--headless=new")
+    command.append("about:blank")
+    return command
+
+
+def wait_for_browser(port=9222, timeout=30):
+    """Waits for the browser on port to take connections, returns its CDP websocket URL."""
+    url = f"http://127.0.0.1:{port}/json/version"
+    expires_at = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                return json.load(response)["webSocketDebuggerUrl"]
+        except Exception as e:
+            if time.monotonic() >= expires_at:
+                raise Exception(f"Browser on port {port} didn't come up in {timeout}s: {e}")
+            time.sleep(0.2)
+
+
+def start_browser_server(port=9222, user_data_dir=None, executable=None, headless=True, timeout=30):
+    """Starts a long-lived browser for AlexaShoppingList to attach to, returns (process, endpoint).
+
+    Point alexa_browser_endpoint at http://127.0.0.1:{port} and the sync server
+    reuses this browser, and its session, across its own restarts.
+    """
+    executable = executable or os.environ.get("BROWSER_EXECUTABLE") or _default_executable()
+    if user_data_dir:
+        os.makedirs(user_data_dir, exist_ok=True)
+    process = subprocess.Popen(browser_command(executable, port, user_data_dir, headless))
+    try:
+        endpoint = wait_for_browser(port, timeout)
+    except Exception:
+        process.kill()
+        raise
+    logger.info(f"Browser {process.pid} is listening on {endpoint}")
+    return process, endpoint
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(module)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description="Run a browser for alexa2anylist to attach to over CDP")
+    parser.add_argument("--port", type=int, default=9222, help="Port to listen on, localhost only")
+    parser.add_argument("--user-data-dir", default=os.path.join(os.environ.get("CONFIG_PATH", "."), "browser-profile"),
+                        help="Browser profile to keep between runs")
+    parser.add_argument("--executable", help="Browser to run, defaults to $BROWSER_EXECUTABLE or CloakBrowser's Chromium")
+    parser.add_argument("--headed", action="store_true", help="Show the browser window")
+    args = parser.parse_args()
+
+    process, endpoint = start_browser_server(
+        port=args.port,
+        user_data_dir=args.user_data_dir,
+        executable=args.executable,
+        headless=not args.headed,
+    )
+    print(f"Set \"alexa_browser_endpoint\": \"http://127.0.0.1:{args.port}\" to use it")
+    try:
+        sys.exit(process.wait())
+    except KeyboardInterrupt:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,97 @@
+import gzip
+import os
+import queue
+import threading
+
+
+class CaptureWriter:
+    """Writes screenshots and page HTML from a background thread, keeping only the latest ones.
+
+    A capture is a PNG and the gzipped HTML of the page, sharing a name prefix.
+    Once there are more than max_files captures in out_dir, or they add up to more
+    than max_bytes, the oldest ones are deleted. If captures come in faster than
+    they can be written the extra ones are dropped instead of blocking the caller.
+    """
+
+    SUFFIXES = ("_screenshot.png", "_content.html.gz", "_content.html")
+
+    def __init__(self, out_dir, max_files=50, max_bytes=100 * 1024 * 1024, max_pending=8):
+        self.out_dir = out_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prefix, png, html):
+        """Queues a capture to be written, returns the path the PNG will be written to or None if it was dropped."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((prefix, png, html))
+        except queue.Full:
+            print(f"Dropped capture {prefix}, too many waiting to be written")
+            return None
+        return os.path.join(self.out_dir, f"{prefix}_screenshot.png")
+
+    def flush(self):
+        """Waits until everything submitted so far has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            prefix, png, html = self._queue.get()
+            try:
+                self._write(prefix, png, html)
+                self._enforce_quota()
+            except Exception as e:
+                print(f"Could not save capture {prefix}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, prefix, png, html):
+        os.makedirs(self.out_dir, exist_ok=True)
+        screenshot_path = os.path.join(self.out_dir, f"{prefix}_screenshot.png")
+        if png is not None:
+            with open(screenshot_path, "wb") as file:
+                file.write(png)
+        if html is not None:
+            with gzip.open(os.path.join(self.out_dir, f"{prefix}_content.html.gz"), "wt", encoding="utf-8") as file:
+                file.write(html)
+        print(f"Saved screenshot to {screenshot_path}")
+
+    def _captures(self):
+        captures = {}
+        for name in os.listdir(self.out_dir):
+            suffix = next((suffix for suffix in self.SUFFIXES if name.endswith(suffix)), None)
+            if suffix is None:
+                continue
+            path = os.path.join(self.out_dir, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            captures.setdefault(name[:-len(suffix)], []).append((path, size))
+        # The prefixes start with a timestamp, so this is oldest first
+        return sorted(captures.items())
+
+    def _enforce_quota(self):
+        captures = self._captures()
+        count = len(captures)
+        total = sum(size for _, files in captures for _, size in files)
+        for _, files in captures[:-1]:
+            if count <= self.max_files and total <= self.max_bytes:
+                break
+            for path, size in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            count -= 1
@@ -0,0 +1,126 @@
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """A point in time a sync cycle has to be done by.
+
+    The clients cap their own timeouts to what's left of it, and give up with
+    DeadlineExceeded once it has passed, so a cycle can't run on forever.
+    """
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self._expires_at = clock() + seconds
+
+    def remaining(self):
+        """Seconds left, negative once the deadline has passed."""
+        return self._expires_at - self._clock()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, what="the sync cycle"):
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.0f}s exceeded in {what}")
+
+    def timeout(self, default, what="the sync cycle"):
+        """default seconds or what's left of the deadline, whichever is shorter."""
+        self.check(what)
+        return min(default, self.remaining())
+
+    def timeout_ms(self, default_ms, what="the sync cycle"):
+        # Never 0, Playwright takes that to mean no timeout at all
+        return max(1, int(self.timeout(default_ms / 1000, what) * 1000))
+
+
+class Watchdog:
+    """Watches for sync cycles that are stuck past their deadline.
+
+    Timeouts capped to the deadline normally stop a cycle in time, but a call
+    that hangs regardless can't be interrupted from here. Once a cycle is grace
+    seconds past its deadline the watchdog logs where it is stuck and calls
+    on_fire, and if exit_after is set it exits the process once the cycle is
+    that many seconds late, so whatever supervises it can start it again.
+    """
+
+    def __init__(self, grace=60, exit_after=None, on_fire=None, poll_interval=1.0):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self.grace = grace
+        self.exit_after = exit_after
+        self._on_fire = on_fire
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._deadline = None
+        self._thread_id = None
+        self._fired = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @contextlib.contextmanager
+    def watch(self, deadline):
+        """Watches the calling thread until the block is done."""
+        if deadline is None:
+            yield
+            return
+        with self._lock:
+            self._deadline = deadline
+            self._thread_id = threading.get_ident()
+            self._fired = False
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._deadline = None
+
+    @property
+    def fired(self):
+        with self._lock:
+            return self._fired
+
+    def check(self):
+        with self._lock:
+            deadline, thread_id, fired = self._deadline, self._thread_id, self._fired
+        if deadline is None:
+            return
+        overrun = -deadline.remaining()
+        if overrun <= self.grace:
+            return
+
+        if not fired:
+            with self._lock:
+                self._fired = True
+            frame = sys._current_frames().get(thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(thread is gone)"
+            self.log.error(f"Sync cycle is {overrun:.0f}s past its deadline, stuck at:\n{stack}")
+            if self._on_fire is not None:
+                self._on_fire(overrun)
+
+        if self.exit_after is not None and overrun > self.exit_after:
+            self.log.critical(f"Sync cycle is {overrun:.0f}s past its deadline, exiting")
+            logging.shutdown()
+            os._exit(3)
+
+    def _run(self):
+        while not self._stop.wait(self._poll_interval):
+            self.check()
@@ -0,0 +1,156 @@
+import sys
+import threading
+import time
+
+from metrics import REGISTRY
+
+
+DRIVER_CALLS = REGISTRY.counter(
+    "alexa2anylist_driver_calls_total",
+    "Playwright calls made by the Alexa driver, by driver method and Playwright method.",
+)
+DRIVER_SECONDS = REGISTRY.counter(
+    "alexa2anylist_driver_seconds_total",
+    "Time spent in Playwright calls by the Alexa driver, by driver method and Playwright method.",
+)
+DRIVER_SLEEP_SECONDS = REGISTRY.counter(
+    "alexa2anylist_driver_sleep_seconds_total",
+    "Time the Alexa driver spent in deliberate sleeps, by driver method.",
+)
+
+
+class DriverStats:
+    """Counts Playwright round trips and sleeps, by the driver method that made them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._calls = {}
+            self._sleeps = {}
+            self._started = time.perf_counter()
+
+    def record_call(self, caller, method, selector, seconds):
+        with self._lock:
+            stats = self._calls.setdefault((caller, method, selector), [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+        DRIVER_CALLS.inc(caller=caller, method=method)
+        DRIVER_SECONDS.inc(seconds, caller=caller, method=method)
+
+    def record_sleep(self, caller, seconds):
+        with self._lock:
+            stats = self._sleeps.setdefault(caller, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+        DRIVER_SLEEP_SECONDS.inc(seconds, caller=caller)
+
+    def summary(self):
+        with self._lock:
+            calls = sorted(self._calls.items(), key=lambda item: item[1][1], reverse=True)
+            sleeps = sorted(self._sleeps.items(), key=lambda item: item[1][1], reverse=True)
+            elapsed = time.perf_counter() - self._started
+        return {
+            "elapsed": elapsed,
+            "calls": sum(count for _, (count, _) in calls),
+            "call_seconds": sum(seconds for _, (_, seconds) in calls),
+            "sleeps": sum(count for _, (count, _) in sleeps),
+            "sleep_seconds": sum(seconds for _, (_, seconds) in sleeps),
+            "by_call": [
+                {"caller": caller, "method": method, "selector": selector, "count": count, "seconds": seconds}
+                for (caller, method, selector), (count, seconds) in calls
+            ],
+            "by_sleep": [
+                {"caller": caller, "count": count, "seconds": seconds}
+                for caller, (count, seconds) in sleeps
+            ],
+        }
+
+    def format_summary(self, top=5):
+        summary = self.summary()
+        line = (
+            f"{summary['calls']} Playwright calls in {summary['call_seconds']:.1f}s, "
+            f"{summary['sleeps']} sleeps for {summary['sleep_seconds']:.1f}s, "
+            f"{summary['elapsed']:.1f}s in total"
+        )
+        slowest = [
+            f"{call['caller']} {call['method']}"
+            + (f"('{call['selector']}')" if call['selector'] else "")
+            + f" x{call['count']} {call['seconds']:.2f}s"
+            for call in summary["by_call"][:top]
+        ]
+        if slowest:
+            line += "; slowest: " + ", ".join(slowest)
+        return line
+
+
+# Only build a locator, they don't talk to the browser until something is done with it
+LAZY_METHODS = frozenset(("locator", "nth", "first", "last", "filter"))
+
+
+def _is_locator(value):
+    # Locators and element handles, Playwright doesn't export a common base class
+    return hasattr(value, "locator") and hasattr(value, "inner_text")
+
+
+class InstrumentedPage:
+    """Wraps a Playwright page (or a locator or the mouse) and records every call in stats.
+
+    Calls are attributed to the closest method of owner on the stack, and to
+    the selector chain that led to the locator they were made on.
+    """
+
+    def __init__(self, target, stats, owner, selector=None):
+        self._target = target
+        self._stats = stats
+        self._owner = owner
+        self._selector = selector
+
+    def _caller(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_locals.get("self") is self._owner:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return "unknown"
+
+    def _child_selector(self, method, args):
+        if method == "locator" and args and isinstance(args[0], str):
+            return f"{self._selector} >> {args[0]}" if self._selector else args[0]
+        if method in ("nth", "first", "last"):
+            return f"{self._selector} >> {method}" if self._selector else method
+        return self._selector
+
+    def _wrap(self, value, selector):
+        if _is_locator(value):
+            return InstrumentedPage(value, self._stats, self._owner, selector)
+        if isinstance(value, list) and value and all(_is_locator(v) for v in value):
+            return [InstrumentedPage(v, self._stats, self._owner, selector) for v in value]
+        return value
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name == "mouse":
+            return InstrumentedPage(value, self._stats, self._owner, "mouse")
+        if not callable(value):
+            # Properties like Locator.first
+            return self._wrap(value, self._child_selector(name, ()))
+
+        if name in LAZY_METHODS:
+            return lambda *args, **kwargs: self._wrap(value(*args, **kwargs), self._child_selector(name, args))
+
+        def call(*args, **kwargs):
+            caller = self._caller()
+            start = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            finally:
+                self._stats.record_call(caller, name, self._selector, time.perf_counter() - start)
+            return self._wrap(result, self._child_selector(name, args))
+
+        return call
+
+    def __repr__(self):
+        return f"InstrumentedPage({self._target!r})"
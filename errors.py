@@ -0,0 +1,30 @@
+import contextlib
+
+
+# Which client an exception came from, see blame
+SIDE_ANYLIST = "anylist"
+SIDE_ALEXA = "alexa"
+
+
+@contextlib.contextmanager
+def blame(side):
+    """Marks exceptions raised in the block as coming from one side of the sync.
+
+    The exception itself is re-raised untouched, only a sync_side attribute is
+    added (unless an inner block already set one), so the server can tell which
+    client needs fixing.
+    """
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "sync_side", None) is None:
+            try:
+                e.sync_side = side
+            except AttributeError:
+                pass
+        raise
+
+
+def side_of(error):
+    """SIDE_ANYLIST, SIDE_ALEXA or None if the exception wasn't blamed on either."""
+    return getattr(error, "sync_side", None)
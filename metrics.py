@@ -0,0 +1,304 @@
+import collections
+import contextlib
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+def _nearest_rank(ordered, p):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class RollingHistogram:
+    """The last window samples of something, with percentiles over them."""
+
+    def __init__(self, window=1000):
+        self._samples = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """Nearest rank percentile of the samples in the window, None if there are none."""
+        return _nearest_rank(sorted(self._samples), p)
+
+    def summary(self):
+        ordered = sorted(self._samples)
+        return {
+            "count": self.count,
+            "window": len(ordered),
+            "p50": _nearest_rank(ordered, 50),
+            "p95": _nearest_rank(ordered, 95),
+            "p99": _nearest_rank(ordered, 99),
+            "max": ordered[-1] if ordered else None,
+        }
+
+
+class LatencyTracker:
+    """How long changes take to get from one list to the other.
+
+    Samples are kept per direction (anylist_to_alexa or alexa_to_anylist) and
+    per kind of change (add, check, rename or delete, as done on the source list).
+    """
+
+    ANYLIST_TO_ALEXA = "anylist_to_alexa"
+    ALEXA_TO_ANYLIST = "alexa_to_anylist"
+
+    KIND_ADD = "add"
+    KIND_CHECK = "check"
+    KIND_RENAME = "rename"
+    KIND_DELETE = "delete"
+
+    def __init__(self, window=1000):
+        self._window = window
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, direction, kind, seconds):
+        with self._lock:
+            histogram = self._histograms.get((direction, kind))
+            if histogram is None:
+                histogram = self._histograms[(direction, kind)] = RollingHistogram(self._window)
+            histogram.add(max(0.0, seconds))
+
+    def histogram(self, direction, kind):
+        with self._lock:
+            return self._histograms.get((direction, kind))
+
+    def summary(self):
+        """Returns {direction: {kind: {count, window, p50, p95, p99, max}}}, in seconds."""
+        with self._lock:
+            histograms = dict(self._histograms)
+        summary = {}
+        for (direction, kind), histogram in sorted(histograms.items()):
+            summary.setdefault(direction, {})[kind] = histogram.summary()
+        return summary
+
+    def format_summary(self):
+        lines = []
+        for direction, kinds in self.summary().items():
+            for kind, stats in kinds.items():
+                lines.append(
+                    f"{direction} {kind}: p50 {stats['p50']:.1f}s, p95 {stats['p95']:.1f}s, "
+                    f"p99 {stats['p99']:.1f}s ({stats['count']} changes)"
+                )
+        return "; ".join(lines)
+
+
+# ============================================================
+# Prometheus style metrics
+
+# Seconds, from a quick local call up to a slow Alexa scrape
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ((0,) * len(self.buckets), 0.0))
+            counts = tuple(count + (value <= bound) for count, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ((0,), 0.0))
+            return counts[-1]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes how long the with block took, whether or not it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, labels, value):
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, documentation, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            elif type(metric) is not cls:
+                raise Exception(f"Metric {name} is already registered as a {metric.TYPE}")
+            return metric
+
+    def counter(self, name, documentation):
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name, documentation):
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry on http://host:port/metrics from a background thread."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self._registry = registry
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        self.log.info(f"Serving metrics on port {self.port}")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _make_handler(self):
+        registry = self._registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", MetricsServer.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+# What the server exposes, the modules below record into it
+REGISTRY = MetricsRegistry()
+PHASE_SECONDS = REGISTRY.histogram(
+    "alexa2anylist_phase_seconds",
+    "Time spent in each phase of the sync loop.",
+)
+PROPAGATION_SECONDS = REGISTRY.histogram(
+    "alexa2anylist_propagation_seconds",
+    "Time from a change being seen on one list until it was applied to the other.",
+)
+
+
+def time_phase(phase):
+    return PHASE_SECONDS.time(phase=phase)
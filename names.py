@@ -0,0 +1,106 @@
+import unicodedata
+
+
+class NameCanonicalizer:
+    """Maps item names to a canonical key, so 'milk' on Alexa matches 'Milk' on Anylist.
+
+    Names are Unicode normalized (NFKC), case folded and have their whitespace
+    collapsed. Optionally accents are dropped, plural suffixes are stripped from
+    the last word and synonyms are mapped onto a single key.
+    """
+
+    def __init__(self, synonyms=None, plural_suffixes=None, fold_accents=False):
+        self.fold_accents = fold_accents
+        # Longest suffix first, so 'es' wins over 's'
+        self.plural_suffixes = sorted(
+            (self._normalize(suffix) for suffix in plural_suffixes or []),
+            key=len,
+            reverse=True,
+        )
+        self.synonyms = {}
+        for synonym, target in (synonyms or {}).items():
+            self.synonyms[self._singular(self._normalize(synonym))] = self._singular(self._normalize(target))
+
+    @classmethod
+    def from_config(cls, config):
+        config = config or {}
+        return cls(
+            synonyms=config.get("synonyms"),
+            plural_suffixes=config.get("plural_suffixes"),
+            fold_accents=config.get("fold_accents", False),
+        )
+
+    def _normalize(self, name):
+        name = unicodedata.normalize('NFKC', name)
+        if self.fold_accents:
+            name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+        return ' '.join(name.split()).casefold()
+
+    def _singular(self, name):
+        words = name.split(' ')
+        last = words[-1]
+        for suffix in self.plural_suffixes:
+            # Leave short words and double letters alone, e.g. 'gas' or 'glass'
+            if last.endswith(suffix) and len(last) - len(suffix) >= 3 and last[-len(suffix) - 1] != suffix[0]:
+                words[-1] = last[:-len(suffix)]
+                break
+        return ' '.join(words)
+
+    def key(self, name):
+        if not name:
+            return ''
+        key = self._singular(self._normalize(name))
+        return self.synonyms.get(key, key)
+
+
+class NameIndex:
+    """Names from one side of the sync, looked up by canonical key."""
+
+    def __init__(self, canonicalizer, names=()):
+        self._canonicalizer = canonicalizer
+        self._names = {}
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        return self._canonicalizer.key(name) in self._names
+
+    def __len__(self):
+        return sum(len(names) for names in self._names.values())
+
+    def add(self, name):
+        self._names.setdefault(self._canonicalizer.key(name), []).append(name)
+
+    def discard(self, name):
+        key = self._canonicalizer.key(name)
+        names = self._names.get(key)
+        if not names:
+            return
+        names.remove(name if name in names else names[0])
+        if not names:
+            del self._names[key]
+
+    def get(self, name):
+        """Returns the indexed spelling of name, or None if there's no match."""
+        names = self._names.get(self._canonicalizer.key(name))
+        if not names:
+            return None
+        return name if name in names else names[0]
+
+    def keys(self):
+        return set(self._names)
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it's known to be larger."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
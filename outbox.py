@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import time
+from errors import SIDE_ANYLIST
+from errors import blame
+from metrics import LatencyTracker
+from metrics import time_phase
+from names import NameCanonicalizer
+from synchronizer import Baseline
+from synchronizer import ListSnapshot
+from synchronizer import Synchronizer
+from synchronizer import baseline_file_path
+from synchronizer import config_file_path
+
+
+class Outbox:
+    """Operations waiting for Alexa to be available again, kept on disk.
+
+    Operations for the same item are coalesced as they are added: an add
+    followed by a remove (or the other way around) cancels out, a rename of a
+    pending add becomes an add of the new name, and so on. Whatever is left is
+    what Alexa needs to catch up, and is drained by the Synchronizer.
+    """
+
+    def __init__(self, outbox_file=None, key=None):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self._outbox_file = outbox_file
+        self._key = key or NameCanonicalizer().key
+        self._operations = []
+        self._load()
+
+    def __len__(self):
+        return len(self._operations)
+
+    @property
+    def operations(self):
+        return [dict(operation) for operation in self._operations]
+
+    def _find(self, op, field, name):
+        key = self._key(name)
+        return next(
+            (i for i, operation in enumerate(self._operations)
+             if operation['op'] == op and self._key(operation[field]) == key),
+            None,
+        )
+
+    def add(self, operation):
+        """Queues an Alexa operation, merging it with what's already queued for the same item."""
+        op = operation['op']
+        if op == Synchronizer.OP_ALEXA_ADD:
+            name = operation['name']
+            removed = self._find(Synchronizer.OP_ALEXA_REMOVE, 'name', name)
+            if removed is not None:
+                # It never has to leave Alexa
+                del self._operations[removed]
+                return
+            if self._find(Synchronizer.OP_ALEXA_ADD, 'name', name) is not None:
+                return
+            if self._find(Synchronizer.OP_ALEXA_RENAME, 'new', name) is not None:
+                return
+        elif op == Synchronizer.OP_ALEXA_REMOVE:
+            name = operation['name']
+            added = self._find(Synchronizer.OP_ALEXA_ADD, 'name', name)
+            if added is not None:
+                # It never has to reach Alexa
+                del self._operations[added]
+                return
+            renamed = self._find(Synchronizer.OP_ALEXA_RENAME, 'new', name)
+            if renamed is not None:
+                operation = dict(operation, name=self._operations.pop(renamed)['old'])
+            elif self._find(Synchronizer.OP_ALEXA_REMOVE, 'name', name) is not None:
+                return
+        elif op == Synchronizer.OP_ALEXA_RENAME:
+            added = self._find(Synchronizer.OP_ALEXA_ADD, 'name', operation['old'])
+            if added is not None:
+                self._operations[added] = dict(self._operations[added], name=operation['new'])
+                return
+            renamed = self._find(Synchronizer.OP_ALEXA_RENAME, 'new', operation['old'])
+            if renamed is not None:
+                previous = self._operations.pop(renamed)
+                if self._key(previous['old']) == self._key(operation['new']):
+                    return
+                operation = dict(previous, new=operation['new'])
+        else:
+            raise Exception(f"Can't queue {op} operations for Alexa")
+
+        self._operations.append(dict(operation, state=Synchronizer.OP_STATE_PENDING))
+
+    def peek(self, count):
+        """The first count operations, to be removed with done once they've been applied."""
+        return [dict(operation) for operation in self._operations[:count]]
+
+    def done(self, count):
+        del self._operations[:count]
+        self.save()
+
+    def _load(self):
+        if not self._outbox_file or not os.path.exists(self._outbox_file):
+            return
+
+        try:
+            with open(self._outbox_file, 'r') as file:
+                self._operations = json.load(file).get('operations', [])
+        except Exception as e:
+            self.log.error(f"Error loading outbox from {self._outbox_file}: {e}", exc_info=True)
+
+    def save(self):
+        if not self._outbox_file:
+            return
+
+        try:
+            with open(self._outbox_file, 'w') as file:
+                json.dump({
+                    'saved_time': time.time(),
+                    'operations': self._operations,
+                }, file, indent=4)
+        except Exception as e:
+            self.log.error(f"Error saving outbox to {self._outbox_file}: {e}", exc_info=True)
+            raise e
+
+
+class DegradedSync:
+    """Keeps track of Anylist while Alexa is unavailable.
+
+    Stands in for the Synchronizer: every cycle it diffs the Anylist list against
+    the last one it saw and queues what Alexa will need in the outbox. It keeps
+    the Anylist half of the saved baseline current (the Alexa half stays what
+    Alexa last looked like), so once Alexa is back the Synchronizer only has to
+    drain the outbox and pick up whatever changed on Alexa in the meantime.
+    """
+
+    def __init__(self, anylist, outbox, journal_file=None, name_rules=None):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self.anylist = anylist
+        self.outbox = outbox
+        self._names = NameCanonicalizer.from_config(name_rules)
+        self._baseline = Baseline(baseline_file=baseline_file_path(journal_file) if journal_file else None)
+        self._alexa_list = None
+
+        baseline = self._baseline.load()
+        list_id = getattr(anylist, 'identifier', None)
+        if baseline is not None and not (baseline[0].identifier and list_id and baseline[0].identifier != list_id):
+            # Start from the last synced state, so changes since then get queued too
+            self._snapshot, self._alexa_list = baseline
+        else:
+            with blame(SIDE_ANYLIST), time_phase('anylist_fetch'):
+                self._snapshot = ListSnapshot.from_list(self.anylist.refresh())
+        self.log.warning(f"Alexa is unavailable, queueing Anylist changes ({len(self.outbox)} already queued)")
+
+    def sync(self):
+        """Queues the Anylist changes since the last cycle, returns whether there were any."""
+        with blame(SIDE_ANYLIST), time_phase('anylist_fetch'):
+            current = self.anylist.refresh()
+        operations = self._plan_operations(current, time.time())
+
+        for operation in operations:
+            self.outbox.add(operation)
+        if operations:
+            self.outbox.save()
+            self.log.info(f"Queued {len(operations)} changes for Alexa, {len(self.outbox)} waiting")
+
+        self._snapshot = ListSnapshot.from_list(current)
+        if self._alexa_list is not None:
+            self._baseline.save(self._snapshot, self._alexa_list)
+        return bool(operations)
+
+    def _plan_operations(self, current, seen_at):
+        operations = []
+
+        def change(op, kind, **payload):
+            operations.append(dict(payload, op=op, kind=kind, seen_at=seen_at, state=Synchronizer.OP_STATE_PENDING))
+
+        for item in current:
+            old_item = self._snapshot.get_item_by_id(item.identifier)
+            if old_item is None:
+                if not item.checked:
+                    change(Synchronizer.OP_ALEXA_ADD, LatencyTracker.KIND_ADD, name=item.name)
+            elif bool(item.checked) != old_item.checked:
+                if item.checked:
+                    change(Synchronizer.OP_ALEXA_REMOVE, LatencyTracker.KIND_CHECK, name=old_item.name)
+                else:
+                    change(Synchronizer.OP_ALEXA_ADD, LatencyTracker.KIND_ADD, name=item.name)
+            elif not item.checked and self._names.key(item.name) != self._names.key(old_item.name):
+                change(Synchronizer.OP_ALEXA_RENAME, LatencyTracker.KIND_RENAME, old=old_item.name, new=item.name)
+        for old_item in self._snapshot:
+            if not old_item.checked and current.get_item_by_id(old_item.identifier) is None:
+                change(Synchronizer.OP_ALEXA_REMOVE, LatencyTracker.KIND_DELETE, name=old_item.name)
+        return operations
+
+
+def outbox_for(journal_file, name_rules=None):
+    """The outbox kept next to a journal, e.g. journal-outbox.json."""
+    root, ext = os.path.splitext(journal_file)
+    return Outbox(
+        outbox_file=config_file_path(f"{root}-outbox{ext or '.json'}"),
+        key=NameCanonicalizer.from_config(name_rules).key,
+    )
@@ -0,0 +1,87 @@
+import logging
+
+from errors import SIDE_ALEXA
+from errors import SIDE_ANYLIST
+from errors import side_of
+
+
+class RecoveryPolicy:
+    """Decides how much of the server to rebuild after a failed sync cycle.
+
+    Each side has a ladder of fixes, from cheapest to most expensive. A failure
+    starts on the rung that matches its severity, and every further failure of
+    the same side in a row climbs one rung, up to rebuilding everything. A
+    failure that can't be blamed on either side rebuilds everything straight
+    away. A successful cycle starts the ladders over.
+    """
+
+    ACTION_RETRY = "retry"
+    ACTION_RECONNECT_ANYLIST = "reconnect_anylist"
+    ACTION_RELOAD_ALEXA = "reload_alexa"
+    ACTION_NEW_ALEXA_CONTEXT = "new_alexa_context"
+    ACTION_RESTART_ALEXA = "restart_alexa"
+    ACTION_REBUILD = "rebuild"
+
+    # Something failed once, e.g. a request or a selector timed out
+    SEVERITY_TRANSIENT = "transient"
+    # The connection or session looks broken
+    SEVERITY_BROKEN = "broken"
+    # The client itself is gone, e.g. the browser crashed
+    SEVERITY_FATAL = "fatal"
+
+    LADDERS = {
+        SIDE_ANYLIST: (ACTION_RETRY, ACTION_RECONNECT_ANYLIST, ACTION_REBUILD),
+        SIDE_ALEXA: (ACTION_RELOAD_ALEXA, ACTION_NEW_ALEXA_CONTEXT, ACTION_RESTART_ALEXA, ACTION_REBUILD),
+    }
+
+    # Exception type names, so this doesn't have to import requests or websocket
+    ANYLIST_BROKEN_TYPES = ("ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout", "SSLError", "DeadlineExceeded")
+    ANYLIST_BROKEN_MESSAGES = ("Failed to fetch tokens", "Failed to refresh tokens", "Connection is already closed")
+    # A cycle that ran out of time gets a fresh page and context, whatever it was stuck on
+    ALEXA_BROKEN_TYPES = ("DeadlineExceeded",)
+    ALEXA_FATAL_MESSAGES = ("has been closed", "Target closed", "disconnected", "crashed", "was killed")
+    ALEXA_BROKEN_MESSAGES = ("net::ERR_", "ap/signin", "requires login")
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self._failures = {}
+
+    def classify(self, error):
+        """Returns the (side, severity) of a failure, side is None if it couldn't be told."""
+        side = side_of(error)
+        name = type(error).__name__
+        message = str(error)
+        if side == SIDE_ANYLIST:
+            if name in self.ANYLIST_BROKEN_TYPES or any(text in message for text in self.ANYLIST_BROKEN_MESSAGES):
+                return side, RecoveryPolicy.SEVERITY_BROKEN
+            return side, RecoveryPolicy.SEVERITY_TRANSIENT
+        if side == SIDE_ALEXA:
+            if any(text in message for text in self.ALEXA_FATAL_MESSAGES):
+                return side, RecoveryPolicy.SEVERITY_FATAL
+            if name in self.ALEXA_BROKEN_TYPES or any(text in message for text in self.ALEXA_BROKEN_MESSAGES):
+                return side, RecoveryPolicy.SEVERITY_BROKEN
+            return side, RecoveryPolicy.SEVERITY_TRANSIENT
+        return None, RecoveryPolicy.SEVERITY_FATAL
+
+    def record_failure(self, error):
+        """Returns the action to take for a failed cycle."""
+        side, severity = self.classify(error)
+        if side is None:
+            return RecoveryPolicy.ACTION_REBUILD
+
+        ladder = RecoveryPolicy.LADDERS[side]
+        if severity == RecoveryPolicy.SEVERITY_TRANSIENT:
+            start = 0
+        elif severity == RecoveryPolicy.SEVERITY_BROKEN:
+            start = 1
+        else:
+            start = len(ladder) - 2
+        failures = self._failures.get(side, 0)
+        self._failures[side] = failures + 1
+        action = ladder[min(start + failures, len(ladder) - 1)]
+        self.log.debug(f"{side} failure ({severity}, {failures + 1} in a row): {action}")
+        return action
+
+    def record_success(self):
+        self._failures = {}
@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+from datetime import datetime
+
+
+class SyncScheduler:
+    """Decides how long the server loop waits before the next sync.
+
+    Polls every min_delay seconds while the lists are changing and for
+    active_window seconds after the last change, then backs off exponentially
+    up to max_delay while idle. Failures back off exponentially from
+    retry_delay up to max_retry_delay, with some jitter so restarts don't line
+    up. During quiet hours the delay is at least the quiet hours delay.
+    """
+
+    REASON_STARTUP = "startup"
+    REASON_CHANGES = "changes seen"
+    REASON_ACTIVE = "recent changes"
+    REASON_IDLE = "idle"
+    REASON_FAILURE = "failure"
+    REASON_QUIET_HOURS = "quiet hours"
+
+    def __init__(self, min_delay=10, max_delay=300, active_window=120, idle_backoff=2.0,
+                 retry_delay=10, max_retry_delay=600, jitter=0.2, quiet_hours=None,
+                 clock=time.time, now=datetime.now):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.active_window = active_window
+        self.idle_backoff = idle_backoff
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max(max_retry_delay, retry_delay)
+        self.jitter = jitter
+        self.quiet_hours = self._parse_quiet_hours(quiet_hours)
+        self._clock = clock
+        self._now = now
+        self._interval = min_delay
+        self._reason = SyncScheduler.REASON_STARTUP
+        self._last_change_time = clock()
+        self._consecutive_failures = 0
+
+    @classmethod
+    def from_config(cls, config, sync_delay, retry_delay):
+        return cls(
+            min_delay=sync_delay,
+            max_delay=config.get("sync_max_delay", max(sync_delay, 300)),
+            active_window=config.get("sync_active_window", 120),
+            retry_delay=retry_delay,
+            max_retry_delay=config.get("retry_max_delay", max(retry_delay, 600)),
+            quiet_hours=config.get("quiet_hours"),
+        )
+
+    def _parse_quiet_hours(self, quiet_hours):
+        if not quiet_hours:
+            return None
+
+        def minutes(value):
+            hours, mins = value.split(":")
+            return int(hours) * 60 + int(mins)
+
+        return (
+            minutes(quiet_hours["start"]),
+            minutes(quiet_hours["end"]),
+            quiet_hours.get("delay", self.max_delay),
+        )
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def reason(self):
+        return self._reason
+
+    @property
+    def consecutive_failures(self):
+        return self._consecutive_failures
+
+    def _in_quiet_hours(self):
+        if self.quiet_hours is None:
+            return False
+        start, end, _ = self.quiet_hours
+        now = self._now()
+        current = now.hour * 60 + now.minute
+        if start <= end:
+            return start <= current < end
+        # Wraps around midnight, e.g. 23:00 - 07:00
+        return current >= start or current < end
+
+    def _apply_quiet_hours(self):
+        if self._in_quiet_hours() and self._interval < self.quiet_hours[2]:
+            self._interval = self.quiet_hours[2]
+            self._reason = SyncScheduler.REASON_QUIET_HOURS
+
+    def record_success(self, changed):
+        self._consecutive_failures = 0
+        now = self._clock()
+        if changed:
+            self._last_change_time = now
+            self._interval = self.min_delay
+            self._reason = SyncScheduler.REASON_CHANGES
+        elif now - self._last_change_time < self.active_window:
+            self._interval = self.min_delay
+            self._reason = SyncScheduler.REASON_ACTIVE
+        else:
+            self._interval = min(max(self._interval, self.min_delay) * self.idle_backoff, self.max_delay)
+            self._reason = SyncScheduler.REASON_IDLE
+        self._apply_quiet_hours()
+        return self._interval
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        delay = min(self.retry_delay * 2 ** (self._consecutive_failures - 1), self.max_retry_delay)
+        self._interval = delay * (1 + self.jitter * random.uniform(-1, 1))
+        self._reason = f"{SyncScheduler.REASON_FAILURE} #{self._consecutive_failures}"
+        return self._interval
@@ -2,9 +2,23 @@ import argparse
 import json
 import os
 import sys
+import time
 from alexa import AlexaShoppingList
+from alexa_worker import AlexaWorkerClient
 from anylist import AnyList
 from synchronizer import Synchronizer
+from outbox import DegradedSync
+from outbox import outbox_for
+from scheduler import SyncScheduler
+from metrics import REGISTRY
+from metrics import MetricsServer
+from metrics import time_phase
+from deadline import Deadline
+from deadline import DeadlineExceeded
+from deadline import Watchdog
+from errors import SIDE_ALEXA
+from errors import side_of
+from recovery import RecoveryPolicy
 import onetimepass as otp
 from time import sleep
 import traceback
@@ -18,6 +32,19 @@ logging.basicConfig(
 logger = logging.getLogger('__name__')
 logger.setLevel(logging.DEBUG)
 
+SYNC_CYCLES = REGISTRY.counter("alexa2anylist_sync_cycles_total", "Sync cycles run, by result.")
+RESTARTS = REGISTRY.counter("alexa2anylist_restarts_total", "Times the Anylist and Alexa clients were (re)created.")
+LAST_SUCCESS = REGISTRY.gauge("alexa2anylist_last_success_timestamp_seconds", "When the last sync cycle succeeded.")
+LAST_FAILURE = REGISTRY.gauge("alexa2anylist_last_failure_timestamp_seconds", "When the last sync cycle failed.")
+CONSECUTIVE_FAILURES = REGISTRY.gauge("alexa2anylist_consecutive_failures", "Sync cycles failed in a row.")
+RECOVERIES = REGISTRY.counter("alexa2anylist_recoveries_total", "What was rebuilt after failed sync cycles, by failing side and action.")
+CYCLE_OVERRUNS = REGISTRY.counter("alexa2anylist_cycle_overruns_total", "Sync cycles that ran past their deadline, by whether they were aborted or finished late.")
+WATCHDOG_FIRED = REGISTRY.counter("alexa2anylist_watchdog_fired_total", "Times a sync cycle was stuck well past its deadline.")
+DEGRADED_SECONDS = REGISTRY.gauge("alexa2anylist_degraded_seconds", "How long Alexa has been unavailable, 0 when it isn't.")
+OUTBOX_DEPTH = REGISTRY.gauge("alexa2anylist_outbox_depth", "Anylist changes waiting for Alexa to be available again.")
+LIVE_CHANGES = REGISTRY.counter("alexa2anylist_alexa_live_changes_total", "Syncs started early because the Alexa list page changed.")
+NEXT_SYNC_DELAY = REGISTRY.gauge("alexa2anylist_next_sync_delay_seconds", "How long the loop waits before the next sync.")
+
 def _config_path():
     return os.environ.get(
         "CONFIG_PATH",
@@ -35,14 +62,33 @@ def _get_config_value(key, default=None):
         return config[key]
     return default
 
+def _trace_settings():
+    if not _get_config_value("alexa_trace", False):
+        return {}
+    return {
+        "trace_dir": _get_config_value("alexa_trace_dir", os.path.join(_config_path(), "traces")),
+        "trace_slow_seconds": float(_get_config_value("alexa_trace_slow_seconds", 60)),
+        "trace_max_mb": float(_get_config_value("alexa_trace_max_mb", 200)),
+    }
+
+def _browser_settings():
+    endpoint = _get_config_value("alexa_browser_endpoint")
+    return {"browser_endpoint": endpoint} if endpoint else {}
+
 def _start_alexa():
     global alexa
     global alexa_running
 
     if alexa_running == False:
-        alexa = AlexaShoppingList(
+        # The browser can run in its own process, so a crash or hang there only costs the worker
+        client = AlexaWorkerClient if _get_config_value("alexa_worker", False) else AlexaShoppingList
+        alexa = client(
             _get_config_value("amazon_url", "amazon.co.uk"),
-            _config_path()
+            _config_path(),
+            base_url=_get_config_value("alexa_base_url"),
+            full_reload_every=int(_get_config_value("alexa_full_reload_every", 10)),
+            **_trace_settings(),
+            **_browser_settings(),
         )
         alexa_running = True
 
@@ -77,32 +123,65 @@ config = {}
 
 
 def _create_syncer():
-    _anylist_cred_cache = os.path.join(_config_path(), 'anylist-credentials.json')
-    if os.path.exists(_anylist_cred_cache):
-        os.remove(_anylist_cred_cache)
+    RESTARTS.inc()
+    with time_phase('create_syncer'):
+        return _create_clients()
 
+
+def _create_clients():
+    anylist, list_anylist = _create_anylist()
+    try:
+        _alexa = _create_alexa()
+    except Exception as e:
+        try:
+            degraded = _create_degraded(list_anylist, e)
+        except Exception:
+            anylist.teardown()
+            raise
+        if degraded is None:
+            anylist.teardown()
+            raise
+        return anylist, degraded
+    return anylist, _create_synchronizer(list_anylist, _alexa)
+
+
+def _create_anylist():
+    # Cached tokens are reused (and refreshed if needed), the password is only used when they can't be
     anylist = AnyList(
         email=_get_config_value("anylist_username", "anylist_username"),
         password=_get_config_value("anylist_password", "anylist_password"),
         credential_cache='anylist-credentials.json',
+        api_url=_get_config_value("anylist_api_url"),
     )
-    anylist.login()
+    with time_phase('anylist_login'):
+        anylist.login()
     list_anylist = anylist.get_list_by_name(_get_config_value("anylist_list_name", "anylist_list_name"))
     logger.info(f"Anylist: {list_anylist}")
     if list_anylist is None:
         logger.info("List not found")
         anylist.teardown()
         raise RuntimeError("AnyList list not found")
+    return anylist, list_anylist
+
 
+def _create_alexa():
     logger.info("Connecting to Alexa...")
-    _alexa = _start_alexa()
+    with time_phase('alexa_start'):
+        _alexa = _start_alexa()
+    _login_alexa(_alexa)
+    return _alexa
+
+
+def _login_alexa(_alexa):
     logger.info("Logging in...")
-    _alexa.login(_get_config_value("amazon_username", "amazon_username"), _get_config_value("amazon_password", "amazon_password"))
+    with time_phase('alexa_login'):
+        _alexa.login(_get_config_value("amazon_username", "amazon_username"), _get_config_value("amazon_password", "amazon_password"))
 
     if _alexa.login_requires_mfa():
         logger.info("Requires MFA")
         my_token = otp.get_totp(_pad_string(_get_config_value("amazon_mfa_secret", "amazon_mfa_secret")))
-        _alexa.submit_mfa(my_token)
+        with time_phase('alexa_mfa'):
+            _alexa.submit_mfa(my_token)
         if _alexa.is_authenticated:
             logger.info("Code accepted")
         else:
@@ -111,12 +190,110 @@ def _create_syncer():
     if not _alexa.is_authenticated:
         logger.info("Login failed!!")
         _stop_alexa()
-        anylist.teardown()
         raise RuntimeError("Alexa login failed")
 
     logger.info("Logged in successfully")
-    syncer = Synchronizer(list_anylist, _alexa, journal_file='journal.json')
-    return anylist, syncer
+
+
+def _create_synchronizer(list_anylist, _alexa):
+    return Synchronizer(
+        list_anylist,
+        _alexa,
+        journal_file='journal.json',
+        name_rules=_get_config_value("name_matching"),
+        alexa_full_scrape_every=int(_get_config_value("alexa_full_scrape_every", 10)),
+        outbox=_outbox(),
+        outbox_batch=int(_get_config_value("outbox_batch", 20)),
+        alexa_verify_every=int(_get_config_value("alexa_verify_every", 1)),
+    )
+
+
+def _outbox():
+    return outbox_for('journal.json', name_rules=_get_config_value("name_matching"))
+
+
+def _create_degraded(list_anylist, error):
+    """Keeps Anylist going without Alexa, None if degraded mode is turned off."""
+    if not _get_config_value("degraded_mode", True):
+        return None
+    logger.error(f"Alexa is unavailable, only queueing Anylist changes until it's back: {error}")
+    _stop_alexa()
+    return _create_degraded_sync(list_anylist)
+
+
+def _create_degraded_sync(list_anylist):
+    return DegradedSync(
+        list_anylist,
+        _outbox(),
+        journal_file='journal.json',
+        name_rules=_get_config_value("name_matching"),
+    )
+
+
+def _wait_for_next_sync(delay, scheduler):
+    """Sleeps until the next sync, or until the Alexa list page shows a change with alexa_live_changes."""
+    wait_for_changes = getattr(alexa, "wait_for_changes", None) if alexa_running else None
+    if (wait_for_changes is None or delay <= 0 or not _get_config_value("alexa_live_changes", False)
+            or scheduler.reason == SyncScheduler.REASON_QUIET_HOURS):
+        sleep(delay)
+        return
+
+    started = time.time()
+    try:
+        if wait_for_changes(delay):
+            LIVE_CHANGES.inc()
+            logger.info(f"Alexa list changed after {time.time() - started:.0f}s, syncing now")
+    except Exception as e:
+        # Whatever broke will show up in the next sync, and be recovered from there
+        logger.warning(f"Stopped watching the Alexa list: {e}")
+        sleep(max(0, delay - (time.time() - started)))
+
+def _set_deadline(anylist, deadline):
+    for client in (anylist, alexa if alexa_running else None):
+        set_deadline = getattr(client, 'set_deadline', None)
+        if not callable(set_deadline):
+            continue
+        try:
+            set_deadline(deadline)
+        except Exception as e:
+            logger.warning(f"Could not set the deadline of {type(client).__name__}: {e}")
+
+
+def _abort_stuck_cycle(overrun):
+    """Called by the watchdog thread, kills what the cycle is stuck on so it fails and is recovered."""
+    WATCHDOG_FIRED.inc()
+    abort = getattr(alexa, 'abort', None) if alexa_running else None
+    if not callable(abort):
+        # Playwright can only be used from the thread running the cycle
+        logger.error("The Alexa browser can't be stopped from here, use alexa_worker to have stuck cycles aborted")
+        return
+    logger.error(f"Killing the Alexa worker, the cycle is {overrun:.0f}s past its deadline")
+    abort()
+
+
+def _recover(action, anylist, list_anylist):
+    """Fixes whatever the recovery action says is broken, returns the (new) Anylist client and list."""
+    if action == RecoveryPolicy.ACTION_RECONNECT_ANYLIST:
+        anylist.teardown()
+        return _create_anylist()
+
+    if action == RecoveryPolicy.ACTION_RELOAD_ALEXA or action == RecoveryPolicy.ACTION_NEW_ALEXA_CONTEXT:
+        method = 'reload_list' if action == RecoveryPolicy.ACTION_RELOAD_ALEXA else 'recreate_context'
+        fix = getattr(alexa, method, None) if alexa_running else None
+        if callable(fix):
+            with time_phase(action):
+                fix()
+            if not alexa.is_authenticated:
+                _login_alexa(alexa)
+            return anylist, list_anylist
+        # Not something this Alexa client can do, restart it instead
+        action = RecoveryPolicy.ACTION_RESTART_ALEXA
+
+    if action == RecoveryPolicy.ACTION_RESTART_ALEXA:
+        _stop_alexa()
+        _create_alexa()
+
+    return anylist, list_anylist
 
 
 def main(max_cycles=None, retry_delay=10, sync_delay=10):
@@ -129,34 +306,130 @@ def main(max_cycles=None, retry_delay=10, sync_delay=10):
 
     cycle_count = 0
     anylist = None
+    list_anylist = None
     syncer = None
+    recovery = RecoveryPolicy()
+    degraded_since = None
+    next_alexa_attempt = None
+    alexa_retry_delay = float(_get_config_value("degraded_alexa_retry", 300))
+    # No cycle should take longer than this, 0 to let them run as long as they need
+    cycle_budget = float(_get_config_value("cycle_budget", 900) or 0)
+    # Exiting takes the whole service down, only as a last resort when asked to
+    watchdog_exit_after = float(_get_config_value("watchdog_exit_after", 0) or 0)
+    watchdog = Watchdog(
+        grace=float(_get_config_value("watchdog_grace", 60)),
+        exit_after=watchdog_exit_after or None,
+        on_fire=_abort_stuck_cycle,
+    ).start()
+    scheduler = SyncScheduler.from_config(config, sync_delay=sync_delay, retry_delay=retry_delay)
+    metrics_server = None
+    if _get_config_value("metrics_port") is not None:
+        metrics_server = MetricsServer(
+            REGISTRY,
+            int(_get_config_value("metrics_port")),
+            host=_get_config_value("metrics_host", "127.0.0.1"),
+        ).start()
 
     while True:
         if max_cycles is not None and cycle_count >= max_cycles:
             break
 
-        if syncer is None or anylist is None:
+        if anylist is None:
             anylist, syncer = _create_syncer()
+            list_anylist = syncer.anylist
 
         try:
-            syncer.sync()
+            if syncer is None and not alexa_running:
+                # Anylist failed while Alexa was down, keep queueing until it's time to try Alexa again
+                syncer = _create_degraded_sync(list_anylist)
+            elif syncer is None:
+                # Only part of the clients were rebuilt after the last failure
+                syncer = _create_synchronizer(list_anylist, alexa)
+            if isinstance(syncer, DegradedSync):
+                if degraded_since is None:
+                    degraded_since = time.time()
+                    next_alexa_attempt = degraded_since + alexa_retry_delay
+                elif time.time() >= next_alexa_attempt:
+                    next_alexa_attempt = time.time() + alexa_retry_delay
+                    try:
+                        _alexa = _create_alexa()
+                    except Exception as e:
+                        logger.warning(f"Alexa is still unavailable: {e}")
+                        _stop_alexa()
+                    else:
+                        logger.info(f"Alexa is back after {time.time() - degraded_since:.0f}s, {len(syncer.outbox)} changes queued for it")
+                        syncer = _create_synchronizer(list_anylist, _alexa)
+                        degraded_since = None
+            else:
+                degraded_since = None
+            DEGRADED_SECONDS.set(0 if degraded_since is None else time.time() - degraded_since)
+            deadline = Deadline(cycle_budget) if cycle_budget > 0 else None
+            _set_deadline(anylist, deadline)
+            try:
+                with watchdog.watch(deadline), time_phase('sync'):
+                    changed = syncer.sync()
+            finally:
+                _set_deadline(anylist, None)
+            outbox = getattr(syncer, 'outbox', None)
+            OUTBOX_DEPTH.set(len(outbox) if outbox is not None else 0)
+            if deadline is not None and deadline.expired:
+                CYCLE_OVERRUNS.inc(result='late')
+                logger.warning(f"Sync cycle took longer than its {cycle_budget:.0f}s budget")
             cycle_count += 1
+            SYNC_CYCLES.inc(result='changed' if changed else 'unchanged')
+            LAST_SUCCESS.set(time.time())
+            CONSECUTIVE_FAILURES.set(0)
+            recovery.record_success()
             if run_once:
                 break
-            sleep(sync_delay)
+            delay = scheduler.record_success(bool(changed))
+            NEXT_SYNC_DELAY.set(delay)
+            logger.debug(f"Next sync in {delay:.0f}s ({scheduler.reason})")
+            _wait_for_next_sync(delay, scheduler)
         except Exception as e:
             cycle_count += 1
+            SYNC_CYCLES.inc(result='failed')
+            LAST_FAILURE.set(time.time())
             logger.error(e, exc_info=True)
-            if anylist is not None:
-                anylist.teardown()
-            anylist = None
+            if isinstance(e, DeadlineExceeded):
+                CYCLE_OVERRUNS.inc(result='aborted')
             syncer = None
-            _stop_alexa()
-            sleep(retry_delay)
+            action = recovery.record_failure(e)
+            if action != RecoveryPolicy.ACTION_REBUILD:
+                logger.info(f"Recovering from {side_of(e)} failure: {action}")
+                try:
+                    anylist, list_anylist = _recover(action, anylist, list_anylist)
+                except Exception as recovery_error:
+                    degraded = None
+                    if side_of(e) == SIDE_ALEXA:
+                        try:
+                            degraded = _create_degraded(list_anylist, recovery_error)
+                        except Exception as degraded_error:
+                            logger.error(f"Could not switch to degraded mode: {degraded_error}", exc_info=True)
+                    if degraded is not None:
+                        syncer = degraded
+                        action = 'degraded'
+                    else:
+                        logger.error(f"Recovery failed, rebuilding everything: {recovery_error}", exc_info=True)
+                        action = RecoveryPolicy.ACTION_REBUILD
+            RECOVERIES.inc(side=side_of(e) or 'unknown', action=action)
+            if action == RecoveryPolicy.ACTION_REBUILD:
+                if anylist is not None:
+                    anylist.teardown()
+                anylist = None
+                _stop_alexa()
+            delay = scheduler.record_failure()
+            CONSECUTIVE_FAILURES.set(scheduler.consecutive_failures)
+            NEXT_SYNC_DELAY.set(delay)
+            logger.info(f"Retrying in {delay:.0f}s ({scheduler.reason})")
+            sleep(delay)
 
     _stop_alexa()
     if anylist is not None:
         anylist.teardown()
+    watchdog.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
 
 
 if __name__ == "__main__":
@@ -2,6 +2,37 @@ import logging
 import os
 import json
 import time
+from errors import SIDE_ALEXA
+from errors import SIDE_ANYLIST
+from errors import blame
+from metrics import LatencyTracker
+from metrics import PROPAGATION_SECONDS
+from metrics import REGISTRY
+from metrics import time_phase
+from names import NameCanonicalizer
+from names import NameIndex
+from names import edit_distance
+
+
+ALEXA_VERIFICATIONS = REGISTRY.counter(
+    "alexa2anylist_alexa_verifications_total",
+    "Scrapes checking unverified Alexa changes, by whether they all stuck.",
+)
+
+
+def config_file_path(file_name):
+    config_path = os.environ.get(
+        "CONFIG_PATH",
+        os.path.dirname(os.path.realpath(__file__))
+    )
+    return os.path.join(config_path, file_name)
+
+
+def baseline_file_path(journal_file):
+    # The baselines live next to the journal, e.g. journal-baseline.json
+    root, ext = os.path.splitext(journal_file)
+    return config_file_path(f"{root}-baseline{ext or '.json'}")
+
 
 class Journal:
 
@@ -56,7 +87,7 @@ class Journal:
             return
 
         try:
-            with open(self._journal_file, 'w') as file:
+            with time_phase('journal_save'), open(self._journal_file, 'w') as file:
                 json.dump({
                     'dirty': self._dirty,
                     'last_update_time': self._last_update_time,
@@ -67,6 +98,97 @@ class Journal:
             raise e
 
 
+class SnapshotItem:
+
+    def __init__(self, identifier, name, checked=False):
+        self.identifier = identifier
+        self.name = name
+        self.checked = checked
+
+    def __repr__(self) -> str:
+        return f"SnapshotItem('{self.name}', {self.identifier})"
+
+    def __eq__(self, other):
+        try:
+            return self.identifier == other.identifier and self.name == other.name and self.checked == other.checked
+        except AttributeError:
+            return False
+
+
+class ListSnapshot:
+    """Detached copy of an Anylist list, used as the baseline for the next diff."""
+
+    def __init__(self, items, identifier=None):
+        self.identifier = identifier
+        self.items = list(items)
+        self._items_by_id = {item.identifier: item for item in self.items}
+
+    @classmethod
+    def from_list(cls, lst):
+        return cls(
+            [SnapshotItem(item.identifier, item.name, bool(item.checked)) for item in lst],
+            identifier=getattr(lst, 'identifier', None),
+        )
+
+    def __repr__(self) -> str:
+        return f"ListSnapshot({len(self.items)} items, {self.identifier})"
+
+    def __contains__(self, item):
+        return item.identifier in self._items_by_id
+
+    def __iter__(self):
+        yield from self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_item_by_id(self, identifier):
+        return self._items_by_id.get(identifier)
+
+    def get_item_by_name(self, name):
+        return next((i for i in self.items if i.name == name), None)
+
+
+class Baseline:
+
+    def __init__(self, baseline_file=None):
+        self.log = logging.getLogger(__name__)
+        self.log.setLevel(logging.DEBUG)
+        self._baseline_file = baseline_file
+
+    def load(self):
+        if not self._baseline_file or not os.path.exists(self._baseline_file):
+            return None
+
+        try:
+            with open(self._baseline_file, 'r') as file:
+                data = json.load(file)
+            anylist_list = ListSnapshot(
+                [SnapshotItem(identifier, name, checked) for identifier, name, checked in data['anylist']],
+                identifier=data.get('list_id'),
+            )
+            return anylist_list, list(data['alexa'])
+        except Exception as e:
+            self.log.error(f"Error loading baseline from {self._baseline_file}: {e}", exc_info=True)
+            return None
+
+    def save(self, anylist_list, alexa_list):
+        if not self._baseline_file:
+            return
+
+        try:
+            with open(self._baseline_file, 'w') as file:
+                json.dump({
+                    'saved_time': time.time(),
+                    'list_id': anylist_list.identifier,
+                    'anylist': [[item.identifier, item.name, item.checked] for item in anylist_list],
+                    'alexa': alexa_list,
+                }, file)
+        except Exception as e:
+            # Losing the baseline only costs a clobber on the next start
+            self.log.error(f"Error saving baseline to {self._baseline_file}: {e}", exc_info=True)
+
+
 class Synchronizer:
     JOURNAL_KEY_LAST_UPDATE_TIME = "last_update_time"
     JOURNAL_KEY_TRANSACTION_STATE = "transaction_state"
@@ -77,33 +199,66 @@ class Synchronizer:
     JOURNAL_KEY_ANYLIST_DELETED_ITEMS = "anylist_deleted_items"
     JOURNAL_KEY_ALEXA_NEW_ITEMS = "alexa_new_items"
     JOURNAL_KEY_ALEXA_DELETED_ITEMS = "alexa_deleted_items"
+    JOURNAL_KEY_OPERATIONS = "operations"
+
+    # Operations planned from the change sets above. Each one carries everything
+    # needed to execute it, so recovery doesn't have to resolve item ids again.
+    OP_ALEXA_ADD = "alexa_add"
+    OP_ALEXA_REMOVE = "alexa_remove"
+    OP_ALEXA_RENAME = "alexa_rename"
+    OP_ANYLIST_ADD = "anylist_add_or_uncheck"
+    OP_ANYLIST_CHECK = "anylist_check"
+    OP_STATE_PENDING = "pending"
+    OP_STATE_DONE = "done"
+
+    # How different two names can be and still be treated as a rename when clobbering
+    CLOBBER_RENAME_MAX_DISTANCE = 2
+    # Past this many remove/add pairs renames aren't looked for, the items are just removed and added
+    CLOBBER_RENAME_MAX_COMPARISONS = 250000
 
     # Master list is anylist, alexa is the slave
-    def __init__(self, anylist, alexa, journal_file=None):
+    def __init__(self, anylist, alexa, journal_file=None, name_rules=None, alexa_full_scrape_every=10,
+                 outbox=None, outbox_batch=20, alexa_verify_every=1):
         self.log = logging.getLogger(__name__)
         self.log.setLevel(logging.DEBUG)
         self.anylist = anylist
         self.alexa = alexa
+        self._outbox = outbox
+        self._outbox_batch = outbox_batch
+        self._names = NameCanonicalizer.from_config(name_rules)
+        self._alexa_full_scrape_every = alexa_full_scrape_every
+        # Cycles since Alexa was last fully scraped, None until it has been
+        self._cycles_since_full_scrape = None
+        # Alexa changes made between scrapes that check them, 1 checks every one
+        self._alexa_verify_every = max(1, alexa_verify_every)
+        # (operation, expected) of the Alexa changes made since the last check
+        self._unverified = []
+        # When the current lists were fetched, changes in them were first seen then
+        self._anylist_seen_at = None
+        self._alexa_seen_at = None
+        self._latency = None
         self._old_anylist_list = []
         self._old_alexa_list = []
+        # What the Anylist list looked like when it was fetched, see _get_fresh_lists
+        self._anylist_snapshot = None
         self._anylist_list, self._alexa_list = self._get_fresh_lists()
 
         if not journal_file:
             self._journal = Journal()
+            self._baseline = Baseline()
         else:
-            config_path = os.environ.get(
-                "CONFIG_PATH",
-                os.path.dirname(os.path.realpath(__file__))
-            )
-            self._journal = Journal(journal_file = os.path.join(config_path, journal_file))
+            self._journal = Journal(journal_file = config_file_path(journal_file))
+            self._baseline = Baseline(baseline_file = baseline_file_path(journal_file))
 
         # We have a journal, so let's see if we had any transactions in progress
+        recovered = False
         if self._journal.is_dirty:
             # We died in the middle of a transaction, let's see if we can recover
             # If the transaction is more than 10 minutes old, we probably shouldn't commit it
             if time.time() - self._journal.last_update_time < 60 * 10:
                 self.log.warning("Found dirty transaction, committing...")
                 self._commit_transaction()
+                recovered = True
             else:
                 self.log.warning("Found dirty transaction, but it's too old so we're ignoring it")
                 self._journal.reset()
@@ -111,14 +266,57 @@ class Synchronizer:
         else:
             self.log.debug("Journal is clean, nothing to do")
 
+        # Anylist changes queued while Alexa was unavailable go first, on top of
+        # what Alexa looked like back then
+        if self._outbox_pending():
+            if self._restore_baselines():
+                self._drain_outbox()
+            else:
+                # Without a baseline the queue can't be told apart from changes made on
+                # Alexa. Anylist already has all of it, so Alexa is clobbered below instead
+                self.log.warning(f"No baseline to apply {len(self._outbox)} queued changes on, dropping them")
+                self._outbox.done(len(self._outbox))
+
+        # If we know what the lists looked like when we stopped, sync whatever
+        # changed on either side since then like any other cycle
+        if not recovered and not self._are_lists_equal(self._anylist_snapshot, self._alexa_list) and self._restore_baselines():
+            self.log.info("Lists are not in sync, applying changes since the saved baseline...")
+            self._prepare_transaction()
+            self._commit_transaction()
+
         # Supposedly we're in sync now, let's check
-        if not self._are_lists_equal(self._anylist_list, self._alexa_list):
+        if self._outbox_pending():
+            self.log.info(f"{len(self._outbox)} queued changes left for Alexa, draining them over the next cycles")
+        elif not self._are_lists_equal(self._anylist_snapshot, self._alexa_list):
             # If we're not, then we have no choice but to treat Anylist as the good list
             self.log.info("Lists are not in sync, clobbering Alexa...")
             self._clobber_alexa()
         else:
             self._seed_baselines()
 
+    @property
+    def outbox(self):
+        return self._outbox
+
+    @property
+    def latency(self):
+        """Propagation latency of the changes synced so far, see LatencyTracker."""
+        if self._latency is None:
+            self._latency = LatencyTracker()
+        return self._latency
+
+    def _record_latency(self, operation):
+        # Operations from older journals and clobbers don't know when their change was seen
+        seen_at, kind = operation.get('seen_at'), operation.get('kind')
+        if seen_at is None or kind is None:
+            return
+        if operation['op'] in (Synchronizer.OP_ANYLIST_ADD, Synchronizer.OP_ANYLIST_CHECK):
+            direction = LatencyTracker.ALEXA_TO_ANYLIST
+        else:
+            direction = LatencyTracker.ANYLIST_TO_ALEXA
+        self.latency.record(direction, kind, time.time() - seen_at)
+        PROPAGATION_SECONDS.observe(max(0.0, time.time() - seen_at), direction=direction, kind=kind)
+
     def _show_lists(self, title, a, b):
         if isinstance(a, list):
             self.log.debug(f"{title} Anylist: {sorted(a)[:15]}")
@@ -128,18 +326,35 @@ class Synchronizer:
 
     def _are_lists_equal(self, a, b):
         if isinstance(a, list):
-            return sorted(a) == sorted(b)
+            return sorted(map(self._names.key, a)) == sorted(map(self._names.key, b))
         else:
-            anylist_items = sorted({x.name for x in a.items if not x.checked})
-            alexa_items = sorted(set(b))
+            anylist_items = {self._names.key(x.name) for x in a.items if not x.checked}
+            alexa_items = {self._names.key(x) for x in b}
             return anylist_items == alexa_items
 
+    def _name_index(self, names):
+        return NameIndex(self._names, names)
+
+    def _anylist_items_by_key(self, lst):
+        # Prefer unchecked items when the same name shows up more than once
+        items = {}
+        for item in lst:
+            key = self._names.key(item.name)
+            if key not in items or (items[key].checked and not item.checked):
+                items[key] = item
+        return items
+
     def _get_fresh_lists(self):
         self.log.info("Getting fresh lists")
-        a, b = (
-            self.anylist.refresh(),
-            self.alexa.get_alexa_list(refresh=True)
-        )
+        with blame(SIDE_ANYLIST), time_phase('anylist_fetch'):
+            a = self.anylist.refresh()
+            # The websocket keeps changing the list in place, the diff and the
+            # baseline must both be what it was now, not after the Alexa scrape
+            self._anylist_snapshot = ListSnapshot.from_list(a)
+        self._anylist_seen_at = time.time()
+        with blame(SIDE_ALEXA):
+            b = self._get_alexa_list()
+        self._alexa_seen_at = time.time()
         self._show_lists("Fresh", a, b)
         return a, b
         # return (
@@ -147,6 +362,28 @@ class Synchronizer:
         #     self.alexa.get_alexa_list()
         # )
 
+    def _get_alexa_list(self):
+        # Most cycles are idle, skip the full scrape when the probe says nothing
+        # changed, but still do one every so often to catch anything it missed
+        probe = getattr(self.alexa, 'alexa_list_unchanged', None)
+
+        def unchanged():
+            with time_phase('alexa_probe'):
+                return probe()
+
+        if (callable(probe)
+                and self._cycles_since_full_scrape is not None
+                and self._cycles_since_full_scrape + 1 < self._alexa_full_scrape_every
+                and unchanged()):
+            self._cycles_since_full_scrape += 1
+            self.log.debug("Alexa list looks unchanged, skipping full scrape")
+            return self._alexa_list[:]
+
+        with time_phase('alexa_scrape'):
+            alexa_list = self.alexa.get_alexa_list(refresh=True)
+        self._cycles_since_full_scrape = 0
+        return alexa_list
+
     # Match the format of text written in Anylist to reduce duplicate entries
     def standardize_text(self, text):
         if not text:
@@ -155,12 +392,29 @@ class Synchronizer:
 
     def _refresh_baselines(self):
         self._anylist_list, self._alexa_list = self._get_fresh_lists()
-        self._old_anylist_list = self._anylist_list
-        self._old_alexa_list = self._alexa_list
+        self._seed_baselines()
 
     def _seed_baselines(self):
-        self._old_anylist_list = self._anylist_list
-        self._old_alexa_list = self._alexa_list
+        # The copy taken when the list was fetched, anything changed since must still be diffed
+        self._old_anylist_list = self._anylist_snapshot
+        self._old_alexa_list = self._alexa_list[:]
+        self._baseline.save(self._old_anylist_list, self._old_alexa_list)
+
+    def _restore_baselines(self):
+        baseline = self._baseline.load()
+        if baseline is None:
+            return False
+
+        anylist_list, alexa_list = baseline
+        list_id = getattr(self._anylist_list, 'identifier', None)
+        if anylist_list.identifier and list_id and anylist_list.identifier != list_id:
+            self.log.warning("Saved baseline belongs to a different Anylist list, ignoring it")
+            return False
+
+        self.log.debug(f"Restored baseline with {len(anylist_list)} Anylist and {len(alexa_list)} Alexa items")
+        self._old_anylist_list = anylist_list
+        self._old_alexa_list = alexa_list
+        return True
 
     def _list_get_item_by_id(self, lst, item_id):
         getter = getattr(lst, 'get_item_by_id', None)
@@ -178,13 +432,68 @@ class Synchronizer:
         if updated_list is None:
             raise Exception(f"Failed to {action} {item_name} in Alexa")
 
-        has_item = item_name in updated_list
+        has_item = item_name in self._name_index(updated_list)
         if has_item != present:
             state = 'present' if present else 'absent'
             raise Exception(f"Failed to {action} {item_name} in Alexa: item not {state} after update")
 
         return updated_list
 
+    def _mutate_alexa(self, operation, new_alexa_list, action, expected, call, *args):
+        """Makes a change on Alexa, returns what the list looks like after it.
+
+        By default every change is checked against the list Alexa returns. With
+        alexa_verify_every above 1 the change is applied to new_alexa_list
+        instead, and Alexa is only scraped to check them every that many
+        changes, when one doesn't find its item, and at the end of the batch.
+        """
+        op = operation['op']
+        if self._alexa_verify_every <= 1:
+            with time_phase(op):
+                updated_list = call(*args)
+            for name, present in expected:
+                updated_list = self._require_alexa_item_state(updated_list, name, present, action)
+            self._record_latency(operation)
+            return updated_list
+
+        with time_phase(op):
+            found = call(*args, scrape=False)
+        self._unverified.append((operation, action, expected, call, args))
+        new_alexa_list = self._apply_to_names(new_alexa_list, operation)
+        if not found:
+            self.log.warning(f"Couldn't {action} {args[0]} in Alexa, checking what it looks like")
+            return self._verify_alexa()
+        if len(self._unverified) >= self._alexa_verify_every:
+            return self._verify_alexa()
+        return new_alexa_list
+
+    def _verify_alexa(self):
+        """Scrapes Alexa to check the unverified changes, and makes those that didn't stick again."""
+        unverified, self._unverified = self._unverified, []
+        with time_phase('alexa_verify'):
+            # From the top of a refreshed page, or changes above where the page is scrolled go unseen
+            alexa_list = self.alexa.get_alexa_list(refresh=True)
+        if alexa_list is None:
+            raise Exception("Failed to read the Alexa list to check the changes made to it")
+
+        alexa_items = self._name_index(alexa_list)
+        failed = [
+            change for change in unverified
+            if any((name in alexa_items) != present for name, present in change[2])
+        ]
+        ALEXA_VERIFICATIONS.inc(result='mismatch' if failed else 'ok')
+        for operation, action, expected, call, args in failed:
+            # Done again the slow way, checking the list it returns
+            self.log.warning(f"{action} of {args[0]} didn't stick in Alexa, trying again")
+            with time_phase(operation['op']):
+                alexa_list = call(*args)
+            for name, present in expected:
+                alexa_list = self._require_alexa_item_state(alexa_list, name, present, action)
+        # Only now are the changes known to have reached Alexa
+        for operation, *_ in unverified:
+            self._record_latency(operation)
+        return alexa_list
+
     def _run_pending_transaction_if_needed(self):
         if not self._journal.is_dirty:
             return
@@ -197,123 +506,241 @@ class Synchronizer:
             self._journal.reset()
             self._journal.save()
 
+    def _outbox_pending(self):
+        return self._outbox is not None and len(self._outbox) > 0
+
+    def _drain_outbox(self):
+        """Applies the next batch of queued Alexa operations, returns whether there were any."""
+        operations = self._outbox.peek(self._outbox_batch)
+        self.log.info(f"Applying {len(operations)} of {len(self._outbox)} queued changes to Alexa")
+
+        # Journal the batch like any other transaction, in case we die halfway through
+        self._journal.reset()
+        for operation in operations:
+            self._journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, operation)
+        self._journal.save()
+        self._alexa_list = self._execute_operations(operations)
+        self._journal.reset()
+        self._journal.save()
+        self._outbox.done(len(operations))
+
+        # Alexa had these changes made by us, they shouldn't look like changes made on Alexa
+        for operation in operations:
+            self._old_alexa_list = self._apply_to_names(self._old_alexa_list, operation)
+        if isinstance(self._old_anylist_list, ListSnapshot):
+            self._baseline.save(self._old_anylist_list, self._old_alexa_list)
+        return True
+
+    def _apply_to_names(self, names, operation):
+        op = operation.get('op')
+        if op == Synchronizer.OP_ALEXA_ADD:
+            remove, add = None, operation['name']
+        elif op == Synchronizer.OP_ALEXA_REMOVE:
+            remove, add = operation['name'], None
+        elif op == Synchronizer.OP_ALEXA_RENAME:
+            remove, add = operation['old'], operation['new']
+        else:
+            return names
+
+        names = [name for name in names if remove is None or self._names.key(name) != self._names.key(remove)]
+        if add is not None and add not in self._name_index(names):
+            names.append(add)
+        return names
+
     def _clobber_alexa(self):
         self.log.info("Clobbering Alexa with Anylist")
-        new_alexa_list = self._alexa_list[:]
-        # Anylist is the master list, add or delete items from Alexa
-        for item in self._anylist_list:
-            if item.checked and item.name in new_alexa_list:
-                self.log.debug(f" -> Removing {item.name} from Alexa")
-                updated_list = self.alexa.remove_alexa_list_item(item.name)
-                if updated_list is None:
-                    raise Exception(f"Failed to remove {item.name} from Alexa")
-                new_alexa_list = updated_list
-            elif not item.checked and item.name not in new_alexa_list:
-                self.log.debug(f" -> Adding {item.name} to Alexa")
-                updated_list = self.alexa.add_alexa_list_item(item.name)
-                if updated_list is None:
-                    raise Exception(f"Failed to add {item.name} to Alexa")
-                new_alexa_list = updated_list
-
-        # If there's anything in the Alexa list that's not in the Anylist, delete it
-        # the [:] is to make a copy of the list so we can remove items from it while iterating
-        for item in new_alexa_list[:]:
-            if not self._anylist_list.get_item_by_name(item):
-                self.log.debug(f" -> Removing {item} from Alexa")
-                updated_list = self.alexa.remove_alexa_list_item(item)
-                if updated_list is None:
-                    raise Exception(f"Failed to remove {item} from Alexa")
-                new_alexa_list = updated_list
+        operations = self._plan_clobber()
 
-        self._alexa_list = new_alexa_list
-        self._old_anylist_list = self._anylist_list
-        self._old_alexa_list = self._alexa_list
+        # Journal the plan, so a crash halfway through doesn't start it all over
+        self._journal.reset()
+        for operation in operations:
+            self._journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, operation)
+        self._journal.save()
+
+        self._alexa_list = self._execute_operations(operations)
+        self._journal.reset()
+        self._journal.save()
+        self._seed_baselines()
+
+    def _plan_clobber(self):
+        # Anylist is the master list, Alexa should end up with exactly its unchecked items
+        wanted = self._name_index([])
+        wanted_names = []
+        for item in self._anylist_snapshot:
+            if not item.checked and item.name not in wanted:
+                wanted.add(item.name)
+                wanted_names.append(item.name)
+        alexa_items = self._name_index(self._alexa_list)
+        to_add = [name for name in wanted_names if name not in alexa_items]
+        to_remove = []
+        for name in self._alexa_list:
+            if name not in wanted and name not in to_remove:
+                to_remove.append(name)
+
+        # A remove and an add of nearly the same name is most likely the same
+        # item, a single rename does the job for half the price
+        operations = []
+        for old_name, new_name in self._pair_renames(to_remove, to_add):
+            operations.append(self._new_operation(Synchronizer.OP_ALEXA_RENAME, old=old_name, new=new_name))
+            to_remove.remove(old_name)
+            to_add.remove(new_name)
+        for name in to_remove:
+            operations.append(self._new_operation(Synchronizer.OP_ALEXA_REMOVE, name=name))
+        for name in to_add:
+            operations.append(self._new_operation(Synchronizer.OP_ALEXA_ADD, name=name))
+
+        renames = len(operations) - len(to_remove) - len(to_add)
+        self.log.info(
+            f"Clobber plan: {len(to_add)} adds, {len(to_remove)} removes, {renames} renames "
+            f"({len(operations)} Alexa operations, {renames} saved by renames)"
+        )
+        return operations
+
+    def _pair_renames(self, old_names, new_names):
+        if len(old_names) * len(new_names) > Synchronizer.CLOBBER_RENAME_MAX_COMPARISONS:
+            return []
+
+        candidates = []
+        new_keys = [(new_name, self._names.key(new_name)) for new_name in new_names]
+        for old_name in old_names:
+            old_key = self._names.key(old_name)
+            for new_name, new_key in new_keys:
+                limit = min(Synchronizer.CLOBBER_RENAME_MAX_DISTANCE, max(len(old_key), len(new_key)) // 3)
+                distance = edit_distance(old_key, new_key, limit)
+                if distance <= limit:
+                    candidates.append((distance, old_name, new_name))
+
+        # Closest pairs first, each name can only be used once
+        pairs = []
+        used_old, used_new = set(), set()
+        for _, old_name, new_name in sorted(candidates, key=lambda c: c[0]):
+            if old_name in used_old or new_name in used_new:
+                continue
+            used_old.add(old_name)
+            used_new.add(new_name)
+            pairs.append((old_name, new_name))
+        return pairs
 
     def sync(self):
+        """Runs one sync cycle, returns whether either list had changed."""
+        # Let the Alexa driver know where cycles start and end, for its diagnostics
+        start_cycle = getattr(self.alexa, 'start_cycle', None)
+        finish_cycle = getattr(self.alexa, 'finish_cycle', None)
+        if callable(start_cycle):
+            start_cycle()
+        failed = True
+        try:
+            changed = self._sync()
+            failed = False
+            return changed
+        finally:
+            if callable(finish_cycle):
+                finish_cycle(failed=failed)
+
+    def _sync(self):
         self._run_pending_transaction_if_needed()
+        drained = self._drain_outbox() if self._outbox_pending() else False
         self._show_lists("Old", self._old_anylist_list, self._old_alexa_list)
 
         self.log.info("Syncing lists")
         self._anylist_list, self._alexa_list = self._get_fresh_lists()
 
-        if self._are_lists_equal(self._anylist_list, self._alexa_list):
+        if self._are_lists_equal(self._anylist_snapshot, self._alexa_list):
             self._seed_baselines()
             self.log.info("Lists are already in sync")
-            return
+            return drained
 
         self._prepare_transaction()
         self._commit_transaction()
         self.log.info("Sync complete")
+        return True
 
     def _prepare_transaction(self):
-        # Let's start the transaction
-        self._journal.reset()
+        with time_phase('diff'):
+            # Let's start the transaction
+            self._journal.reset()
 
-        # Let's see what's changed in Anylist
-        for item in self._anylist_list:
-            if item in self._old_anylist_list:
-                old_item = self._list_get_item_by_id(self._old_anylist_list, item.identifier)
-                if old_item is None:
-                    continue
-                if self._item_checked(item) != self._item_checked(old_item):
-                    if self._item_checked(item):
-                        self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_CHECKED_ITEMS, item.identifier)
-                    else:
-                        self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_UNCHECKED_ITEMS, item.identifier)
-                elif self._item_name(item) != self._item_name(old_item):
-                    self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_RENAMED_ITEMS, item.identifier)
-            elif not item.checked:
-                # if it's new but checked, we don't care
-                self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_NEW_ITEMS, item.identifier)
-        for item in self._old_anylist_list:
-            if item not in self._anylist_list:
-                self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_DELETED_ITEMS, item.identifier)
-
-        # Now let's see what's changed in Alexa
-        for item in self._alexa_list:
-            if item not in self._old_alexa_list:
-                self._journal.add(Synchronizer.JOURNAL_KEY_ALEXA_NEW_ITEMS, item)
-        for item in self._old_alexa_list:
-            if item not in self._alexa_list:
-                self._journal.add(Synchronizer.JOURNAL_KEY_ALEXA_DELETED_ITEMS, item)
+            # Let's see what's changed in Anylist
+            for item in self._anylist_snapshot:
+                if item in self._old_anylist_list:
+                    old_item = self._list_get_item_by_id(self._old_anylist_list, item.identifier)
+                    if old_item is None:
+                        continue
+                    if self._item_checked(item) != self._item_checked(old_item):
+                        if self._item_checked(item):
+                            self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_CHECKED_ITEMS, item.identifier)
+                        else:
+                            self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_UNCHECKED_ITEMS, item.identifier)
+                    elif self._names.key(self._item_name(item)) != self._names.key(self._item_name(old_item)):
+                        # Only renames Alexa can tell apart, 'milk' -> 'Milk' isn't worth a round trip
+                        self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_RENAMED_ITEMS, item.identifier)
+                elif not item.checked:
+                    # if it's new but checked, we don't care
+                    self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_NEW_ITEMS, item.identifier)
+            for item in self._old_anylist_list:
+                if item not in self._anylist_snapshot:
+                    self._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_DELETED_ITEMS, item.identifier)
+
+            # Now let's see what's changed in Alexa
+            old_alexa_items = self._name_index(self._old_alexa_list)
+            alexa_items = self._name_index(self._alexa_list)
+            for item in self._alexa_list:
+                if item not in old_alexa_items:
+                    self._journal.add(Synchronizer.JOURNAL_KEY_ALEXA_NEW_ITEMS, item)
+            for item in self._old_alexa_list:
+                if item not in alexa_items:
+                    self._journal.add(Synchronizer.JOURNAL_KEY_ALEXA_DELETED_ITEMS, item)
+
+            # Resolve the changes into concrete operations, so a restart only has to
+            # run whatever is still pending
+            for operation in self._plan_operations():
+                self._journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, operation)
 
         # Write the journal, in case something goes wrong
         self._journal.save()
         self.log.debug(f"Transactions: {str(self._journal)}")
 
-    def _commit_transaction(self):
-        # Check, just in case...
-        if not self._journal.is_dirty:
-            self.log.info("Nothing to do")
-            return
+    def _new_operation(self, op, **payload):
+        return dict(payload, op=op, state=Synchronizer.OP_STATE_PENDING)
+
+    def _plan_operations(self):
+        operations = []
+        # Keep track of what Alexa will look like after each operation, so we
+        # don't plan operations that cancel out or do nothing
+        alexa_items = self._name_index(self._alexa_list)
+
+        # Remember when and what kind of change each operation comes from, to
+        # measure how long it takes to show up on the other side
+        def anylist_change(op, kind, **payload):
+            return self._new_operation(op, kind=kind, seen_at=self._anylist_seen_at, **payload)
+
+        def alexa_change(op, kind, **payload):
+            return self._new_operation(op, kind=kind, seen_at=self._alexa_seen_at, **payload)
+
+        def alexa_add(name):
+            if name not in alexa_items:
+                operations.append(anylist_change(Synchronizer.OP_ALEXA_ADD, LatencyTracker.KIND_ADD, name=name))
+                alexa_items.add(name)
+
+        def alexa_remove(name, kind):
+            # Use Alexa's spelling, that's what we'll have to find on the page
+            alexa_name = alexa_items.get(name)
+            if alexa_name is not None:
+                operations.append(anylist_change(Synchronizer.OP_ALEXA_REMOVE, kind, name=alexa_name))
+                alexa_items.discard(alexa_name)
 
-        self.log.debug("Committing transaction...")
-        new_alexa_list = self._alexa_list[:]
-        # Ok, now we make the changes
         for item_id in self._journal.get(Synchronizer.JOURNAL_KEY_ANYLIST_NEW_ITEMS):
             item = self._anylist_list.get_item_by_id(item_id)
-            if item is None:
-                continue
-            if item.name not in new_alexa_list:
-                self.log.debug(f" -> Adding {item.name} to Alexa")
-                updated_list = self.alexa.add_alexa_list_item(item.name)
-                new_alexa_list = self._require_alexa_item_state(updated_list, item.name, True, 'add')
+            if item is not None:
+                alexa_add(item.name)
         for item_id in self._journal.get(Synchronizer.JOURNAL_KEY_ANYLIST_CHECKED_ITEMS):
             item = self._anylist_list.get_item_by_id(item_id)
-            if item is None:
-                continue
-            if item.name in new_alexa_list:
-                self.log.debug(f" -> Removing {item.name} from Alexa")
-                updated_list = self.alexa.remove_alexa_list_item(item.name)
-                new_alexa_list = self._require_alexa_item_state(updated_list, item.name, False, 'remove')
+            if item is not None:
+                alexa_remove(item.name, LatencyTracker.KIND_CHECK)
         for item_id in self._journal.get(Synchronizer.JOURNAL_KEY_ANYLIST_UNCHECKED_ITEMS):
             item = self._anylist_list.get_item_by_id(item_id)
-            if item is None:
-                continue
-            if item.name not in new_alexa_list:
-                self.log.debug(f" -> Adding {item.name} to Alexa")
-                updated_list = self.alexa.add_alexa_list_item(item.name)
-                new_alexa_list = self._require_alexa_item_state(updated_list, item.name, True, 'add')
+            if item is not None:
+                alexa_add(item.name)
         for item_id in self._journal.get(Synchronizer.JOURNAL_KEY_ANYLIST_RENAMED_ITEMS):
             item = self._anylist_list.get_item_by_id(item_id)
             if item is None:
@@ -321,42 +748,133 @@ class Synchronizer:
             old_item = self._list_get_item_by_id(self._old_anylist_list, item.identifier)
             if old_item is None:
                 continue
-            old_name = self._item_name(old_item)
+            old_name = alexa_items.get(self._item_name(old_item))
             item_name = self._item_name(item)
-            if old_name in new_alexa_list and item_name not in new_alexa_list:
-                self.log.debug(f" -> Updating {old_name} to {item_name} in Alexa")
-                updated_list = self.alexa.update_alexa_list_item(old_name, item_name)
-                updated_list = self._require_alexa_item_state(updated_list, old_name, False, 'rename')
-                new_alexa_list = self._require_alexa_item_state(updated_list, item_name, True, 'rename')
+            if old_name is not None and item_name not in alexa_items:
+                operations.append(anylist_change(
+                    Synchronizer.OP_ALEXA_RENAME, LatencyTracker.KIND_RENAME, old=old_name, new=item_name
+                ))
+                alexa_items.discard(old_name)
+                alexa_items.add(item_name)
         for item_id in self._journal.get(Synchronizer.JOURNAL_KEY_ANYLIST_DELETED_ITEMS):
             item = self._list_get_item_by_id(self._old_anylist_list, item_id)
-            if item is None:
-                continue
-            item_name = self._item_name(item)
-            if item_name in new_alexa_list:
-                self.log.debug(f" -> Removing {item_name} from Alexa")
-                updated_list = self.alexa.remove_alexa_list_item(item_name)
-                new_alexa_list = self._require_alexa_item_state(updated_list, item_name, False, 'remove')
-
-        for item in self._journal.get(Synchronizer.JOURNAL_KEY_ALEXA_NEW_ITEMS):
-            # Alexa adds items in all lowercase, let's capitalize the first letter to reduce duplicates on Anylist
-            s_item = self.standardize_text(item)
-            if item != s_item:
-                updated_list = self.alexa.update_alexa_list_item(item, s_item)
-                updated_list = self._require_alexa_item_state(updated_list, item, False, 'rename')
-                new_alexa_list = self._require_alexa_item_state(updated_list, s_item, True, 'rename')
-                item = s_item
-            anylist_item = self._anylist_list.get_item_by_name(item)
+            if item is not None:
+                alexa_remove(self._item_name(item), LatencyTracker.KIND_DELETE)
+
+        alexa_new_items = self._journal.get(Synchronizer.JOURNAL_KEY_ALEXA_NEW_ITEMS)
+        alexa_deleted_items = self._journal.get(Synchronizer.JOURNAL_KEY_ALEXA_DELETED_ITEMS)
+        if alexa_new_items or alexa_deleted_items:
+            anylist_items = self._anylist_items_by_key(self._anylist_list)
+        for item in alexa_new_items:
+            anylist_item = anylist_items.get(self._names.key(item))
+            if anylist_item is None:
+                # Alexa adds items in all lowercase, let's capitalize the first letter to reduce duplicates on Anylist
+                operations.append(alexa_change(
+                    Synchronizer.OP_ANYLIST_ADD, LatencyTracker.KIND_ADD, name=self.standardize_text(item)
+                ))
+            elif anylist_item.checked:
+                operations.append(alexa_change(Synchronizer.OP_ANYLIST_ADD, LatencyTracker.KIND_ADD, name=anylist_item.name))
+        for item in alexa_deleted_items:
+            anylist_item = anylist_items.get(self._names.key(item))
+            if anylist_item is not None:
+                operations.append(alexa_change(
+                    Synchronizer.OP_ANYLIST_CHECK, LatencyTracker.KIND_DELETE, name=anylist_item.name
+                ))
+
+        return operations
+
+    def _execute_operation(self, operation, new_alexa_list):
+        op = operation.get('op')
+        if op == Synchronizer.OP_ALEXA_ADD:
+            name = operation['name']
+            if name not in self._name_index(new_alexa_list):
+                self.log.debug(f" -> Adding {name} to Alexa")
+                new_alexa_list = self._mutate_alexa(
+                    operation, new_alexa_list, 'add', [(name, True)], self.alexa.add_alexa_list_item, name
+                )
+        elif op == Synchronizer.OP_ALEXA_REMOVE:
+            name = self._name_index(new_alexa_list).get(operation['name'])
+            if name is not None:
+                self.log.debug(f" -> Removing {name} from Alexa")
+                new_alexa_list = self._mutate_alexa(
+                    operation, new_alexa_list, 'remove', [(name, False)], self.alexa.remove_alexa_list_item, name
+                )
+        elif op == Synchronizer.OP_ALEXA_RENAME:
+            alexa_items = self._name_index(new_alexa_list)
+            old_name, new_name = alexa_items.get(operation['old']), operation['new']
+            if old_name is not None and new_name not in alexa_items:
+                self.log.debug(f" -> Updating {old_name} to {new_name} in Alexa")
+                new_alexa_list = self._mutate_alexa(
+                    operation, new_alexa_list, 'rename', [(old_name, False), (new_name, True)],
+                    self.alexa.update_alexa_list_item, old_name, new_name
+                )
+        elif op == Synchronizer.OP_ANYLIST_ADD:
+            name = operation['name']
+            anylist_item = self._anylist_list.get_item_by_name(name)
             if not anylist_item or anylist_item.checked:
-                self.log.debug(f" -> Adding {item} to Anylist")
-                self._anylist_list.add_or_uncheck_item(item)
-        for item in self._journal.get(Synchronizer.JOURNAL_KEY_ALEXA_DELETED_ITEMS):
-            if self._anylist_list.get_item_by_name(item):
-                self.log.debug(f" -> Checking {item} in Anylist")
-                self._anylist_list.check_item(item)
+                self.log.debug(f" -> Adding {name} to Anylist")
+                with time_phase(op):
+                    self._anylist_list.add_or_uncheck_item(name)
+                self._record_latency(operation)
+        elif op == Synchronizer.OP_ANYLIST_CHECK:
+            name = operation['name']
+            if self._anylist_list.get_item_by_name(name):
+                self.log.debug(f" -> Checking {name} in Anylist")
+                with time_phase(op):
+                    self._anylist_list.check_item(name)
+                self._record_latency(operation)
+        else:
+            self.log.warning(f"Skipping unknown operation {operation}")
+
+        return new_alexa_list
+
+    def _execute_operations(self, operations):
+        new_alexa_list = self._alexa_list[:]
+        self._unverified = []
+        # Done, but only marked so once Alexa was checked, a crash before then makes them again
+        unmarked = []
+        for operation in operations:
+            if operation.get('state') == Synchronizer.OP_STATE_DONE:
+                continue
+            # So the server knows which client to fix if this fails
+            side = SIDE_ALEXA if operation.get('op', '').startswith('alexa_') else SIDE_ANYLIST
+            with blame(side):
+                new_alexa_list = self._execute_operation(operation, new_alexa_list)
+            unmarked.append(operation)
+            if not self._unverified:
+                self._mark_done(unmarked)
+                unmarked = []
+        if self._unverified:
+            with blame(SIDE_ALEXA):
+                new_alexa_list = self._verify_alexa()
+            self._mark_done(unmarked)
+        return new_alexa_list
+
+    def _mark_done(self, operations):
+        # The operations are shared with the journal, so this records our progress
+        for operation in operations:
+            operation['state'] = Synchronizer.OP_STATE_DONE
+        self._journal.save()
+
+    def _commit_transaction(self):
+        # Check, just in case...
+        if not self._journal.is_dirty:
+            self.log.info("Nothing to do")
+            return
+
+        operations = self._journal.get(Synchronizer.JOURNAL_KEY_OPERATIONS)
+        if not operations:
+            # Older journals only recorded item ids, resolve them against the current lists
+            operations = self._plan_operations()
+        pending = [op for op in operations if op.get('state') != Synchronizer.OP_STATE_DONE]
+
+        self.log.debug(f"Committing transaction ({len(pending)} of {len(operations)} operations pending)...")
+        new_alexa_list = self._execute_operations(operations)
 
         self._journal.reset()
         self._journal.save()
         self.log.debug("Transaction committed.")
+        if pending and self._latency is not None:
+            self.log.info(f"Propagation latency: {self._latency.format_summary()}")
         self._alexa_list = new_alexa_list
         self._refresh_baselines()
@@ -0,0 +1,360 @@
+"""Local stand-in for the Alexa shopping list page, for tests and benchmarks.
+
+Serves a page with the same DOM structure alexa.py drives on Amazon:
+
+    .list-header .add-symbol              opens the add form
+    .list-header .input-box input         name of the new item
+    .list-header .add-to-list button      adds it to the top of the list
+    .list-header .cancel-input            closes the add form
+    .virtual-list .inner                  one row per rendered item
+    .inner .item-title                    item name
+    .inner .item-actions-1 button         edit (rename) the item
+    .inner .item-actions-2 button         delete, or save while editing
+    .inner .input-box input               new name while editing
+
+Like the real page the list is virtual: only the rows around the viewport
+are in the DOM and they are re-rendered as the window scrolls. The items are
+loaded and changed through a small JSON API, so the state survives reloads
+and can be inspected from the test. The page fetches them again when its tab
+becomes visible. render_delay (how long the page takes to re-render after a
+scroll or change) and network_delay (added to every API call) simulate a slow
+page.
+
+Point the driver at it with AlexaShoppingList(base_url=server.url), or run it
+standalone with `python -m tests.fake_alexa_server`.
+"""
+
+from __future__ import annotations
+
+import collections
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+LIST_PATH = "/alexaquantum/sp/alexaShoppingList"
+
+HOME_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Amazon</title></head>
+<body>
+  <div id="nav-belt"><a id="nav-link-accountList" href="#">Account &amp; Lists</a></div>
+  <a href="LIST_PATH?ref=nav_asl">Alexa Shopping List</a>
+</body>
+</html>
+""".replace("LIST_PATH", LIST_PATH)
+
+LIST_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<title>Alexa Shopping List</title>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  .list-header { padding: 16px; border-bottom: 1px solid #ccc; }
+  .add-form[hidden] { display: none; }
+  .virtual-list { position: relative; }
+  .virtual-list .inner { position: absolute; left: 0; right: 0; display: flex; align-items: center;
+                         padding: 0 16px; box-sizing: border-box; border-bottom: 1px solid #eee; }
+  .virtual-list .item-title, .virtual-list .input-box { flex: 1; }
+</style>
+</head>
+<body>
+<div class="list-header">
+  <h1>Shopping List</h1>
+  <button class="add-symbol">+</button>
+  <div class="add-form" hidden>
+    <div class="input-box"><input type="text"></div>
+    <div class="add-to-list"><button>Add</button></div>
+    <button class="cancel-input">Cancel</button>
+  </div>
+</div>
+<div class="virtual-list"></div>
+<script>
+(function () {
+  const config = __CONFIG__;
+  const list = document.querySelector('.virtual-list');
+  const addForm = document.querySelector('.list-header .add-form');
+  const addInput = addForm.querySelector('.input-box input');
+  let items = [];
+  let editingId = null;
+  let editValue = '';
+  let renderTimer = null;
+
+  function request(method, body) {
+    return fetch('/api/items', {
+      method: method,
+      headers: {'Content-Type': 'application/json'},
+      body: body ? JSON.stringify(body) : undefined,
+    }).then((response) => response.json()).then((data) => {
+      items = data;
+      scheduleRender();
+    });
+  }
+
+  function scheduleRender() {
+    if (renderTimer !== null) return;
+    renderTimer = setTimeout(() => {
+      renderTimer = null;
+      render();
+    }, config.renderDelay);
+  }
+
+  function button(label, onClick) {
+    const el = document.createElement('button');
+    el.textContent = label;
+    el.addEventListener('click', onClick);
+    return el;
+  }
+
+  function row(item, index) {
+    const inner = document.createElement('div');
+    inner.className = 'inner';
+    inner.style.top = (index * config.rowHeight) + 'px';
+    inner.style.height = config.rowHeight + 'px';
+
+    const actions1 = document.createElement('div');
+    actions1.className = 'item-actions-1';
+    const actions2 = document.createElement('div');
+    actions2.className = 'item-actions-2';
+
+    if (item.id === editingId) {
+      const box = document.createElement('div');
+      box.className = 'input-box';
+      const input = document.createElement('input');
+      input.type = 'text';
+      input.value = editValue;
+      input.addEventListener('input', () => { editValue = input.value; });
+      box.appendChild(input);
+      inner.appendChild(box);
+      actions1.appendChild(button('Cancel', () => { editingId = null; render(); }));
+      actions2.appendChild(button('Update', () => {
+        editingId = null;
+        request('POST', {op: 'rename', id: item.id, name: editValue});
+      }));
+    } else {
+      const title = document.createElement('div');
+      title.className = 'item-title';
+      title.textContent = item.name;
+      inner.appendChild(title);
+      actions1.appendChild(button('Edit', () => {
+        editingId = item.id;
+        editValue = item.name;
+        render();
+      }));
+      actions2.appendChild(button('Delete', () => request('POST', {op: 'remove', id: item.id})));
+    }
+
+    inner.appendChild(actions1);
+    inner.appendChild(actions2);
+    return inner;
+  }
+
+  function render() {
+    list.style.height = (items.length * config.rowHeight) + 'px';
+    const top = window.scrollY - list.offsetTop;
+    const first = Math.max(0, Math.floor(top / config.rowHeight) - config.overscan);
+    const last = Math.min(items.length, Math.ceil((top + window.innerHeight) / config.rowHeight) + config.overscan);
+    const rows = [];
+    for (let i = first; i < last; i++) {
+      rows.push(row(items[i], i));
+    }
+    list.replaceChildren(...rows);
+  }
+
+  document.querySelector('.list-header .add-symbol').addEventListener('click', () => {
+    addForm.hidden = false;
+    addInput.focus();
+  });
+  document.querySelector('.list-header .add-to-list button').addEventListener('click', () => {
+    const name = addInput.value.trim();
+    addInput.value = '';
+    if (name) request('POST', {op: 'add', name: name});
+  });
+  document.querySelector('.list-header .cancel-input').addEventListener('click', () => {
+    addInput.value = '';
+    addForm.hidden = true;
+  });
+  window.addEventListener('scroll', scheduleRender, {passive: true});
+  window.addEventListener('resize', scheduleRender);
+  // Fetches the items again when the tab is shown, like the app does
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'visible') request('GET');
+  });
+
+  request('GET');
+})();
+</script>
+</body>
+</html>
+"""
+
+
+class FakeAlexaServer:
+
+    def __init__(self, items=(), render_delay=0.0, network_delay=0.0, row_height=56, overscan=4,
+                 host="127.0.0.1", port=0):
+        # Seconds the page waits before re-rendering the list
+        self.render_delay = render_delay
+        # Seconds added to every API call
+        self.network_delay = network_delay
+        self.row_height = row_height
+        self.overscan = overscan
+        self.request_counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._items = []
+        self.set_items(items)
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    # ============================================================
+    # Lifecycle
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def list_url(self):
+        return f"{self.url}{LIST_PATH}?ref=nav_asl"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # ============================================================
+    # Test controls
+
+    def set_items(self, names):
+        """Replaces the list, as if it was changed by voice. Shows up on the next reload."""
+        with self._lock:
+            self._items = [{"id": str(next(self._ids)), "name": name} for name in names]
+
+    def items(self):
+        with self._lock:
+            return [item["name"] for item in self._items]
+
+    # ============================================================
+    # Page and API
+
+    def _page(self):
+        config = {
+            "renderDelay": int(self.render_delay * 1000),
+            "rowHeight": self.row_height,
+            "overscan": self.overscan,
+        }
+        return LIST_PAGE.replace("__CONFIG__", json.dumps(config))
+
+    def _apply(self, change):
+        with self._lock:
+            op = change.get("op")
+            if op == "add":
+                # Alexa puts new items at the top
+                self._items.insert(0, {"id": str(next(self._ids)), "name": change["name"]})
+                return True
+            index = next((i for i, item in enumerate(self._items) if item["id"] == change.get("id")), None)
+            if index is None:
+                return False
+            if op == "rename":
+                self._items[index]["name"] = change["name"]
+            elif op == "remove":
+                del self._items[index]
+            else:
+                return False
+            return True
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body, content_type):
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply_items(self):
+                with server._lock:
+                    items = [dict(item) for item in server._items]
+                self._reply(200, json.dumps(items), "application/json")
+
+            def do_GET(self):
+                path = urllib.parse.urlsplit(self.path).path
+                server.request_counts[path] += 1
+                if path == "/":
+                    return self._reply(200, HOME_PAGE, "text/html; charset=utf-8")
+                if path == LIST_PATH:
+                    return self._reply(200, server._page(), "text/html; charset=utf-8")
+                if path == "/api/items":
+                    time.sleep(server.network_delay)
+                    return self._reply_items()
+                return self._reply(404, "not found", "text/plain")
+
+            def do_POST(self):
+                path = urllib.parse.urlsplit(self.path).path
+                server.request_counts[path] += 1
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if path != "/api/items":
+                    return self._reply(404, "not found", "text/plain")
+                time.sleep(server.network_delay)
+                try:
+                    change = json.loads(body or b"{}")
+                except ValueError:
+                    return self._reply(400, "invalid json", "text/plain")
+                if not server._apply(change):
+                    return self._reply(400, "invalid change", "text/plain")
+                return self._reply_items()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--items", type=int, default=100, help="number of items to seed the list with")
+    parser.add_argument("--render-delay", type=float, default=0.0)
+    parser.add_argument("--network-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeAlexaServer(
+        items=[f"Item {i}" for i in range(args.items)],
+        render_delay=args.render_delay,
+        network_delay=args.network_delay,
+        port=args.port,
+    )
+    print(f"Fake Alexa list at {fake.list_url}")
+    fake.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,437 @@
+"""Local stand-in for www.anylist.com, for tests and benchmarks.
+
+Speaks the same protobuf and websocket protocol as the parts of the AnyList
+API that anylist.py uses:
+
+    POST /auth/token                  email/password -> JSON tokens
+    POST /auth/token/refresh          refresh_token -> JSON tokens
+    POST /data/user-data/get          -> PBUserDataResponse
+    POST /data/shopping-lists/update  multipart 'operations' PBListOperationList
+    GET  /data/add-user-listener      websocket, pushes 'refresh-shopping-lists'
+
+Point the client at it with AnyList(..., api_url=server.url). Latency and
+failures can be injected to see how the client copes.
+
+Run it standalone with `python -m tests.fake_anylist_server`, it needs the
+generated pcov_pb2 module on the path.
+"""
+
+from __future__ import annotations
+
+import base64
+import collections
+import email.parser
+import hashlib
+import itertools
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _WebSocketConnection:
+    """Just enough of RFC 6455 to push text frames and answer pings."""
+
+    def __init__(self, sock, client_id):
+        self.sock = sock
+        self.client_id = client_id
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _send_frame(self, opcode, payload=b""):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_text(self, text):
+        self._send_frame(0x1, text.encode("utf-8"))
+
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("websocket closed")
+            data += chunk
+        return data
+
+    def serve(self):
+        try:
+            while not self.closed:
+                first, second = self._recv_exact(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._recv_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._recv_exact(8))[0]
+                mask = self._recv_exact(4) if second & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(length)))
+                if opcode == 0x8:
+                    self._send_frame(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.closed = True
+
+    def close(self):
+        self._send_frame(0x8, struct.pack("!H", 1000))
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FakeAnyListServer:
+
+    def __init__(self, email="user@example.com", password="password", latency=0.0,
+                 failure_rate=0.0, seed=None, notify_origin=False, pb=None, host="127.0.0.1", port=0):
+        if pb is None:
+            import pcov_pb2 as pb
+        self.pb = pb
+        self.email = email
+        self.password = password
+        # Seconds added to every HTTP response, or a (min, max) range
+        self.latency = latency
+        # Chance of any data request failing with a 500
+        self.failure_rate = failure_rate
+        # Whether the client that made a change also gets a push for it
+        self.notify_origin = notify_origin
+        self.user_id = "fake-user-id"
+        self.request_counts = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._lists = collections.OrderedDict()
+        self._access_tokens = set()
+        self._refresh_tokens = set()
+        self._token_counter = itertools.count(1)
+        self._forced_failures = []
+        self._listeners = []
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    # ============================================================
+    # Lifecycle
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            listeners = self._listeners[:]
+            self._listeners.clear()
+        for listener in listeners:
+            listener.close()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # ============================================================
+    # Test controls
+
+    def add_list(self, name, identifier=None):
+        identifier = identifier or uuid.uuid4().hex
+        with self._lock:
+            self._lists[identifier] = {"identifier": identifier, "name": name, "items": collections.OrderedDict()}
+        return identifier
+
+    def add_item(self, list_id, name, checked=False, notify=True):
+        """Adds an item as if another device did, and tells the listeners."""
+        identifier = uuid.uuid4().hex
+        with self._lock:
+            self._lists[list_id]["items"][identifier] = {
+                "identifier": identifier,
+                "listId": list_id,
+                "name": name,
+                "quantity": "",
+                "details": "",
+                "checked": checked,
+                "category": "",
+                "userId": self.user_id,
+                "categoryMatchId": "",
+                "manualSortIndex": 0,
+            }
+        if notify:
+            self.notify()
+        return identifier
+
+    def set_checked(self, list_id, name, checked=True, notify=True):
+        with self._lock:
+            for item in self._lists[list_id]["items"].values():
+                if item["name"] == name:
+                    item["checked"] = checked
+        if notify:
+            self.notify()
+
+    def items(self, list_id):
+        with self._lock:
+            return [dict(item) for item in self._lists[list_id]["items"].values()]
+
+    def fail_next(self, count=1, status=500, path=None):
+        """Makes the next count requests (to path, if given) fail with status."""
+        with self._lock:
+            self._forced_failures.extend([(path, status)] * count)
+
+    def expire_tokens(self):
+        """Invalidates all access tokens, so the client has to refresh them."""
+        with self._lock:
+            self._access_tokens.clear()
+
+    def notify(self, exclude_client_id=None):
+        with self._lock:
+            self._listeners = [listener for listener in self._listeners if not listener.closed]
+            listeners = [l for l in self._listeners if l.client_id != exclude_client_id]
+        for listener in listeners:
+            listener.send_text("refresh-shopping-lists")
+
+    @property
+    def listener_count(self):
+        with self._lock:
+            return len([listener for listener in self._listeners if not listener.closed])
+
+    # ============================================================
+    # Protocol
+
+    def _issue_tokens(self):
+        counter = next(self._token_counter)
+        access_token, refresh_token = f"access-{counter}", f"refresh-{counter}"
+        with self._lock:
+            self._access_tokens.add(access_token)
+            self._refresh_tokens.add(refresh_token)
+        return {"access_token": access_token, "refresh_token": refresh_token}
+
+    def _authorized(self, headers):
+        token = (headers.get("Authorization") or "").removeprefix("Bearer ")
+        with self._lock:
+            return token in self._access_tokens
+
+    def _injected_failure(self, path):
+        with self._lock:
+            for index, (failure_path, status) in enumerate(self._forced_failures):
+                if failure_path is None or failure_path == path:
+                    del self._forced_failures[index]
+                    return status
+        if path.startswith("/data/") and self.failure_rate and self._random.random() < self.failure_rate:
+            return 500
+        return None
+
+    def _delay(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def _user_data(self):
+        response = self.pb.PBUserDataResponse()
+        with self._lock:
+            for lst in self._lists.values():
+                pb_list = response.shoppingListsResponse.newLists.add()
+                pb_list.identifier = lst["identifier"]
+                pb_list.name = lst["name"]
+                pb_list.creator = self.user_id
+                for item in lst["items"].values():
+                    pb_item = pb_list.items.add()
+                    for field, value in item.items():
+                        setattr(pb_item, field, value)
+        return response.SerializeToString()
+
+    def _apply_operations(self, data):
+        operations = self.pb.PBListOperationList()
+        operations.ParseFromString(data)
+        setters = {
+            "set-list-item-name": ("name", str),
+            "set-list-item-quantity": ("quantity", str),
+            "set-list-item-details": ("details", str),
+            "set-list-item-checked": ("checked", lambda value: value == "y"),
+            "set-list-item-category-match-id": ("categoryMatchId", str),
+            "set-list-item-sort-order": ("manualSortIndex", int),
+        }
+        with self._lock:
+            for op in operations.operations:
+                lst = self._lists.get(op.listId)
+                if lst is None:
+                    return False
+                handler = op.metadata.handlerId
+                if handler == "add-shopping-list-item":
+                    item = {field: getattr(op.listItem, field) for field in (
+                        "identifier", "listId", "name", "quantity", "details", "checked",
+                        "category", "userId", "categoryMatchId", "manualSortIndex",
+                    )}
+                    lst["items"][item["identifier"]] = item
+                elif handler == "remove-shopping-list-item":
+                    lst["items"].pop(op.listItemId, None)
+                elif handler == "uncheck-all":
+                    for item in lst["items"].values():
+                        item["checked"] = False
+                elif handler in setters:
+                    field, convert = setters[handler]
+                    if op.listItemId in lst["items"]:
+                        lst["items"][op.listItemId][field] = convert(op.updatedValue)
+                else:
+                    return False
+        return True
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=b"", content_type="text/plain"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                path = urllib.parse.urlsplit(self.path).path
+                body = self._read_body()
+                server.request_counts[path] += 1
+                server._delay()
+
+                status = server._injected_failure(path)
+                if status is not None:
+                    return self._reply(status, b"injected failure")
+
+                if path == "/auth/token":
+                    form = urllib.parse.parse_qs(body.decode("utf-8"))
+                    if form.get("email") != [server.email] or form.get("password") != [server.password]:
+                        return self._reply(401, b"invalid credentials")
+                    return self._reply(200, json.dumps(server._issue_tokens()).encode(), "application/json")
+
+                if path == "/auth/token/refresh":
+                    form = urllib.parse.parse_qs(body.decode("utf-8"))
+                    refresh_token = (form.get("refresh_token") or [""])[0]
+                    with server._lock:
+                        valid = refresh_token in server._refresh_tokens
+                        server._refresh_tokens.discard(refresh_token)
+                    if not valid:
+                        return self._reply(401, b"invalid refresh token")
+                    return self._reply(200, json.dumps(server._issue_tokens()).encode(), "application/json")
+
+                if not server._authorized(self.headers):
+                    return self._reply(401, b"unauthorized")
+
+                if path == "/data/user-data/get":
+                    return self._reply(200, server._user_data(), "application/x-protobuf")
+
+                if path == "/data/shopping-lists/update":
+                    message = email.parser.BytesParser().parsebytes(
+                        f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+                    )
+                    parts = {
+                        part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                        for part in message.get_payload()
+                    } if message.is_multipart() else {}
+                    if "operations" not in parts or not server._apply_operations(parts["operations"]):
+                        return self._reply(400, b"invalid operations")
+                    server.notify(
+                        exclude_client_id=None if server.notify_origin
+                        else self.headers.get("X-AnyLeaf-Client-Identifier")
+                    )
+                    return self._reply(200, b"ok")
+
+                return self._reply(404, b"not found")
+
+            def do_GET(self):
+                path = urllib.parse.urlsplit(self.path).path
+                server.request_counts[path] += 1
+                key = self.headers.get("Sec-WebSocket-Key")
+                if path != "/data/add-user-listener" or not key:
+                    return self._reply(404, b"not found")
+                if not server._authorized(self.headers):
+                    return self._reply(401, b"unauthorized")
+
+                accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+                self.send_response(101, "Switching Protocols")
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+
+                listener = _WebSocketConnection(self.connection, self.headers.get("X-AnyLeaf-Client-Identifier"))
+                with server._lock:
+                    server._listeners.append(listener)
+                listener.serve()
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--email", default="user@example.com")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--list-name", default="Groceries")
+    parser.add_argument("--items", type=int, default=10, help="number of items to seed the list with")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeAnyListServer(
+        email=args.email,
+        password=args.password,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        port=args.port,
+    )
+    list_id = fake.add_list(args.list_name)
+    for i in range(args.items):
+        fake.add_item(list_id, f"Item {i}", notify=False)
+    print(f"Fake AnyList listening on {fake.url}")
+    fake.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
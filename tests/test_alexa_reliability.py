@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import contextlib
 import json
 import tempfile
+import types
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -84,6 +86,75 @@ class FakePage:
         return type("Locator", (), {"count": lambda self: 1})()
 
 
+class FakeResponse:
+    def __init__(self, url, method="GET", resource_type="fetch", content_type="application/json", body=None):
+        self.url = url
+        self.request = type("Request", (), {"method": method, "resource_type": resource_type})()
+        self.headers = {"content-type": content_type}
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class RefetchingPage(FakePage):
+    """A list page that fetches its items again if refetch is set, when it's shown."""
+
+    def __init__(self, url, refetch=True, fetch_url="https://www.amazon.co.uk/api/items?page=1"):
+        super().__init__(url)
+        self.refetch = refetch
+        self.fetch_url = fetch_url
+        self.titles = ["Milk", "Eggs"]
+        self.evaluate_calls = 0
+        self.scrolled_to_top = 0
+
+    def list_json(self):
+        return {"items": [{"id": i, "name": title} for i, title in enumerate(self.titles)]}
+
+    @contextlib.contextmanager
+    def expect_response(self, predicate, timeout=None):
+        response_info = types.SimpleNamespace(value=None)
+        yield response_info
+        body = self.list_json() if self.fetch_url.startswith("https://www.amazon.co.uk/api/items") else {"unread": 0}
+        response = FakeResponse(self.fetch_url, body=body)
+        if not (self.refetch and predicate(response)):
+            raise alexa.PWTimeoutError("Timeout waiting for response")
+        response_info.value = response
+
+    def evaluate(self, script):
+        if ".item-title')" in script:
+            return list(self.titles)
+        if "scrollTo(0, 0)" in script:
+            self.scrolled_to_top += 1
+        else:
+            self.evaluate_calls += 1
+
+
+class VirtualListPage(RefetchingPage):
+    """A list page that only renders window items from where it's scrolled to."""
+
+    def __init__(self, url, items, window=10):
+        super().__init__(url)
+        self.items = list(items)
+        self.window = window
+        self.scrolled = 0
+
+    def evaluate(self, script):
+        if ".item-title')" in script:
+            return self.items[self.scrolled:self.scrolled + self.window]
+        if "offsetHeight" in script:
+            return len(self.items)
+        if "scrollHeight" in script:
+            self.scrolled = max(0, len(self.items) - self.window)
+            return None
+        if "scrollTo(0, 0)" in script:
+            self.scrolled = 0
+        return super().evaluate(script)
+
+    def list_json(self):
+        return [{"value": item} for item in self.items]
+
+
 class FakeContext:
     def __init__(self, cookies=None):
         self._cookies = cookies or [{"name": "session", "value": "abc"}]
@@ -143,6 +214,19 @@ class AlexaReliabilityTests(unittest.TestCase):
 
         self.assertEqual(instance._page.reload_calls, 1)
 
+    def test_ensure_on_alexa_list_uses_base_url_override(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance.base_url = "http://127.0.0.1:8081/"
+        instance._page = FakePage(url="http://127.0.0.1:8081")
+
+        instance._ensure_on_alexa_list()
+
+        self.assertEqual(
+            instance._page.goto_calls,
+            [("http://127.0.0.1:8081/alexaquantum/sp/alexaShoppingList?ref=nav_asl", "domcontentloaded")],
+        )
+
     def test_add_alexa_list_item_returns_current_list_when_item_exists(self):
         instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
         instance._get_alexa_list_item_element = lambda item: object()
@@ -203,5 +287,211 @@ class AlexaReliabilityTests(unittest.TestCase):
         self.assertEqual(save_button.click_calls, 1)
 
 
+    def test_alexa_list_unchanged_compares_top_titles_with_last_scrape(self):
+        items = [f"Item {i}" for i in range(15)]
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance.full_reload_every = 1
+        instance._list_fetches = {"/api/items"}
+        instance._page = VirtualListPage(
+            "https://www.amazon.co.uk/alexaquantum/sp/alexaShoppingList?ref=nav_asl", items
+        )
+        instance._last_signature = instance._list_signature(items)
+
+        with patch("alexa.time.sleep"):
+            self.assertTrue(instance.alexa_list_unchanged())
+            # Fetched again without a reload, even when one is due, and left at the top
+            self.assertEqual(instance._page.reload_calls, 0)
+            self.assertEqual(instance._page.scrolled, 0)
+
+            instance._page.items = ["Milk"] + items
+            self.assertFalse(instance.alexa_list_unchanged())
+
+            # Removals below the top of the list are seen too, from anywhere but the end
+            instance._page.items = items[:12] + items[13:]
+            self.assertFalse(instance.alexa_list_unchanged())
+            # and from the end
+            instance._page.items = items[:-1]
+            self.assertFalse(instance.alexa_list_unchanged())
+
+    def test_get_alexa_list_reuses_page_loaded_by_probe(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance._page = FakePage(url="https://www.amazon.co.uk/alexaquantum/sp/alexaShoppingList?ref=nav_asl")
+        instance._page.locator = lambda selector: type("Locator", (), {"all": lambda self: []})()
+        instance._page_fresh = True
+
+        with patch("alexa.time.sleep") as mock_sleep:
+            self.assertEqual(instance.get_alexa_list(refresh=True), [])
+
+        self.assertEqual(instance._page.reload_calls, 0)
+        mock_sleep.assert_not_called()
+        self.assertFalse(instance._page_fresh)
+
+    def test_items_are_looked_for_from_the_top_of_the_list(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance._page = RefetchingPage("https://www.amazon.co.uk/alexaquantum/sp/alexaShoppingList?ref=nav_asl")
+        instance._page.locator = lambda selector: type("Locator", (), {"all": lambda self: [], "count": lambda self: 0})()
+        instance._page_fresh = True
+
+        with patch("alexa.time.sleep"):
+            self.assertIsNone(instance._get_alexa_list_item_element("Milk"))
+
+        self.assertEqual(instance._page.scrolled_to_top, 1)
+        # The page is about to change, the next scrape refreshes it
+        self.assertFalse(instance._page_fresh)
+
+
+class SoftRefreshTests(unittest.TestCase):
+    LIST_URL = "https://www.amazon.co.uk/alexaquantum/sp/alexaShoppingList?ref=nav_asl"
+
+    def instance(self, refetch=True, full_reload_every=3):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance.full_reload_every = full_reload_every
+        instance._page = RefetchingPage(self.LIST_URL, refetch)
+        instance._list_fetches = set()
+        return instance
+
+    def test_only_json_the_list_page_gets_is_recorded(self):
+        instance = self.instance()
+        instance._record_list_fetch(FakeResponse("https://www.amazon.co.uk/api/items"))
+        instance._record_list_fetch(FakeResponse("https://www.amazon.co.uk/api/items/add", method="POST"))
+        instance._record_list_fetch(FakeResponse("https://www.amazon.co.uk/logo.png", content_type="image/png"))
+        instance._page.url = "https://www.amazon.co.uk"
+        instance._record_list_fetch(FakeResponse("https://www.amazon.co.uk/api/account"))
+
+        self.assertEqual(instance._list_fetches, {"/api/items"})
+
+    def test_the_page_is_only_reloaded_every_few_refreshes(self):
+        instance = self.instance()
+        instance._list_fetches = {"/api/items"}
+
+        with patch("alexa.time.sleep"):
+            for _ in range(5):
+                instance._ensure_on_alexa_list(refresh=True)
+
+        # soft, soft, reload, soft, soft
+        self.assertEqual(instance._page.reload_calls, 1)
+        self.assertEqual(instance._page.evaluate_calls, 4)
+        # Back at the top after each, as a reload would be
+        self.assertEqual(instance._page.scrolled_to_top, 4)
+
+    def test_the_page_is_reloaded_until_its_list_fetch_is_known(self):
+        instance = self.instance()
+
+        instance._ensure_on_alexa_list(refresh=True)
+
+        self.assertEqual(instance._page.reload_calls, 1)
+        self.assertEqual(instance._page.evaluate_calls, 0)
+        self.assertTrue(instance._soft_refresh_works)
+
+    def test_pages_that_dont_fetch_again_are_always_reloaded(self):
+        instance = self.instance(refetch=False)
+        instance._list_fetches = {"/api/items"}
+
+        with patch("builtins.print"):
+            instance._ensure_on_alexa_list(refresh=True)
+            instance._ensure_on_alexa_list(refresh=True)
+
+        self.assertEqual(instance._page.reload_calls, 2)
+        self.assertEqual(instance._page.evaluate_calls, 1)
+        self.assertFalse(instance._soft_refresh_works)
+
+    def test_fetches_without_the_list_items_dont_count_as_a_refresh(self):
+        instance = self.instance()
+        instance._page.fetch_url = "https://www.amazon.co.uk/api/notifications"
+        instance._list_fetches = {"/api/items", "/api/notifications"}
+
+        with patch("builtins.print"):
+            instance._ensure_on_alexa_list(refresh=True)
+
+        # Reloaded instead, and the unrelated fetch is forgotten
+        self.assertEqual(instance._page.reload_calls, 1)
+        self.assertEqual(instance._list_fetches, {"/api/items"})
+        self.assertTrue(instance._soft_refresh_works)
+
+
+class LivePage(RefetchingPage):
+    """A list page where "Coffee" shows up after change_after waits, advancing clock by each wait."""
+
+    def __init__(self, url, clock, change_after=None):
+        super().__init__(url)
+        self.clock = clock
+        self.change_after = change_after
+        self.exposed = {}
+        self.known = []
+        self.waits = 0
+
+    def expose_function(self, name, callback):
+        self.exposed[name] = callback
+
+    def evaluate(self, script, arg=None):
+        if script == alexa.LIVE_OBSERVER_SCRIPT:
+            self.known.append(arg)
+        if "__alexa2anylistKnown ||" in script:
+            return ["Milk"]
+        return super().evaluate(script)
+
+    def wait_for_timeout(self, timeout):
+        self.waits += 1
+        self.clock[0] += timeout / 1000
+        if self.waits == self.change_after:
+            self.exposed["alexa2anylistChanged"](["Coffee"], [])
+
+
+class LiveChangesTests(unittest.TestCase):
+    def instance(self, change_after=None):
+        self.clock = [1000.0]
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.amazon_url = "amazon.co.uk"
+        instance.live_refresh_seconds = 2
+        instance._page = LivePage(SoftRefreshTests.LIST_URL, self.clock, change_after)
+        instance._list_fetches = {"/api/items"}
+        return instance
+
+    def wait(self, instance, seconds):
+        with patch("alexa.time.monotonic", lambda: self.clock[0]), patch("alexa.time.sleep"), \
+                patch("builtins.print"):
+            return instance.wait_for_changes(seconds)
+
+    def test_returns_as_soon_as_the_page_reports_a_change(self):
+        instance = self.instance(change_after=3)
+
+        self.assertTrue(self.wait(instance, 60))
+        self.assertEqual(instance._page.waits, 3)
+        # The scrape can use the page as it is
+        self.assertTrue(instance._page_fresh)
+
+    def test_a_reported_change_forces_a_full_scrape(self):
+        instance = self.instance(change_after=1)
+        titles = [f"Item {i}" for i in range(20)]
+        instance._last_signature = instance._list_signature(titles)
+
+        self.assertTrue(self.wait(instance, 60))
+        # Removing Item 15 doesn't change the top of the list, the probe mustn't hide it
+        instance._page.evaluate = lambda script, arg=None: titles[:15] + titles[16:]
+        self.assertFalse(instance.alexa_list_unchanged())
+
+    def test_the_page_fetches_its_items_while_it_is_watched(self):
+        instance = self.instance()
+
+        self.assertFalse(self.wait(instance, 5))
+        self.assertEqual(instance._page.waits, 5)
+        # Refreshed twice, each time the observer is set up again with what was known
+        self.assertEqual(instance._page.known, [None, ["Milk"], ["Milk"]])
+        self.assertEqual(len(instance._page.exposed), 1)
+
+    def test_changes_reported_between_waits_are_ignored(self):
+        instance = self.instance()
+        self.wait(instance, 1)
+
+        instance._page.exposed["alexa2anylistChanged"](["Milk"], [])
+        instance._page.change_after = None
+
+        self.assertFalse(self.wait(instance, 1))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import unittest
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+from alexa_worker import AlexaWorkerClient  # noqa: E402
+from alexa_worker import AlexaWorkerError  # noqa: E402
+from deadline import Deadline  # noqa: E402
+from deadline import DeadlineExceeded  # noqa: E402
+from driver_stats import DRIVER_CALLS  # noqa: E402
+from errors import SIDE_ALEXA  # noqa: E402
+from recovery import RecoveryPolicy  # noqa: E402
+
+
+DRIVER = "tests.test_alexa_worker:FakeDriver"
+
+
+class FakeDriver:
+    """Stands in for AlexaShoppingList in the worker process."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.is_authenticated = False
+        self.last_cycle_stats = None
+        self.deadline = None
+
+    def login(self, email, password):
+        self.is_authenticated = password == "secret"
+        return self.is_authenticated
+
+    def get_alexa_list(self, refresh=True):
+        if "hang" in self.items:
+            time.sleep(60)
+        return list(self.items)
+
+    def add_alexa_list_item(self, item, scrape=True):
+        self.items.append(item)
+
+    def update_alexa_list_item(self, old, new, scrape=True):
+        raise ValueError(f"Item {old} not found")
+
+    def remove_alexa_list_item(self, item, scrape=True):
+        if item == "crash":
+            os._exit(1)
+        self.items.remove(item)
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+
+    def wait_for_changes(self, seconds):
+        return "Coffee" in self.items
+
+    def finish_cycle(self, failed=False):
+        self.last_cycle_stats = {
+            "by_call": [{"caller": "get_alexa_list", "method": "click", "selector": None, "count": 2, "seconds": 0.5}],
+            "by_sleep": [],
+        }
+
+    def _clear_driver(self):
+        pass
+
+
+class AlexaWorkerClientTests(unittest.TestCase):
+    def setUp(self):
+        self.client = AlexaWorkerClient(["Milk"], driver=DRIVER)
+        self.addCleanup(self.client._clear_driver)
+
+    def test_calls_are_forwarded_to_the_worker(self):
+        self.assertFalse(self.client.is_authenticated)
+        self.assertTrue(self.client.login("user@example.com", "secret"))
+        self.assertTrue(self.client.is_authenticated)
+
+        self.client.add_alexa_list_item("Eggs")
+        self.assertEqual(self.client.get_alexa_list(), ["Milk", "Eggs"])
+        self.assertNotEqual(self.client.pid, os.getpid())
+
+    def test_waits_for_changes_in_the_worker(self):
+        self.assertFalse(self.client.wait_for_changes(1))
+        self.client.add_alexa_list_item("Coffee")
+        self.assertTrue(self.client.wait_for_changes(1))
+
+    def test_errors_in_the_worker_are_raised_here(self):
+        with self.assertRaisesRegex(ValueError, "Item Milk not found"):
+            self.client.update_alexa_list_item("Milk", "Oat milk")
+        # The worker is still there
+        self.assertEqual(self.client.get_alexa_list(), ["Milk"])
+
+    def test_a_crashed_worker_is_replaced_on_the_next_call(self):
+        pid = self.client.pid
+        with self.assertRaisesRegex(AlexaWorkerError, "crashed"):
+            self.client.remove_alexa_list_item("crash")
+
+        self.assertEqual(self.client.get_alexa_list(), ["Milk"])
+        self.assertNotEqual(self.client.pid, pid)
+
+    def test_a_replacement_worker_gets_the_cycle_deadline(self):
+        self.client.set_deadline(Deadline(60))
+        with self.assertRaisesRegex(AlexaWorkerError, "crashed"):
+            self.client.remove_alexa_list_item("crash")
+
+        self.assertEqual(self.client.get_alexa_list(), ["Milk"])
+        self.assertIsNotNone(self.client._call("_getattr", "deadline"))
+
+    def test_calls_past_the_deadline_fail_without_asking_the_worker(self):
+        clock = [1000.0]
+        self.client.set_deadline(Deadline(10, clock=lambda: clock[0]))
+        clock[0] += 10
+
+        with self.assertRaisesRegex(DeadlineExceeded, "Alexa get_alexa_list"):
+            self.client.get_alexa_list()
+        # Reporting on the cycle still works
+        self.client.finish_cycle(failed=True)
+
+    def test_a_hung_worker_is_killed_once_past_the_deadline(self):
+        self.client._clear_driver()
+        self.client = AlexaWorkerClient(["Milk", "hang"], driver=DRIVER)
+        self.client.DEADLINE_GRACE = 0.5
+        self.client.set_deadline(Deadline(0.5))
+
+        started = time.monotonic()
+        with self.assertRaisesRegex(AlexaWorkerError, "hung in get_alexa_list") as raised:
+            self.client.get_alexa_list()
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertIsNone(self.client.pid)
+
+        raised.exception.sync_side = SIDE_ALEXA
+        self.assertEqual(RecoveryPolicy().record_failure(raised.exception), RecoveryPolicy.ACTION_RESTART_ALEXA)
+
+    def test_an_aborted_worker_fails_the_call_it_is_stuck_in(self):
+        self.client._clear_driver()
+        self.client = AlexaWorkerClient(["Milk", "hang"], driver=DRIVER)
+        threading.Timer(0.5, self.client.abort).start()
+
+        with self.assertRaisesRegex(AlexaWorkerError, "was killed in get_alexa_list") as raised:
+            self.client.get_alexa_list()
+        self.assertIsNone(self.client.pid)
+
+        raised.exception.sync_side = SIDE_ALEXA
+        self.assertEqual(RecoveryPolicy().record_failure(raised.exception), RecoveryPolicy.ACTION_RESTART_ALEXA)
+
+    def test_driver_stats_from_the_worker_are_counted_here(self):
+        before = DRIVER_CALLS.value(caller="get_alexa_list", method="click")
+        self.client.finish_cycle()
+
+        self.assertEqual(DRIVER_CALLS.value(caller="get_alexa_list", method="click"), before + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import base64
+import json
+import time
 import unittest
 import logging
 import tempfile
@@ -15,6 +18,8 @@ install_runtime_stubs()
 from anylist import AnyList
 from anylist import Item
 from anylist import List
+from names import NameCanonicalizer
+from synchronizer import SnapshotItem
 from synchronizer import Synchronizer
 
 
@@ -77,6 +82,33 @@ class _FakeWebSocket:
         return None
 
 
+def _item_data(identifier, name, checked=False):
+    return type(
+        "ItemData",
+        (),
+        {
+            "identifier": identifier,
+            "listId": "list-id",
+            "name": name,
+            "quantity": "",
+            "details": "",
+            "checked": checked,
+            "category": "",
+            "userId": "user-id",
+            "categoryMatchId": "",
+            "manualSortIndex": 0,
+        },
+    )()
+
+
+def _list_data(*items):
+    return type(
+        "ListData",
+        (),
+        {"identifier": "list-id", "name": "Groceries", "items": list(items), "creator": "user-id"},
+    )()
+
+
 class AnyListAuthRetryTests(unittest.TestCase):
     @patch("anylist.time.sleep", return_value=None)
     @patch("anylist.requests.post")
@@ -116,6 +148,9 @@ class AnyListAuthRetryTests(unittest.TestCase):
         refreshed_list = object()
 
         class FakeApi:
+            def lists_are_current(self):
+                return False
+
             def get_lists(self, refresh_cache=False):
                 calls.append(refresh_cache)
 
@@ -136,6 +171,9 @@ class AnyListAuthRetryTests(unittest.TestCase):
 
     def test_list_refresh_raises_when_list_missing_after_reload(self):
         class FakeApi:
+            def lists_are_current(self):
+                return False
+
             def get_lists(self, refresh_cache=False):
                 return None
 
@@ -151,6 +189,84 @@ class AnyListAuthRetryTests(unittest.TestCase):
         with self.assertRaisesRegex(Exception, "Failed to refresh list list-id"):
             List(FakeApi(), list_data).refresh()
 
+    def test_list_refresh_returns_cached_list_when_nothing_changed(self):
+        cached_list = object()
+
+        class FakeApi:
+            def lists_are_current(self):
+                return True
+
+            def get_lists(self, refresh_cache=False):
+                raise AssertionError("should not download the lists again")
+
+            def get_list_by_id(self, identifier):
+                return cached_list
+
+        list_data = type(
+            "ListData",
+            (),
+            {"identifier": "list-id", "name": "Groceries", "items": [], "creator": "user-id"},
+        )()
+
+        self.assertIs(List(FakeApi(), list_data).refresh(), cached_list)
+
+    @patch("anylist.threading.Thread", _FakeThread)
+    @patch("anylist.websocket.WebSocketApp")
+    def test_lists_are_current_until_websocket_reports_change_or_disconnects(self, mock_ws_app):
+        api = AnyList("user@example.com", "password")
+        api._setup_websocket()
+        callbacks = mock_ws_app.call_args.kwargs
+        api.get_lists = lambda refresh_cache=False: None
+
+        callbacks["on_open"](api.ws)
+        api.lists = ["list"]
+        self.assertFalse(api.lists_are_current(), "changes may have been missed before the websocket opened")
+
+        api._fetched_generation = api.generation
+        self.assertTrue(api.lists_are_current())
+
+        callbacks["on_message"](api.ws, "refresh-shopping-lists")
+        self.assertFalse(api.lists_are_current())
+
+        api._fetched_generation = api.generation
+        callbacks["on_close"](api.ws, None, None)
+        self.assertFalse(api.lists_are_current())
+
+    def test_get_lists_refreshes_existing_lists_in_place(self):
+        api = AnyList("user@example.com", "password")
+        responses = [
+            _list_data(_item_data("1", "Milk"), _item_data("2", "Eggs")),
+            _list_data(_item_data("1", "Milk", checked=True), _item_data("3", "Bread")),
+        ]
+
+        def fake_get_user_data(refresh_cache=False):
+            api._user_data = type("UserData", (), {
+                "shoppingListsResponse": type("Response", (), {"newLists": [responses.pop(0)]})(),
+            })()
+
+        api._get_user_data = fake_get_user_data
+
+        lst = api.get_lists()[0]
+        milk = lst.get_item_by_id("1")
+        refreshed = api.get_lists(refresh_cache=True)[0]
+
+        self.assertIs(refreshed, lst)
+        self.assertIs(lst.get_item_by_id("1"), milk)
+        self.assertTrue(milk.checked)
+        self.assertEqual([item.name for item in lst.last_delta.added], ["Bread"])
+        self.assertEqual([item.name for item in lst.last_delta.removed], ["Eggs"])
+        self.assertEqual(lst.last_delta.changed, [milk])
+
+    def test_item_merge_keeps_unsaved_local_changes(self):
+        item = Item(object(), _item_data("1", "Milk"))
+        item.name = "Oat milk"
+
+        changed = item._merge(_item_data("1", "Milk", checked=True))
+
+        self.assertTrue(changed)
+        self.assertEqual(item.name, "Oat milk")
+        self.assertTrue(item.checked)
+
     def test_item_save_rolls_back_local_checked_state_after_failed_update(self):
         class FakeApi:
             def __init__(self):
@@ -244,10 +360,11 @@ class AnyListAuthRetryTests(unittest.TestCase):
 
     def test_synchronizer_get_fresh_lists_forces_alexa_reload(self):
         calls = []
+        anylist = [SnapshotItem("item-id", "Milk", False)]
         syncer = Synchronizer.__new__(Synchronizer)
         syncer.log = logging.getLogger("test-synchronizer")
         syncer._show_lists = lambda *args, **kwargs: None
-        syncer.anylist = type("AnyListApi", (), {"refresh": lambda self: ["anylist"]})()
+        syncer.anylist = type("AnyListApi", (), {"refresh": lambda self: anylist})()
         syncer.alexa = type(
             "AlexaApi",
             (),
@@ -256,13 +373,14 @@ class AnyListAuthRetryTests(unittest.TestCase):
 
         anylist_items, alexa_items = syncer._get_fresh_lists()
 
-        self.assertEqual(anylist_items, ["anylist"])
+        self.assertIs(anylist_items, anylist)
         self.assertEqual(alexa_items, ["alexa"])
         self.assertEqual(calls, [True])
 
     def test_commit_transaction_skips_missing_anylist_items(self):
         syncer = Synchronizer.__new__(Synchronizer)
         syncer.log = logging.getLogger("test-synchronizer")
+        syncer._names = NameCanonicalizer()
         syncer._refresh_baselines = lambda: None
         syncer._alexa_list = []
         syncer._old_anylist_list = []
@@ -292,6 +410,12 @@ class AnyListAuthRetryTests(unittest.TestCase):
     def test_commit_transaction_verifies_alexa_add_postcondition(self):
         syncer = Synchronizer.__new__(Synchronizer)
         syncer.log = logging.getLogger("test-synchronizer")
+        syncer._names = NameCanonicalizer()
+        syncer._anylist_seen_at = None
+        syncer._alexa_seen_at = None
+        syncer._latency = None
+        syncer._alexa_verify_every = 1
+        syncer._unverified = []
         syncer._refresh_baselines = lambda: None
         syncer._alexa_list = []
         syncer._old_anylist_list = []
@@ -451,6 +575,54 @@ class AnyListAuthRetryTests(unittest.TestCase):
         self.assertEqual(len(ws_instances), 2)
         self.assertEqual(ws_instances[0].close_calls, 1)
 
+    def _jwt(self, expires_in):
+        payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + expires_in}).encode()).decode().rstrip("=")
+        return f"header.{payload}.signature"
+
+    def _login_with_cache(self, credentials, responses):
+        with tempfile.TemporaryDirectory() as tmpdir, patch("anylist.os.environ", {"CONFIG_PATH": tmpdir}):
+            if credentials is not None:
+                (Path(tmpdir) / "creds.json").write_text(json.dumps(credentials))
+            api = AnyList("user@example.com", "password", credential_cache="creds.json")
+            with patch("anylist.requests.post", side_effect=responses) as mock_post, \
+                    patch.object(api, "_setup_websocket") as mock_ws, \
+                    patch.object(api, "_get_user_data"), \
+                    patch.object(api, "get_lists"):
+                api.login()
+            return api, mock_post, mock_ws
+
+    def test_login_reuses_cached_tokens_that_are_still_valid(self):
+        token = self._jwt(3600)
+        api, mock_post, _ = self._login_with_cache(
+            {"clientId": "client-id", "accessToken": token, "refreshToken": "refresh"},
+            [],
+        )
+
+        mock_post.assert_not_called()
+        self.assertEqual((api.client_id, api.access_token), ("client-id", token))
+
+    def test_login_refreshes_expired_cached_tokens_instead_of_using_the_password(self):
+        api, mock_post, mock_ws = self._login_with_cache(
+            {"clientId": "client-id", "accessToken": self._jwt(-10), "refreshToken": "refresh"},
+            [_Response(status_code=200, json_data={"access_token": "fresh", "refresh_token": "fresh-refresh"})],
+        )
+
+        [refresh_call] = mock_post.call_args_list
+        self.assertTrue(refresh_call.args[0].endswith("/auth/token/refresh"))
+        self.assertEqual(api.access_token, "fresh")
+        # Only the normal connection, not an extra reconnect for the refresh
+        mock_ws.assert_called_once_with()
+
+    def test_login_falls_back_to_the_password_without_cached_tokens(self):
+        api, mock_post, _ = self._login_with_cache(
+            None,
+            [_Response(status_code=200, json_data={"access_token": "fresh", "refresh_token": "fresh-refresh"})],
+        )
+
+        [fetch_call] = mock_post.call_args_list
+        self.assertEqual(fetch_call.kwargs["data"]["password"], "password")
+        self.assertEqual(api.access_token, "fresh")
+
     def test_save_credentials_writes_private_file_permissions(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             with patch("anylist.os.environ", {"CONFIG_PATH": tmpdir}):
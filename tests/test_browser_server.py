@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import alexa  # noqa: E402
+from browser_server import _default_executable  # noqa: E402
+from browser_server import browser_command  # noqa: E402
+from browser_server import wait_for_browser  # noqa: E402
+
+
+class VersionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"webSocketDebuggerUrl": "ws://127.0.0.1/devtools/browser/abc"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+        self.viewport = None
+
+    def set_viewport_size(self, viewport):
+        self.viewport = viewport
+
+    def goto(self, *args, **kwargs):
+        return None
+
+    def on(self, *args, **kwargs):
+        return None
+
+    def locator(self, *args, **kwargs):
+        # No sign in button
+        return types.SimpleNamespace(count=lambda: 0)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+    def new_page(self):
+        self.pages.append(FakePage())
+        return self.pages[-1]
+
+    def cookies(self):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, contexts):
+        self.contexts = contexts
+        self.closed = False
+
+    def new_context(self, **kwargs):
+        self.contexts.append(FakeContext())
+        return self.contexts[-1]
+
+    def close(self):
+        self.closed = True
+
+
+class FakePlaywright:
+    def __init__(self, browser):
+        self.browser = browser
+        self.connected = []
+        self.stopped = False
+        self.chromium = self
+
+    def start(self):
+        return self
+
+    def connect_over_cdp(self, endpoint, timeout=None):
+        self.connected.append(("cdp", endpoint))
+        return self.browser
+
+    def connect(self, endpoint, timeout=None):
+        self.connected.append(("server", endpoint))
+        return self.browser
+
+    def stop(self):
+        self.stopped = True
+
+
+class BrowserServerTests(unittest.TestCase):
+    def test_only_listens_on_localhost(self):
+        command = browser_command("/usr/bin/chromium", port=9333, user_data_dir="/config/browser-profile")
+
+        self.assertIn("--remote-debugging-port=9333", command)
+        self.assertIn("--remote-debugging-address=127.0.0.1", command)
+        self.assertIn("--user-data-dir=/config/browser-profile", command)
+        self.assertIn("--headless=new", command)
+
+    def test_runs_cloakbrowser_by_default(self):
+        download = types.ModuleType("cloakbrowser.download")
+        download.ensure_binary = lambda: "/root/.cloakbrowser/chrome"
+        with patch.dict(sys.modules, {"cloakbrowser.download": download}):
+            self.assertEqual(_default_executable(), "/root/.cloakbrowser/chrome")
+
+    def test_waits_for_the_cdp_endpoint(self):
+        server = HTTPServer(("127.0.0.1", 0), VersionHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.assertEqual(wait_for_browser(server.server_port, timeout=5), "ws://127.0.0.1/devtools/browser/abc")
+
+    def test_gives_up_when_nothing_is_listening(self):
+        with self.assertRaisesRegex(Exception, "didn't come up"):
+            wait_for_browser(1, timeout=0.1)
+
+
+class AttachTests(unittest.TestCase):
+    def attach(self, endpoint, contexts):
+        playwright = FakePlaywright(FakeBrowser(contexts))
+        cookies_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cookies_dir.cleanup)
+        with patch.object(sys.modules["playwright.sync_api"], "sync_playwright", lambda: playwright, create=True), \
+                patch("builtins.print"):
+            instance = alexa.AlexaShoppingList(cookies_path=cookies_dir.name, browser_endpoint=endpoint)
+        return instance, playwright
+
+    def test_reuses_the_context_of_a_running_browser(self):
+        shared = FakeContext()
+        instance, playwright = self.attach("http://127.0.0.1:9222", [shared])
+
+        self.assertEqual(playwright.connected, [("cdp", "http://127.0.0.1:9222")])
+        self.assertIs(instance._context, shared)
+        self.assertEqual(shared.pages[0].viewport, alexa.VIEWPORT)
+
+        instance._clear_driver()
+        # Our page is closed and we disconnect, the browser and its context stay
+        self.assertTrue(shared.pages[0].closed)
+        self.assertFalse(shared.closed)
+        self.assertTrue(playwright.browser.closed)
+        self.assertTrue(playwright.stopped)
+
+    def test_connects_to_a_playwright_browser_server(self):
+        instance, playwright = self.attach("ws://127.0.0.1:3000/abc", [])
+
+        self.assertEqual(playwright.connected, [("server", "ws://127.0.0.1:3000/abc")])
+        instance._clear_driver()
+        self.assertTrue(instance._context.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
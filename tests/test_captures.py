@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import alexa  # noqa: E402
+from captures import CaptureWriter  # noqa: E402
+
+
+class CaptureWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        print_patch = patch("builtins.print")
+        print_patch.start()
+        self.addCleanup(print_patch.stop)
+
+    def test_captures_are_written_in_the_background_with_gzipped_html(self):
+        writer = CaptureWriter(self.tmp.name)
+
+        path = writer.submit("20240101_000000.000000_login_failed", b"png", "<html>Sign in</html>")
+        writer.flush()
+
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"png")
+        with gzip.open(os.path.join(self.tmp.name, "20240101_000000.000000_login_failed_content.html.gz"), "rt") as file:
+            self.assertEqual(file.read(), "<html>Sign in</html>")
+
+    def test_only_the_latest_captures_are_kept(self):
+        writer = CaptureWriter(self.tmp.name, max_files=2)
+
+        for second in range(4):
+            writer.submit(f"20240101_00000{second}.000000", b"png", "<html></html>")
+        writer.flush()
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), [
+            "20240101_000002.000000_content.html.gz",
+            "20240101_000002.000000_screenshot.png",
+            "20240101_000003.000000_content.html.gz",
+            "20240101_000003.000000_screenshot.png",
+        ])
+
+    def test_byte_quota_never_deletes_the_newest_capture(self):
+        writer = CaptureWriter(self.tmp.name, max_bytes=1000)
+
+        writer.submit("20240101_000000.000000", b"x" * 600, None)
+        writer.submit("20240101_000001.000000", b"x" * 600, None)
+        writer.submit("20240101_000002.000000", b"x" * 2000, None)
+        writer.flush()
+
+        self.assertEqual(os.listdir(self.tmp.name), ["20240101_000002.000000_screenshot.png"])
+
+    def test_captures_are_dropped_when_the_writer_falls_behind(self):
+        writer = CaptureWriter(self.tmp.name, max_pending=1)
+
+        with patch.object(writer, "_ensure_thread"):
+            self.assertIsNotNone(writer.submit("first", b"png", None))
+            self.assertIsNone(writer.submit("second", b"png", None))
+
+
+class FakePage:
+    def __init__(self):
+        self.screenshots = []
+
+    def screenshot(self, **kwargs):
+        self.screenshots.append(kwargs)
+        return b"png"
+
+    def content(self):
+        return "<html></html>"
+
+
+class AlexaScreenshotTests(unittest.TestCase):
+    def test_get_screenshot_captures_the_viewport_in_the_background(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance._page = FakePage()
+
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {"SCREENSHOT_PATH": tmp, "SCREENSHOT_MAX_FILES": "3"}), patch("builtins.print"):
+            path = instance.get_screenshot("wrong password")
+            instance.captures.flush()
+
+            self.assertTrue(path.endswith("_wrong_password_screenshot.png"))
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(instance.captures.max_files, 3)
+        self.assertEqual(instance._page.screenshots, [{"full_page": False}])
+
+
+if __name__ == "__main__":
+    unittest.main()
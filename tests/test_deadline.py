@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import threading
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import alexa  # noqa: E402
+from anylist import AnyList  # noqa: E402
+from deadline import Deadline  # noqa: E402
+from deadline import DeadlineExceeded  # noqa: E402
+from deadline import Watchdog  # noqa: E402
+from errors import SIDE_ALEXA  # noqa: E402
+from recovery import RecoveryPolicy  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_timeouts_are_capped_to_what_is_left(self):
+        clock = FakeClock()
+        deadline = Deadline(60, clock=clock)
+
+        self.assertEqual(deadline.timeout(30), 30)
+        clock.now += 50
+        self.assertEqual(deadline.timeout(30), 10)
+        self.assertEqual(deadline.timeout_ms(30000), 10000)
+
+    def test_expired_deadlines_raise(self):
+        clock = FakeClock()
+        deadline = Deadline(60, clock=clock)
+        clock.now += 60
+
+        self.assertTrue(deadline.expired)
+        with self.assertRaisesRegex(DeadlineExceeded, "Deadline of 60s exceeded in Alexa scrape"):
+            deadline.timeout_ms(30000, "Alexa scrape")
+
+    def test_playwright_timeouts_are_never_zero(self):
+        clock = FakeClock()
+        deadline = Deadline(60, clock=clock)
+        clock.now += 59.9999
+
+        self.assertEqual(deadline.timeout_ms(30000), 1)
+
+
+class WatchdogTests(unittest.TestCase):
+    def test_fires_once_when_a_cycle_is_stuck_past_the_grace_period(self):
+        clock = FakeClock()
+        fired = []
+        watchdog = Watchdog(grace=30, on_fire=fired.append)
+
+        with patch.object(watchdog.log, "error") as mock_error, watchdog.watch(Deadline(60, clock=clock)):
+            clock.now += 80
+            watchdog.check()
+            clock.now += 20
+            watchdog.check()
+            watchdog.check()
+
+        self.assertEqual(fired, [40])
+        self.assertTrue(watchdog.fired)
+        self.assertIn("test_fires_once_when_a_cycle_is_stuck_past_the_grace_period", mock_error.call_args[0][0])
+        # Nothing to watch between cycles
+        clock.now += 1000
+        watchdog.check()
+        self.assertEqual(len(fired), 1)
+
+    def test_exits_when_a_cycle_is_stuck_for_too_long(self):
+        clock = FakeClock()
+        watchdog = Watchdog(grace=30, exit_after=120, on_fire=lambda overrun: None)
+
+        with patch("deadline.os._exit") as mock_exit, patch.object(watchdog.log, "error"), \
+                patch.object(watchdog.log, "critical"), watchdog.watch(Deadline(60, clock=clock)):
+            clock.now += 100
+            watchdog.check()
+            mock_exit.assert_not_called()
+            clock.now += 100
+            watchdog.check()
+
+        mock_exit.assert_called_once_with(3)
+
+    def test_runs_in_the_background(self):
+        fired = threading.Event()
+        watchdog = Watchdog(grace=0, on_fire=lambda overrun: fired.set(), poll_interval=0.01)
+
+        with patch.object(watchdog.log, "error"), watchdog.watch(Deadline(0)):
+            watchdog.start()
+            self.assertTrue(fired.wait(5))
+        watchdog.stop()
+
+
+class ClientDeadlineTests(unittest.TestCase):
+    def test_alexa_sleeps_and_timeouts_stop_at_the_deadline(self):
+        clock = FakeClock()
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.set_deadline(Deadline(3, clock=clock))
+
+        with patch("alexa.time.sleep") as mock_sleep:
+            instance._sleep(5)
+        mock_sleep.assert_called_once_with(3)
+        self.assertEqual(instance._timeout(alexa.WAIT_TIMEOUT), 3000)
+
+        clock.now += 3
+        with self.assertRaisesRegex(DeadlineExceeded, "Alexa test_alexa_sleeps_and_timeouts_stop_at_the_deadline"):
+            instance._sleep(1)
+
+    def test_anylist_requests_get_the_time_left(self):
+        clock = FakeClock()
+        api = AnyList("user@example.com", "password")
+        api.access_token = "token"
+
+        with patch("anylist.requests.post") as mock_post:
+            mock_post.return_value.status_code = 200
+            api._post("/data/user-data/get")
+            self.assertEqual(mock_post.call_args.kwargs["timeout"], AnyList.REQUEST_TIMEOUT)
+
+            api.set_deadline(Deadline(10, clock=clock))
+            api._post("/data/user-data/get")
+            self.assertEqual(mock_post.call_args.kwargs["timeout"], 10)
+
+            clock.now += 10
+            with self.assertRaises(DeadlineExceeded):
+                api._post("/data/user-data/get")
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_anylist_requests_from_other_threads_ignore_the_deadline(self):
+        clock = FakeClock()
+        api = AnyList("user@example.com", "password")
+        api.access_token = "token"
+        api.set_deadline(Deadline(10, clock=clock))
+        clock.now += 10
+
+        # Like the websocket thread refetching the lists after a spent cycle
+        with patch("anylist.requests.post") as mock_post:
+            mock_post.return_value.status_code = 200
+            thread = threading.Thread(target=api._post, args=("/data/user-data/get",))
+            thread.start()
+            thread.join()
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], AnyList.REQUEST_TIMEOUT)
+
+    def test_alexa_overruns_get_a_new_browser_context(self):
+        error = DeadlineExceeded("Deadline of 900s exceeded in Alexa get_alexa_list")
+        error.sync_side = SIDE_ALEXA
+
+        self.assertEqual(RecoveryPolicy().record_failure(error), RecoveryPolicy.ACTION_NEW_ALEXA_CONTEXT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import alexa  # noqa: E402
+from driver_stats import DriverStats  # noqa: E402
+from driver_stats import InstrumentedPage  # noqa: E402
+
+
+class FakeLocator:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def locator(self, selector):
+        return FakeLocator(self.texts)
+
+    def all(self):
+        return [FakeLocator([text]) for text in self.texts]
+
+    def inner_text(self):
+        return self.texts[0]
+
+    @property
+    def first(self):
+        return FakeLocator(self.texts[:1])
+
+
+class FakePage:
+    url = "https://www.amazon.co.uk"
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.mouse = type("Mouse", (), {"wheel": lambda self, x, y: None})()
+
+    def locator(self, selector):
+        return FakeLocator(self.texts)
+
+    def goto(self, url, wait_until=None):
+        self.url = url
+
+
+class Driver:
+    def __init__(self, texts):
+        self.stats = DriverStats()
+        self.page = InstrumentedPage(FakePage(texts), self.stats, self)
+
+    def read_titles(self):
+        return [item.inner_text() for item in self.page.locator(".item-title").all()]
+
+    def first_title(self):
+        return self.page.locator(".item-title").first.inner_text()
+
+
+class InstrumentedPageTests(unittest.TestCase):
+    def test_calls_are_counted_by_caller_method_and_selector(self):
+        driver = Driver(["Milk", "Eggs"])
+
+        self.assertEqual(driver.read_titles(), ["Milk", "Eggs"])
+        driver.page.goto("https://www.amazon.co.uk/list")
+        driver.page.mouse.wheel(0, -1000)
+
+        calls = {
+            (call["caller"], call["method"], call["selector"]): call["count"]
+            for call in driver.stats.summary()["by_call"]
+        }
+        self.assertEqual(calls, {
+            ("read_titles", "all", ".item-title"): 1,
+            ("read_titles", "inner_text", ".item-title"): 2,
+            # Not made from a method of the driver
+            ("unknown", "goto", None): 1,
+            ("unknown", "wheel", "mouse"): 1,
+        })
+        self.assertEqual(driver.page.url, "https://www.amazon.co.uk/list")
+
+    def test_locator_properties_are_instrumented(self):
+        driver = Driver(["Milk", "Eggs"])
+
+        self.assertEqual(driver.first_title(), "Milk")
+
+        [call] = driver.stats.summary()["by_call"]
+        self.assertEqual((call["caller"], call["method"], call["selector"]), ("first_title", "inner_text", ".item-title >> first"))
+
+    def test_reset_starts_a_new_cycle(self):
+        driver = Driver(["Milk"])
+        driver.read_titles()
+
+        driver.stats.reset()
+
+        self.assertEqual(driver.stats.summary()["calls"], 0)
+
+
+class AlexaDriverStatsTests(unittest.TestCase):
+    def test_sleeps_are_added_up_per_method(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.stats = DriverStats()
+
+        with patch("alexa.time.sleep") as mock_sleep:
+            instance._sleep(5)
+            instance._sleep(1)
+
+        self.assertEqual(mock_sleep.call_count, 2)
+        summary = instance.stats.summary()
+        self.assertEqual(summary["sleep_seconds"], 6)
+        self.assertEqual(summary["by_sleep"], [{"caller": "test_sleeps_are_added_up_per_method", "count": 2, "seconds": 6}])
+
+    def test_finish_cycle_keeps_the_summary(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        instance.stats = DriverStats()
+        instance.start_cycle()
+
+        with patch("builtins.print") as mock_print:
+            instance.finish_cycle(failed=True)
+
+        self.assertEqual(instance.last_cycle_stats["calls"], 0)
+        self.assertIn("(failed)", mock_print.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
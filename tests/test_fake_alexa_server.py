@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import importlib
+import json
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+from tests.fake_alexa_server import LIST_PATH
+from tests.fake_alexa_server import FakeAlexaServer
+
+
+def _load_real_module(name):
+    """Imports the real module even though the runtime stubs may shadow it."""
+    stub = sys.modules.pop(name, None)
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return None
+    finally:
+        if stub is not None:
+            sys.modules[name] = stub
+    if not getattr(module, "__file__", None):
+        return None
+    return module
+
+
+CLOAKBROWSER = _load_real_module("cloakbrowser")
+PLAYWRIGHT = _load_real_module("playwright.sync_api")
+
+
+class FakeAlexaServerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAlexaServer(items=["Milk", "Eggs"]).start()
+        self.addCleanup(self.server.stop)
+
+    def _get(self, path):
+        with urllib.request.urlopen(f"{self.server.url}{path}") as response:
+            return response.read().decode("utf-8")
+
+    def _post(self, change):
+        request = urllib.request.Request(
+            f"{self.server.url}/api/items",
+            data=json.dumps(change).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_list_page_has_the_selectors_the_driver_uses(self):
+        page = self._get("/alexaquantum/sp/alexaShoppingList?ref=nav_asl")
+
+        for selector in ("list-header", "add-symbol", "add-to-list", "cancel-input", "virtual-list",
+                         "item-title", "item-actions-1", "item-actions-2", "input-box"):
+            self.assertIn(selector, page)
+        self.assertIn('"renderDelay": 0', page)
+
+    def test_home_page_looks_signed_in(self):
+        page = self._get("/")
+
+        self.assertIn('id="nav-link-accountList"', page)
+        self.assertNotIn("nav-action-signin-button", page)
+
+    def test_api_adds_to_the_top_renames_and_removes(self):
+        items = self._post({"op": "add", "name": "Bread"})
+        self.assertEqual(["Bread", "Milk", "Eggs"], [item["name"] for item in items])
+
+        milk = next(item for item in items if item["name"] == "Milk")
+        self._post({"op": "rename", "id": milk["id"], "name": "Oat milk"})
+        eggs = next(item for item in items if item["name"] == "Eggs")
+        self._post({"op": "remove", "id": eggs["id"]})
+
+        self.assertEqual(["Bread", "Oat milk"], self.server.items())
+
+    def test_network_delay_slows_down_api_calls(self):
+        self.server.network_delay = 0.2
+
+        start = time.monotonic()
+        self._get("/api/items")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(1, self.server.request_counts["/api/items"])
+
+
+@unittest.skipIf(CLOAKBROWSER is None or PLAYWRIGHT is None, "needs cloakbrowser and playwright")
+class SoftRefreshBrowserTests(unittest.TestCase):
+    def test_soft_refreshed_scrapes_return_the_whole_list(self):
+        import alexa
+
+        # Far more rows than fit in the viewport, so the list is scrolled while scraping
+        names = [f"Item {i:03d}" for i in range(60)]
+        server = FakeAlexaServer(items=names).start()
+        self.addCleanup(server.stop)
+        real_sleep = time.sleep
+        cookies_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cookies_dir.cleanup)
+
+        with patch.dict(sys.modules, {"cloakbrowser": CLOAKBROWSER, "playwright.sync_api": PLAYWRIGHT}), \
+                patch.object(alexa, "PWTimeoutError", PLAYWRIGHT.TimeoutError), \
+                patch("alexa.time.sleep", lambda seconds: real_sleep(min(seconds, 0.5))), \
+                patch("builtins.print"):
+            driver = alexa.AlexaShoppingList(cookies_path=cookies_dir.name, base_url=server.url)
+            try:
+                self.assertEqual(driver.get_alexa_list(refresh=True), names)
+                self.assertEqual(driver.get_alexa_list(refresh=True), names)
+                self.assertEqual(driver.get_alexa_list(refresh=True), names)
+            finally:
+                driver._clear_driver()
+
+        # Only the first scrape loaded the page, the others had it fetch its items again
+        self.assertEqual(server.request_counts[LIST_PATH], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import importlib
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import anylist
+from anylist import AnyList
+
+
+def _load_real_module(name):
+    """Imports the real module even though the runtime stubs shadow it."""
+    stub = sys.modules.pop(name, None)
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return None
+    finally:
+        if stub is not None:
+            sys.modules[name] = stub
+    if not getattr(module, "__file__", None):
+        return None
+    return module
+
+
+PCOV_PB2 = _load_real_module("pcov_pb2")
+WEBSOCKET = _load_real_module("websocket")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@unittest.skipIf(PCOV_PB2 is None or WEBSOCKET is None, "needs the generated pcov_pb2 and websocket-client")
+class FakeAnyListServerTests(unittest.TestCase):
+    def setUp(self):
+        from tests.fake_anylist_server import FakeAnyListServer
+
+        patches = [
+            patch.object(anylist, "pcov_pb2", PCOV_PB2),
+            patch.object(anylist, "websocket", WEBSOCKET),
+            patch.object(anylist.time, "sleep", lambda seconds: None),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.server = FakeAnyListServer(pb=PCOV_PB2).start()
+        self.addCleanup(self.server.stop)
+        self.list_id = self.server.add_list("Groceries")
+        self.server.add_item(self.list_id, "Milk", notify=False)
+
+        self.api = AnyList("user@example.com", "password", api_url=self.server.url)
+        self.addCleanup(self.api.teardown)
+
+    def _login(self):
+        self.api.login()
+        self.assertTrue(wait_for(lambda: self.api.ws_connected))
+        return self.api.get_list_by_name("Groceries")
+
+    def test_client_reads_and_writes_through_fake_server(self):
+        lst = self._login()
+        self.assertEqual(["Milk"], [item.name for item in lst])
+
+        lst.add_item("Eggs")
+        milk = lst.get_item_by_name("Milk")
+        milk.checked = True
+        milk.save()
+
+        items = {item["name"]: item["checked"] for item in self.server.items(self.list_id)}
+        self.assertEqual({"Milk": True, "Eggs": False}, items)
+
+    def test_websocket_push_refreshes_lists(self):
+        lst = self._login()
+        # The websocket may have opened after the login fetched the lists, which then
+        # aren't known to be current, this fetches them again only in that case
+        lst.refresh()
+        self.assertTrue(self.api.lists_are_current())
+        fetches = self.server.request_counts["/data/user-data/get"]
+
+        self.server.add_item(self.list_id, "Bread")
+
+        self.assertTrue(wait_for(lambda: lst.get_item_by_name("Bread") is not None))
+        self.assertEqual(fetches + 1, self.server.request_counts["/data/user-data/get"])
+
+    def test_own_changes_are_not_pushed_back(self):
+        lst = self._login()
+        lst.add_item("Eggs")
+
+        time.sleep(0.2)
+        self.assertEqual(1, self.server.request_counts["/data/user-data/get"])
+
+    def test_expired_tokens_are_refreshed(self):
+        lst = self._login()
+        self.server.expire_tokens()
+
+        lst.add_item("Eggs")
+
+        self.assertEqual(1, self.server.request_counts["/auth/token/refresh"])
+        self.assertIn("Eggs", [item["name"] for item in self.server.items(self.list_id)])
+
+    def test_injected_failure_is_retried(self):
+        lst = self._login()
+        self.server.fail_next(1, path="/data/shopping-lists/update")
+
+        lst.add_item("Eggs")
+
+        self.assertEqual(2, self.server.request_counts["/data/shopping-lists/update"])
+        self.assertIn("Eggs", [item["name"] for item in self.server.items(self.list_id)])
+
+
+if __name__ == "__main__":
+    unittest.main()
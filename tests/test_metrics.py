@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import unittest
+import urllib.request
+
+from metrics import LatencyTracker
+from metrics import MetricsRegistry
+from metrics import MetricsServer
+from metrics import RollingHistogram
+
+
+class RollingHistogramTests(unittest.TestCase):
+    def test_percentiles_use_nearest_rank(self):
+        histogram = RollingHistogram()
+        for value in range(1, 101):
+            histogram.add(float(value))
+
+        self.assertEqual(histogram.percentile(50), 50.0)
+        self.assertEqual(histogram.percentile(95), 95.0)
+        self.assertEqual(histogram.percentile(99), 99.0)
+
+    def test_window_drops_oldest_samples_but_keeps_count(self):
+        histogram = RollingHistogram(window=3)
+        for value in (100.0, 1.0, 2.0, 3.0):
+            histogram.add(value)
+
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 4)
+        self.assertEqual(summary["window"], 3)
+        self.assertEqual(summary["max"], 3.0)
+
+    def test_empty_histogram_has_no_percentiles(self):
+        self.assertIsNone(RollingHistogram().percentile(50))
+
+
+class LatencyTrackerTests(unittest.TestCase):
+    def test_summary_is_grouped_by_direction_and_kind(self):
+        tracker = LatencyTracker()
+        tracker.record(LatencyTracker.ALEXA_TO_ANYLIST, LatencyTracker.KIND_ADD, 12.0)
+        tracker.record(LatencyTracker.ANYLIST_TO_ALEXA, LatencyTracker.KIND_CHECK, 30.0)
+        tracker.record(LatencyTracker.ANYLIST_TO_ALEXA, LatencyTracker.KIND_CHECK, -1.0)
+
+        summary = tracker.summary()
+
+        self.assertEqual(summary["alexa_to_anylist"]["add"]["p50"], 12.0)
+        self.assertEqual(summary["anylist_to_alexa"]["check"]["count"], 2)
+        # Clock skew can't make a change arrive before it was seen
+        self.assertEqual(summary["anylist_to_alexa"]["check"]["p50"], 0.0)
+        self.assertIn("alexa_to_anylist add: p50 12.0s", tracker.format_summary())
+
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_renders_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        registry.counter("syncs_total", "Syncs.").inc(result="changed")
+        registry.gauge("failures", "Failures in a row.").set(2)
+        histogram = registry.histogram("phase_seconds", "Phase time.", buckets=(0.1, 1))
+        histogram.observe(0.05, phase="diff")
+        histogram.observe(0.5, phase="diff")
+
+        text = registry.render()
+
+        self.assertIn("# TYPE syncs_total counter\nsyncs_total{result=\"changed\"} 1\n", text)
+        self.assertIn("# TYPE failures gauge\nfailures 2\n", text)
+        self.assertIn('phase_seconds_bucket{phase="diff",le="0.1"} 1\n', text)
+        self.assertIn('phase_seconds_bucket{phase="diff",le="1"} 2\n', text)
+        self.assertIn('phase_seconds_bucket{phase="diff",le="+Inf"} 2\n', text)
+        self.assertIn('phase_seconds_sum{phase="diff"} 0.55\n', text)
+        self.assertIn('phase_seconds_count{phase="diff"} 2\n', text)
+
+    def test_histogram_times_blocks_that_raise(self):
+        histogram = MetricsRegistry().histogram("phase_seconds", "Phase time.")
+
+        with self.assertRaises(RuntimeError):
+            with histogram.time(phase="alexa_scrape"):
+                raise RuntimeError("scrape failed")
+
+        self.assertEqual(histogram.count(phase="alexa_scrape"), 1)
+
+    def test_registering_a_name_twice_returns_the_same_metric(self):
+        registry = MetricsRegistry()
+
+        self.assertIs(registry.counter("syncs_total", "Syncs."), registry.counter("syncs_total", "Syncs."))
+        with self.assertRaisesRegex(Exception, "already registered"):
+            registry.gauge("syncs_total", "Syncs.")
+
+    def test_server_serves_metrics(self):
+        registry = MetricsRegistry()
+        registry.counter("syncs_total", "Syncs.").inc()
+        server = MetricsServer(registry, 0).start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+
+        self.assertIn("syncs_total 1", body)
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import unittest
+
+from names import NameCanonicalizer
+from names import NameIndex
+from names import edit_distance
+
+
+class NameCanonicalizerTests(unittest.TestCase):
+    def test_key_ignores_case_whitespace_and_unicode_form(self):
+        names = NameCanonicalizer()
+
+        self.assertEqual(names.key("  Oat   MILK "), names.key("oat milk"))
+        self.assertEqual(names.key("Café"), names.key("café"))
+        self.assertNotEqual(names.key("cafe"), names.key("café"))
+
+    def test_key_applies_configured_plural_and_synonym_rules(self):
+        names = NameCanonicalizer.from_config({
+            "plural_suffixes": ["s"],
+            "synonyms": {"Aubergines": "eggplant"},
+            "fold_accents": True,
+        })
+
+        self.assertEqual(names.key("Eggs"), names.key("egg"))
+        self.assertEqual(names.key("glass"), "glass")
+        self.assertEqual(names.key("aubergine"), names.key("Eggplants"))
+        self.assertEqual(names.key("Limón"), names.key("limon"))
+
+
+class NameIndexTests(unittest.TestCase):
+    def test_get_returns_indexed_spelling(self):
+        index = NameIndex(NameCanonicalizer(), ["milk", "Eggs"])
+
+        self.assertIn("Milk", index)
+        self.assertEqual(index.get("MILK"), "milk")
+
+        index.discard("MILK")
+
+        self.assertNotIn("milk", index)
+        self.assertEqual(len(index), 1)
+
+
+class EditDistanceTests(unittest.TestCase):
+    def test_edit_distance_stops_past_limit(self):
+        self.assertEqual(edit_distance("banana", "bananas", 2), 1)
+        self.assertEqual(edit_distance("milk", "bread", 2), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+from outbox import DegradedSync  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from outbox import outbox_for  # noqa: E402
+from synchronizer import Baseline  # noqa: E402
+from synchronizer import ListSnapshot  # noqa: E402
+from synchronizer import SnapshotItem  # noqa: E402
+from synchronizer import Synchronizer  # noqa: E402
+from tests.test_synchronizer import FakeAlexaApi  # noqa: E402
+from tests.test_synchronizer import FakeAnyListApi  # noqa: E402
+from tests.test_synchronizer import FakeAnyListState  # noqa: E402
+from tests.test_synchronizer import FakeItem  # noqa: E402
+
+
+def add(name):
+    return {"op": Synchronizer.OP_ALEXA_ADD, "name": name}
+
+
+def remove(name):
+    return {"op": Synchronizer.OP_ALEXA_REMOVE, "name": name}
+
+
+def rename(old, new):
+    return {"op": Synchronizer.OP_ALEXA_RENAME, "old": old, "new": new}
+
+
+def queued(outbox):
+    return [
+        (operation["op"], operation.get("name") or (operation["old"], operation["new"]))
+        for operation in outbox.operations
+    ]
+
+
+class OutboxTests(unittest.TestCase):
+    def test_add_and_remove_of_the_same_item_cancel_out(self):
+        outbox = Outbox()
+        outbox.add(add("Milk"))
+        outbox.add(remove("milk"))
+        outbox.add(remove("Eggs"))
+        outbox.add(add("Eggs"))
+
+        self.assertEqual(len(outbox), 0)
+
+    def test_renames_are_folded_into_what_is_queued(self):
+        outbox = Outbox()
+        outbox.add(add("Milk"))
+        outbox.add(rename("Milk", "Oat milk"))
+        outbox.add(rename("Eggs", "Free range eggs"))
+        outbox.add(rename("Free range eggs", "Organic eggs"))
+        outbox.add(rename("Bread", "Rye bread"))
+        outbox.add(remove("Rye bread"))
+        outbox.add(rename("Tea", "Green tea"))
+        outbox.add(rename("Green tea", "Tea"))
+
+        self.assertEqual(queued(outbox), [
+            (Synchronizer.OP_ALEXA_ADD, "Oat milk"),
+            (Synchronizer.OP_ALEXA_RENAME, ("Eggs", "Organic eggs")),
+            (Synchronizer.OP_ALEXA_REMOVE, "Bread"),
+        ])
+
+    def test_duplicates_are_dropped(self):
+        outbox = Outbox()
+        outbox.add(add("Milk"))
+        outbox.add(add("Milk"))
+        outbox.add(remove("Eggs"))
+        outbox.add(remove("Eggs"))
+
+        self.assertEqual(len(outbox), 2)
+
+    def test_survives_a_restart(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"CONFIG_PATH": tmpdir}):
+            outbox = outbox_for("journal.json")
+            outbox.add(add("Milk"))
+            outbox.add(remove("Eggs"))
+            outbox.save()
+
+            outbox = outbox_for("journal.json")
+            outbox.done(1)
+
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "journal-outbox.json")))
+            self.assertEqual(queued(outbox_for("journal.json")), [(Synchronizer.OP_ALEXA_REMOVE, "Eggs")])
+
+
+class DegradedModeTests(unittest.TestCase):
+    def test_anylist_changes_are_queued_and_drained_in_batches_once_alexa_is_back(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"CONFIG_PATH": tmpdir}):
+            Baseline(baseline_file=os.path.join(tmpdir, "journal-baseline.json")).save(
+                ListSnapshot([SnapshotItem("1", "Milk")]), ["Milk"]
+            )
+            anylist_list = FakeAnyListState([FakeItem("1", "Milk")])
+            degraded = DegradedSync(FakeAnyListApi(anylist_list), outbox_for("journal.json"), journal_file="journal.json")
+
+            # While Alexa is down: Milk is bought, Eggs added, and Bread added and bought again
+            anylist_list.items[0].checked = True
+            anylist_list.items.append(FakeItem("2", "Eggs"))
+            anylist_list.items.append(FakeItem("3", "Bread"))
+            self.assertTrue(degraded.sync())
+            anylist_list.items[2].checked = True
+            degraded.sync()
+            self.assertFalse(degraded.sync())
+            self.assertEqual(queued(degraded.outbox), [
+                (Synchronizer.OP_ALEXA_REMOVE, "Milk"),
+                (Synchronizer.OP_ALEXA_ADD, "Eggs"),
+            ])
+
+            # Someone added coffee by voice in the meantime
+            alexa_api = FakeAlexaApi(["Milk", "coffee"])
+            syncer = Synchronizer(
+                FakeAnyListApi(anylist_list),
+                alexa_api,
+                journal_file="journal.json",
+                outbox=outbox_for("journal.json"),
+                outbox_batch=1,
+            )
+
+            # One batch at startup, without clobbering what's still queued
+            self.assertEqual(alexa_api.calls, [("remove", "Milk")])
+            self.assertEqual(anylist_list.added, ["Coffee"])
+            self.assertEqual(len(syncer.outbox), 1)
+
+            self.assertTrue(syncer.sync())
+            self.assertEqual(alexa_api.calls, [("remove", "Milk"), ("add", "Eggs")])
+            self.assertEqual(len(outbox_for("journal.json")), 0)
+            self.assertFalse(syncer.sync())
+            self.assertEqual(anylist_list.checked, [])
+
+    def test_a_queue_without_a_baseline_clobbers_alexa(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"CONFIG_PATH": tmpdir}):
+            outbox = outbox_for("journal.json")
+            outbox.add(add("Eggs"))
+            outbox.add(remove("Milk"))
+            outbox.save()
+            anylist_list = FakeAnyListState([FakeItem("1", "Milk", checked=True), FakeItem("2", "Eggs")])
+            # The baseline was lost, and coffee is only on Alexa
+            alexa_api = FakeAlexaApi(["Milk", "coffee"])
+
+            syncer = Synchronizer(
+                FakeAnyListApi(anylist_list),
+                alexa_api,
+                journal_file="journal.json",
+                outbox=outbox_for("journal.json"),
+                outbox_batch=1,
+            )
+
+            self.assertEqual(sorted(alexa_api.calls), [("add", "Eggs"), ("remove", "Milk"), ("remove", "coffee")])
+            self.assertEqual(len(syncer.outbox), 0)
+            self.assertFalse(syncer.sync())
+            self.assertEqual(anylist_list.added, [])
+            self.assertEqual(anylist_list.checked, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import unittest
+
+from errors import SIDE_ALEXA
+from errors import SIDE_ANYLIST
+from errors import blame
+from errors import side_of
+from recovery import RecoveryPolicy
+
+
+def failure(side, message="failed", cls=RuntimeError):
+    error = cls(message)
+    if side is not None:
+        error.sync_side = side
+    return error
+
+
+class BlameTests(unittest.TestCase):
+    def test_exceptions_are_tagged_with_the_innermost_side(self):
+        with self.assertRaises(ValueError) as raised:
+            with blame(SIDE_ANYLIST):
+                with blame(SIDE_ALEXA):
+                    raise ValueError("selector timed out")
+
+        self.assertEqual(side_of(raised.exception), SIDE_ALEXA)
+        self.assertIsNone(side_of(ValueError("untagged")))
+
+
+class RecoveryPolicyTests(unittest.TestCase):
+    def test_transient_failures_climb_the_ladder_of_their_side(self):
+        policy = RecoveryPolicy()
+
+        actions = [policy.record_failure(failure(SIDE_ALEXA)) for _ in range(5)]
+
+        self.assertEqual(actions, [
+            RecoveryPolicy.ACTION_RELOAD_ALEXA,
+            RecoveryPolicy.ACTION_NEW_ALEXA_CONTEXT,
+            RecoveryPolicy.ACTION_RESTART_ALEXA,
+            RecoveryPolicy.ACTION_REBUILD,
+            RecoveryPolicy.ACTION_REBUILD,
+        ])
+
+    def test_success_starts_the_ladder_over(self):
+        policy = RecoveryPolicy()
+        policy.record_failure(failure(SIDE_ANYLIST))
+        policy.record_success()
+
+        self.assertEqual(policy.record_failure(failure(SIDE_ANYLIST)), RecoveryPolicy.ACTION_RETRY)
+
+    def test_severity_picks_the_first_rung(self):
+        policy = RecoveryPolicy()
+
+        self.assertEqual(
+            policy.record_failure(failure(SIDE_ANYLIST, "Failed to fetch tokens: unauthorized")),
+            RecoveryPolicy.ACTION_RECONNECT_ANYLIST,
+        )
+        self.assertEqual(
+            policy.record_failure(failure(SIDE_ALEXA, "Target page, context or browser has been closed")),
+            RecoveryPolicy.ACTION_RESTART_ALEXA,
+        )
+
+    def test_connection_errors_reconnect_anylist(self):
+        ConnectionError_ = type("ConnectionError", (Exception,), {})
+
+        side, severity = RecoveryPolicy().classify(failure(SIDE_ANYLIST, cls=ConnectionError_))
+
+        self.assertEqual((side, severity), (SIDE_ANYLIST, RecoveryPolicy.SEVERITY_BROKEN))
+
+    def test_unknown_failures_rebuild_everything(self):
+        self.assertEqual(RecoveryPolicy().record_failure(failure(None)), RecoveryPolicy.ACTION_REBUILD)
+
+
+if __name__ == "__main__":
+    unittest.main()
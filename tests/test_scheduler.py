@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from scheduler import SyncScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SyncSchedulerTests(unittest.TestCase):
+    def make_scheduler(self, **kwargs):
+        self.clock = FakeClock()
+        kwargs.setdefault("now", lambda: datetime(2026, 1, 1, 12, 0))
+        return SyncScheduler(clock=self.clock, **kwargs)
+
+    def test_polls_fast_after_changes_then_backs_off_to_ceiling(self):
+        scheduler = self.make_scheduler(min_delay=10, max_delay=60, active_window=30)
+
+        self.assertEqual(scheduler.record_success(True), 10)
+        self.assertEqual(scheduler.reason, SyncScheduler.REASON_CHANGES)
+
+        self.clock.now += 20
+        self.assertEqual(scheduler.record_success(False), 10)
+        self.assertEqual(scheduler.reason, SyncScheduler.REASON_ACTIVE)
+
+        self.clock.now += 20
+        self.assertEqual([scheduler.record_success(False) for _ in range(4)], [20, 40, 60, 60])
+        self.assertEqual(scheduler.reason, SyncScheduler.REASON_IDLE)
+
+        self.assertEqual(scheduler.record_success(True), 10)
+
+    def test_failures_back_off_exponentially_with_jitter(self):
+        scheduler = self.make_scheduler(retry_delay=10, max_retry_delay=25, jitter=0.1)
+
+        with patch("scheduler.random.uniform", return_value=1.0):
+            delays = [scheduler.record_failure() for _ in range(3)]
+
+        self.assertEqual([round(delay, 6) for delay in delays], [11.0, 22.0, 27.5])
+        self.assertEqual(scheduler.reason, "failure #3")
+        self.assertEqual(scheduler.consecutive_failures, 3)
+
+        scheduler.record_success(False)
+        self.assertEqual(scheduler.consecutive_failures, 0)
+
+    def test_quiet_hours_wrap_around_midnight(self):
+        scheduler = self.make_scheduler(
+            min_delay=10,
+            quiet_hours={"start": "23:00", "end": "07:00", "delay": 900},
+            now=lambda: datetime(2026, 1, 1, 2, 30),
+        )
+
+        self.assertEqual(scheduler.record_success(True), 900)
+        self.assertEqual(scheduler.reason, SyncScheduler.REASON_QUIET_HOURS)
+
+        scheduler._now = lambda: datetime(2026, 1, 1, 7, 0)
+        self.assertEqual(scheduler.record_success(True), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,16 +4,20 @@ import importlib
 import sys
 import types
 import unittest
+from unittest.mock import patch
 
 from tests.test_support import install_runtime_stubs
 
 
 install_runtime_stubs()
 
+from deadline import DeadlineExceeded  # noqa: E402
+
 
 class FakeAnyList:
     instances = 0
     teardown_calls = 0
+    deadlines = []
 
     def __init__(self, *args, **kwargs):
         FakeAnyList.instances += 1
@@ -29,11 +33,17 @@ class FakeAnyList:
     def teardown(self):
         FakeAnyList.teardown_calls += 1
 
+    def set_deadline(self, deadline):
+        FakeAnyList.deadlines.append(deadline)
+
 
 class FakeAlexa:
     instances = 0
     login_calls = []
     clear_calls = 0
+    reload_calls = 0
+    abort_calls = 0
+    unavailable_logins = 0
 
     def __init__(self, *args, **kwargs):
         FakeAlexa.instances += 1
@@ -43,6 +53,8 @@ class FakeAlexa:
 
     def login(self, email, password, mfa_secret=None):
         FakeAlexa.login_calls.append((email, password, mfa_secret))
+        if len(FakeAlexa.login_calls) <= FakeAlexa.unavailable_logins:
+            return
         self.is_authenticated = True
 
     def login_requires_mfa(self):
@@ -51,29 +63,66 @@ class FakeAlexa:
     def submit_mfa(self, code):
         self.is_authenticated = True
 
+    def reload_list(self):
+        FakeAlexa.reload_calls += 1
+
     def _clear_driver(self):
         FakeAlexa.clear_calls += 1
 
+    def abort(self):
+        FakeAlexa.abort_calls += 1
+
+
+def failure(side=None):
+    error = RuntimeError("transient sync failure")
+    if side is not None:
+        error.sync_side = side
+    return error
+
 
 class FakeSynchronizer:
     instances = 0
     sync_calls = 0
+    failure = None
 
-    def __init__(self, anylist, alexa, journal_file=None):
+    def __init__(self, anylist, alexa, journal_file=None, **kwargs):
         FakeSynchronizer.instances += 1
         self.anylist = anylist
         self.alexa = alexa
         self.journal_file = journal_file
+        self.outbox = kwargs.get("outbox")
 
     def sync(self):
         FakeSynchronizer.sync_calls += 1
         if FakeSynchronizer.sync_calls == 1:
-            raise RuntimeError("transient sync failure")
+            raise FakeSynchronizer.failure or failure()
+
+
+class FakeOutbox(list):
+    pass
+
+
+class FakeDegradedSync:
+    instances = 0
+    sync_calls = 0
+    failure = None
+
+    def __init__(self, anylist, outbox, journal_file=None, name_rules=None):
+        FakeDegradedSync.instances += 1
+        self.anylist = anylist
+        self.outbox = outbox
+
+    def sync(self):
+        FakeDegradedSync.sync_calls += 1
+        if FakeDegradedSync.sync_calls == 1 and FakeDegradedSync.failure is not None:
+            raise FakeDegradedSync.failure
+        self.outbox.append({"op": "alexa_add", "name": "Milk"})
+        return True
 
 
 class ServerRecoveryTests(unittest.TestCase):
     def setUp(self):
-        for module_name in ("anylist", "alexa", "synchronizer", "server"):
+        for module_name in ("anylist", "alexa", "synchronizer", "outbox", "server"):
             sys.modules.pop(module_name, None)
 
         fake_anylist_module = types.ModuleType("anylist")
@@ -88,6 +137,12 @@ class ServerRecoveryTests(unittest.TestCase):
         fake_sync_module.Synchronizer = FakeSynchronizer
         sys.modules["synchronizer"] = fake_sync_module
 
+        self.outbox = FakeOutbox()
+        fake_outbox_module = types.ModuleType("outbox")
+        fake_outbox_module.DegradedSync = FakeDegradedSync
+        fake_outbox_module.outbox_for = lambda journal_file, name_rules=None: self.outbox
+        sys.modules["outbox"] = fake_outbox_module
+
         self.server = importlib.import_module("server")
         self.server.config = {
             "amazon_url": "amazon.co.uk",
@@ -101,11 +156,19 @@ class ServerRecoveryTests(unittest.TestCase):
 
         FakeAnyList.instances = 0
         FakeAnyList.teardown_calls = 0
+        FakeAnyList.deadlines = []
         FakeAlexa.instances = 0
         FakeAlexa.login_calls = []
         FakeAlexa.clear_calls = 0
+        FakeAlexa.reload_calls = 0
+        FakeAlexa.abort_calls = 0
+        FakeAlexa.unavailable_logins = 0
+        FakeDegradedSync.instances = 0
+        FakeDegradedSync.sync_calls = 0
+        FakeDegradedSync.failure = None
         FakeSynchronizer.instances = 0
         FakeSynchronizer.sync_calls = 0
+        FakeSynchronizer.failure = None
 
     def test_main_retries_after_sync_exception(self):
         sleep_calls = []
@@ -121,6 +184,143 @@ class ServerRecoveryTests(unittest.TestCase):
         self.assertGreaterEqual(FakeAlexa.instances, 2, "expected Alexa client recreation after recovery")
         self.assertIn(0, sleep_calls)
 
+    def test_main_reports_cycle_results_as_metrics(self):
+        self.server.sleep = lambda seconds: None
+        failed_before = self.server.SYNC_CYCLES.value(result="failed")
+        restarts_before = self.server.RESTARTS.value()
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=0)
+
+        self.assertEqual(self.server.SYNC_CYCLES.value(result="failed"), failed_before + 1)
+        self.assertEqual(self.server.RESTARTS.value(), restarts_before + 2)
+        self.assertEqual(self.server.CONSECUTIVE_FAILURES.value(), 0)
+        self.assertGreater(self.server.LAST_SUCCESS.value(), 0)
+
+    def test_anylist_failure_only_reconnects_anylist(self):
+        self.server.sleep = lambda seconds: None
+        FakeSynchronizer.failure = failure("anylist")
+        FakeSynchronizer.failure.args = ("Failed to fetch tokens: expired",)
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=0)
+
+        self.assertEqual(FakeAnyList.instances, 2)
+        self.assertEqual(FakeAlexa.instances, 1)
+        self.assertEqual(FakeAlexa.clear_calls, 1, "only when the server stops")
+        self.assertEqual(FakeSynchronizer.instances, 2)
+
+    def test_alexa_failure_reloads_the_list_page(self):
+        self.server.sleep = lambda seconds: None
+        FakeSynchronizer.failure = failure("alexa")
+        reloads_before = self.server.RECOVERIES.value(side="alexa", action="reload_alexa")
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=0)
+
+        self.assertEqual(FakeAlexa.reload_calls, 1)
+        self.assertEqual(FakeAlexa.instances, 1)
+        self.assertEqual(FakeAnyList.instances, 1)
+        self.assertEqual(len(FakeAlexa.login_calls), 1)
+        self.assertEqual(self.server.RECOVERIES.value(side="alexa", action="reload_alexa"), reloads_before + 1)
+
+    def test_cycles_run_against_a_deadline(self):
+        self.server.sleep = lambda seconds: None
+        self.server.config["cycle_budget"] = 120
+        self.server._load_config = lambda: self.server.config
+        FakeSynchronizer.failure = DeadlineExceeded("Deadline of 120s exceeded in Alexa get_alexa_list")
+        FakeSynchronizer.failure.sync_side = "alexa"
+        aborted_before = self.server.CYCLE_OVERRUNS.value(result="aborted")
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=0)
+
+        self.assertEqual([deadline is None for deadline in FakeAnyList.deadlines], [False, True, False, True])
+        self.assertEqual(FakeAnyList.deadlines[0].seconds, 120)
+        self.assertEqual(self.server.CYCLE_OVERRUNS.value(result="aborted"), aborted_before + 1)
+
+    def test_stuck_cycles_kill_the_alexa_worker_instead_of_exiting(self):
+        self.server.sleep = lambda seconds: None
+        self.server.config["cycle_budget"] = 120
+        self.server._load_config = lambda: self.server.config
+
+        with patch.object(self.server, "Watchdog", wraps=self.server.Watchdog) as mock_watchdog:
+            self.server.main(max_cycles=1, retry_delay=0, sync_delay=0)
+        self.assertIsNone(mock_watchdog.call_args.kwargs["exit_after"])
+
+        self.server._start_alexa()
+        self.addCleanup(self.server._stop_alexa)
+        fired_before = self.server.WATCHDOG_FIRED.value()
+        mock_watchdog.call_args.kwargs["on_fire"](300)
+        self.assertEqual(FakeAlexa.abort_calls, 1)
+        self.assertEqual(self.server.WATCHDOG_FIRED.value(), fired_before + 1)
+
+    def test_anylist_keeps_syncing_while_alexa_is_unavailable(self):
+        self.server.sleep = lambda seconds: None
+        self.server.config["degraded_alexa_retry"] = 0
+        self.server._load_config = lambda: self.server.config
+        # The first login fails and so does the first attempt to bring Alexa back
+        FakeAlexa.unavailable_logins = 2
+        FakeSynchronizer.sync_calls = 1
+
+        self.server.main(max_cycles=4, retry_delay=0, sync_delay=0)
+
+        self.assertEqual(FakeAnyList.instances, 1)
+        self.assertEqual(FakeDegradedSync.instances, 1)
+        self.assertEqual(FakeDegradedSync.sync_calls, 2)
+        self.assertEqual(FakeSynchronizer.instances, 1)
+        self.assertEqual(FakeSynchronizer.sync_calls, 3)
+        self.assertEqual(self.server.DEGRADED_SECONDS.value(), 0)
+        self.assertEqual(self.server.OUTBOX_DEPTH.value(), 2)
+
+    def test_anylist_failures_while_degraded_stay_degraded(self):
+        self.server.sleep = lambda seconds: None
+        self.server._load_config = lambda: self.server.config
+        FakeAlexa.unavailable_logins = 1
+        FakeDegradedSync.failure = failure("anylist")
+
+        self.server.main(max_cycles=3, retry_delay=0, sync_delay=0)
+
+        # Alexa is only tried again on the degraded_alexa_retry schedule
+        self.assertEqual(len(FakeAlexa.login_calls), 1)
+        self.assertEqual(FakeSynchronizer.instances, 0)
+        self.assertEqual(FakeDegradedSync.instances, 2)
+        self.assertEqual(FakeDegradedSync.sync_calls, 3)
+
+    def test_degraded_mode_can_be_turned_off(self):
+        self.server.config["degraded_mode"] = False
+        self.server._load_config = lambda: self.server.config
+        FakeAlexa.unavailable_logins = 1
+
+        with self.assertRaisesRegex(RuntimeError, "Alexa login failed"):
+            self.server.main(max_cycles=2, retry_delay=0, sync_delay=0)
+
+        self.assertEqual(FakeAnyList.teardown_calls, 1)
+
+    def test_live_changes_cut_the_wait_for_the_next_sync_short(self):
+        sleep_calls = []
+        waits = []
+        self.server.sleep = sleep_calls.append
+        self.server.config["alexa_live_changes"] = True
+        self.server._load_config = lambda: self.server.config
+        FakeSynchronizer.sync_calls = 1
+        FakeAlexa.wait_for_changes = lambda alexa, seconds: waits.append(seconds) or True
+        self.addCleanup(delattr, FakeAlexa, "wait_for_changes")
+        live_before = self.server.LIVE_CHANGES.value()
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=30)
+
+        self.assertEqual(waits, [30, 30])
+        self.assertEqual(sleep_calls, [])
+        self.assertEqual(self.server.LIVE_CHANGES.value(), live_before + 2)
+
+    def test_live_changes_are_off_by_default(self):
+        sleep_calls = []
+        self.server.sleep = sleep_calls.append
+        FakeSynchronizer.sync_calls = 1
+        FakeAlexa.wait_for_changes = lambda alexa, seconds: self.fail("not enabled")
+        self.addCleanup(delattr, FakeAlexa, "wait_for_changes")
+
+        self.server.main(max_cycles=2, retry_delay=0, sync_delay=30)
+
+        self.assertEqual(sleep_calls, [30, 30])
+
 
 if __name__ == "__main__":
     unittest.main()
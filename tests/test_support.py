@@ -234,6 +234,9 @@ def install_runtime_stubs() -> None:
             def goto(self, *args, **kwargs):
                 return None
 
+            def on(self, *args, **kwargs):
+                return None
+
             def locator(self, *args, **kwargs):
                 return _FakeLocator()
 
@@ -0,0 +1,527 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+from errors import SIDE_ALEXA  # noqa: E402
+from errors import side_of  # noqa: E402
+from names import NameCanonicalizer  # noqa: E402
+from synchronizer import Baseline  # noqa: E402
+from synchronizer import Journal  # noqa: E402
+from synchronizer import ListSnapshot  # noqa: E402
+from synchronizer import SnapshotItem  # noqa: E402
+from synchronizer import Synchronizer  # noqa: E402
+
+
+class FakeItem:
+    def __init__(self, identifier, name, checked=False):
+        self.identifier = identifier
+        self.name = name
+        self.checked = checked
+
+    def __eq__(self, other):
+        return (
+            getattr(other, "identifier", None) == self.identifier
+            and getattr(other, "name", None) == self.name
+            and getattr(other, "checked", None) == self.checked
+        )
+
+
+class FakeAnyListState:
+    def __init__(self, items):
+        self.items = items
+        self.added = []
+        self.checked = []
+
+    def __iter__(self):
+        yield from self.items
+
+    def __contains__(self, item):
+        return self.get_item_by_id(item.identifier) is not None
+
+    def get_item_by_id(self, identifier):
+        return next((item for item in self.items if item.identifier == identifier), None)
+
+    def get_item_by_name(self, name):
+        return next((item for item in self.items if item.name == name), None)
+
+    def add_or_uncheck_item(self, name):
+        self.added.append(name)
+        item = self.get_item_by_name(name)
+        if item is None:
+            self.items.append(FakeItem(f"id-{name}", name))
+        else:
+            item.checked = False
+
+    def check_item(self, name):
+        self.checked.append(name)
+        self.get_item_by_name(name).checked = True
+
+
+class FakeAlexaApi:
+    def __init__(self, items, fail_on=None, dropped=()):
+        self.items = list(items)
+        self.calls = []
+        self.fail_on = fail_on
+        # Items whose first add is lost without an error
+        self.dropped = set(dropped)
+        self.scrapes = 0
+        self.refreshed = []
+
+    def _record(self, call):
+        self.calls.append(call)
+        if call == self.fail_on:
+            raise RuntimeError(f"simulated crash during {call}")
+
+    def get_alexa_list(self, refresh=True):
+        self.scrapes += 1
+        self.refreshed.append(refresh)
+        return list(self.items)
+
+    def add_alexa_list_item(self, item, scrape=True):
+        self._record(("add", item))
+        if item in self.dropped:
+            self.dropped.discard(item)
+        else:
+            self.items.append(item)
+        return list(self.items) if scrape else True
+
+    def remove_alexa_list_item(self, item, scrape=True):
+        self._record(("remove", item))
+        if item not in self.items:
+            return None
+        self.items.remove(item)
+        return list(self.items) if scrape else True
+
+    def update_alexa_list_item(self, old, new, scrape=True):
+        self._record(("update", old, new))
+        self.items[self.items.index(old)] = new
+        return list(self.items) if scrape else True
+
+
+def make_syncer(anylist_list, alexa_api, journal, old_anylist_list=None, old_alexa_list=None):
+    syncer = Synchronizer.__new__(Synchronizer)
+    syncer.log = logging.getLogger("test-synchronizer")
+    syncer.alexa = alexa_api
+    syncer._names = NameCanonicalizer()
+    syncer._cycles_since_full_scrape = None
+    syncer._alexa_verify_every = 1
+    syncer._unverified = []
+    syncer._anylist_seen_at = None
+    syncer._alexa_seen_at = None
+    syncer._latency = None
+    syncer._journal = journal
+    syncer._anylist_list = anylist_list
+    syncer._anylist_snapshot = ListSnapshot.from_list(anylist_list)
+    syncer._alexa_list = alexa_api.get_alexa_list()
+    syncer._old_anylist_list = old_anylist_list if old_anylist_list is not None else FakeAnyListState([])
+    syncer._old_alexa_list = old_alexa_list if old_alexa_list is not None else list(syncer._alexa_list)
+    syncer._refresh_baselines = lambda: None
+    return syncer
+
+
+class OperationJournalTests(unittest.TestCase):
+    def test_prepare_transaction_records_operations_with_payload(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk"), FakeItem("2", "Eggs", checked=True)])
+        old_anylist_list = FakeAnyListState([FakeItem("2", "Eggs")])
+        alexa_api = FakeAlexaApi(["Eggs", "bread"])
+        syncer = make_syncer(anylist_list, alexa_api, Journal(), old_anylist_list, ["Eggs"])
+
+        syncer._prepare_transaction()
+
+        operations = syncer._journal.get(Synchronizer.JOURNAL_KEY_OPERATIONS)
+        self.assertEqual(
+            [(op["op"], op.get("name"), op.get("old"), op.get("new")) for op in operations],
+            [
+                (Synchronizer.OP_ALEXA_ADD, "Milk", None, None),
+                (Synchronizer.OP_ALEXA_REMOVE, "Eggs", None, None),
+                (Synchronizer.OP_ANYLIST_ADD, "Bread", None, None),
+            ],
+        )
+        self.assertTrue(all(op["state"] == Synchronizer.OP_STATE_PENDING for op in operations))
+
+    def test_recovery_only_executes_pending_operations(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal_path = Path(tmpdir) / "journal.json"
+            anylist_list = FakeAnyListState([FakeItem("1", "Milk"), FakeItem("2", "Eggs")])
+            alexa_api = FakeAlexaApi([], fail_on=("add", "Eggs"))
+            syncer = make_syncer(anylist_list, alexa_api, Journal(journal_file=str(journal_path)))
+            syncer._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_NEW_ITEMS, "1")
+            syncer._journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_NEW_ITEMS, "2")
+            for operation in syncer._plan_operations():
+                syncer._journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, operation)
+            syncer._journal.save()
+
+            with self.assertRaisesRegex(RuntimeError, "simulated crash"):
+                syncer._commit_transaction()
+
+            saved = json.loads(journal_path.read_text())
+            self.assertTrue(saved["dirty"])
+            self.assertEqual(
+                [op["state"] for op in saved["data"][Synchronizer.JOURNAL_KEY_OPERATIONS]],
+                [Synchronizer.OP_STATE_DONE, Synchronizer.OP_STATE_PENDING],
+            )
+
+            # Restart: the ids can no longer be resolved, the payload is enough
+            alexa_api.fail_on = None
+            alexa_api.calls.clear()
+            restarted = make_syncer(FakeAnyListState([]), alexa_api, Journal(journal_file=str(journal_path)))
+            restarted._commit_transaction()
+
+            self.assertEqual(alexa_api.calls, [("add", "Eggs")])
+            self.assertFalse(json.loads(journal_path.read_text())["dirty"])
+
+    def test_commit_transaction_plans_legacy_journal_without_operations(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk", checked=True)])
+        alexa_api = FakeAlexaApi(["Milk"])
+        journal = Journal()
+        journal.add(Synchronizer.JOURNAL_KEY_ANYLIST_CHECKED_ITEMS, "1")
+        syncer = make_syncer(anylist_list, alexa_api, journal)
+
+        syncer._commit_transaction()
+
+        self.assertEqual(alexa_api.calls, [("remove", "Milk")])
+        self.assertFalse(journal.is_dirty)
+
+
+class FakeAnyListApi:
+    def __init__(self, state):
+        self.state = state
+
+    def refresh(self):
+        return self.state
+
+
+class BaselinePersistenceTests(unittest.TestCase):
+    def test_baseline_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline = Baseline(baseline_file=os.path.join(tmpdir, "journal-baseline.json"))
+            baseline.save(ListSnapshot([SnapshotItem("1", "Milk", True)], identifier="list-id"), ["Eggs"])
+
+            anylist_list, alexa_list = baseline.load()
+
+            self.assertEqual(anylist_list.identifier, "list-id")
+            self.assertEqual(anylist_list.get_item_by_id("1"), SnapshotItem("1", "Milk", True))
+            self.assertEqual(alexa_list, ["Eggs"])
+
+    def test_startup_syncs_against_saved_baseline_instead_of_clobbering(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"CONFIG_PATH": tmpdir}):
+            Baseline(baseline_file=os.path.join(tmpdir, "journal-baseline.json")).save(
+                ListSnapshot([SnapshotItem("1", "Milk")]), ["Milk"]
+            )
+            anylist_list = FakeAnyListState([FakeItem("1", "Milk")])
+            # Someone added bread by voice while we were down
+            alexa_api = FakeAlexaApi(["Milk", "bread"])
+
+            syncer = Synchronizer(FakeAnyListApi(anylist_list), alexa_api, journal_file="journal.json")
+
+            self.assertEqual(alexa_api.calls, [])
+            self.assertEqual(anylist_list.added, ["Bread"])
+            self.assertEqual(syncer._old_alexa_list, ["Milk", "bread"])
+            _, saved_alexa_list = Baseline(baseline_file=os.path.join(tmpdir, "journal-baseline.json")).load()
+            self.assertEqual(saved_alexa_list, ["Milk", "bread"])
+
+    def test_startup_without_baseline_clobbers_alexa(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"CONFIG_PATH": tmpdir}):
+            anylist_list = FakeAnyListState([FakeItem("1", "Milk")])
+            alexa_api = FakeAlexaApi(["Milk", "bread"])
+
+            Synchronizer(FakeAnyListApi(anylist_list), alexa_api, journal_file="journal.json")
+
+            self.assertEqual(alexa_api.calls, [("remove", "bread")])
+
+    def test_changes_pushed_during_the_alexa_scrape_are_synced_next_cycle(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk")])
+        alexa_api = FakeAlexaApi(["Milk"])
+        syncer = Synchronizer(FakeAnyListApi(anylist_list), alexa_api)
+
+        scrape = alexa_api.get_alexa_list
+
+        def scrape_while_bread_is_added(refresh=True):
+            # The websocket merges a new item into the live list while Alexa is being scraped
+            anylist_list.items.append(FakeItem("2", "Bread"))
+            return scrape(refresh)
+
+        alexa_api.get_alexa_list = scrape_while_bread_is_added
+        syncer._sync()
+        alexa_api.get_alexa_list = scrape
+
+        self.assertIsNone(syncer._old_anylist_list.get_item_by_id("2"))
+        syncer._sync()
+        self.assertEqual(alexa_api.calls, [("add", "Bread")])
+
+
+class NameMatchingTests(unittest.TestCase):
+    def test_case_differences_are_not_a_mismatch(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk"), FakeItem("2", "Eggs", checked=True)])
+
+        syncer = Synchronizer(FakeAnyListApi(anylist_list), FakeAlexaApi(["milk "]))
+
+        self.assertEqual(syncer.alexa.calls, [])
+
+    def test_alexa_item_matching_checked_anylist_item_unchecks_it(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Eggs", checked=True)])
+        alexa_api = FakeAlexaApi(["egg"])
+        syncer = make_syncer(anylist_list, alexa_api, Journal(), ListSnapshot(anylist_list.items[:]), [])
+        syncer._names = NameCanonicalizer.from_config({"plural_suffixes": ["s"]})
+
+        syncer._prepare_transaction()
+        syncer._commit_transaction()
+
+        self.assertEqual(anylist_list.added, ["Eggs"])
+        self.assertEqual(alexa_api.calls, [])
+
+
+class FakeProbingAlexaApi(FakeAlexaApi):
+    def __init__(self, items):
+        super().__init__(items)
+        self.full_scrapes = 0
+        self.changed = False
+
+    def get_alexa_list(self, refresh=True):
+        self.full_scrapes += 1
+        return super().get_alexa_list(refresh)
+
+    def alexa_list_unchanged(self):
+        return not self.changed
+
+
+class AlexaProbeTests(unittest.TestCase):
+    def test_idle_cycles_skip_full_scrape_until_forced(self):
+        alexa_api = FakeProbingAlexaApi(["Milk"])
+        syncer = Synchronizer(
+            FakeAnyListApi(FakeAnyListState([FakeItem("1", "Milk")])),
+            alexa_api,
+            alexa_full_scrape_every=3,
+        )
+        self.assertEqual(alexa_api.full_scrapes, 1)
+
+        for _ in range(3):
+            syncer.sync()
+
+        # Two cycles trust the probe, the third one is a forced full scrape
+        self.assertEqual(alexa_api.full_scrapes, 2)
+
+        alexa_api.changed = True
+        syncer.sync()
+        self.assertEqual(alexa_api.full_scrapes, 3)
+
+
+class FakeCycleAlexaApi(FakeAlexaApi):
+    def __init__(self, items):
+        super().__init__(items)
+        self.cycles = []
+        self.fail_scrape = False
+
+    def get_alexa_list(self, refresh=True):
+        if self.fail_scrape:
+            raise RuntimeError("scrape failed")
+        return super().get_alexa_list(refresh)
+
+    def start_cycle(self):
+        self.cycles.append("start")
+
+    def finish_cycle(self, failed=False):
+        self.cycles.append("failed" if failed else "finished")
+
+
+class CycleHookTests(unittest.TestCase):
+    def test_sync_tells_alexa_driver_when_cycles_start_and_end(self):
+        alexa_api = FakeCycleAlexaApi(["Milk"])
+        syncer = Synchronizer(FakeAnyListApi(FakeAnyListState([FakeItem("1", "Milk")])), alexa_api)
+
+        syncer.sync()
+        alexa_api.fail_scrape = True
+        with self.assertRaisesRegex(RuntimeError, "scrape failed"):
+            syncer.sync()
+
+        self.assertEqual(alexa_api.cycles, ["start", "finished", "start", "failed"])
+
+    def test_failures_are_blamed_on_the_side_that_raised_them(self):
+        alexa_api = FakeCycleAlexaApi(["Milk"])
+        syncer = Synchronizer(FakeAnyListApi(FakeAnyListState([FakeItem("1", "Milk")])), alexa_api)
+        alexa_api.fail_scrape = True
+
+        with self.assertRaises(RuntimeError) as raised:
+            syncer.sync()
+
+        self.assertEqual(side_of(raised.exception), SIDE_ALEXA)
+
+
+class ClobberPlannerTests(unittest.TestCase):
+    def test_plan_clobber_pairs_renames_and_skips_matching_names(self):
+        anylist_list = FakeAnyListState([
+            FakeItem("1", "Milk"),
+            FakeItem("2", "Eggs"),
+            FakeItem("3", "Banana"),
+            FakeItem("4", "Bread"),
+            FakeItem("5", "Cheese", checked=True),
+            FakeItem("6", "Rice"),
+        ])
+        alexa_api = FakeAlexaApi(["milk", "Eggs ", "Bananas", "old stuff", "Cheese", "Rice"])
+        syncer = make_syncer(anylist_list, alexa_api, Journal())
+
+        operations = syncer._plan_clobber()
+
+        self.assertEqual(
+            [(op["op"], op.get("name") or (op["old"], op["new"])) for op in operations],
+            [
+                (Synchronizer.OP_ALEXA_RENAME, ("Bananas", "Banana")),
+                (Synchronizer.OP_ALEXA_REMOVE, "old stuff"),
+                (Synchronizer.OP_ALEXA_REMOVE, "Cheese"),
+                (Synchronizer.OP_ALEXA_ADD, "Bread"),
+            ],
+        )
+
+    def test_clobber_alexa_executes_plan_and_clears_journal(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk"), FakeItem("2", "Eggs", checked=True)])
+        alexa_api = FakeAlexaApi(["Milks", "Eggs"])
+        syncer = make_syncer(anylist_list, alexa_api, Journal())
+        syncer._baseline = Baseline()
+
+        syncer._clobber_alexa()
+
+        self.assertEqual(alexa_api.calls, [("update", "Milks", "Milk"), ("remove", "Eggs")])
+        self.assertEqual(syncer._old_alexa_list, ["Milk"])
+        self.assertFalse(syncer._journal.is_dirty)
+
+
+class LatencyTrackingTests(unittest.TestCase):
+    def test_operations_record_latency_from_when_the_change_was_seen(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk", checked=True), FakeItem("2", "Eggs")])
+        old_anylist_list = FakeAnyListState([FakeItem("1", "Milk"), FakeItem("2", "Eggs")])
+        alexa_api = FakeAlexaApi(["Milk", "bread"])
+        syncer = make_syncer(anylist_list, alexa_api, Journal(), old_anylist_list, ["Milk", "Eggs"])
+        syncer._anylist_seen_at = 1000.0
+        syncer._alexa_seen_at = 1010.0
+
+        syncer._prepare_transaction()
+        operations = syncer._journal.get(Synchronizer.JOURNAL_KEY_OPERATIONS)
+        self.assertEqual(
+            [(op["op"], op["kind"], op["seen_at"]) for op in operations],
+            [
+                (Synchronizer.OP_ALEXA_REMOVE, "check", 1000.0),
+                (Synchronizer.OP_ANYLIST_ADD, "add", 1010.0),
+                (Synchronizer.OP_ANYLIST_CHECK, "delete", 1010.0),
+            ],
+        )
+
+        with patch.object(time, "time", return_value=1030.0):
+            syncer._commit_transaction()
+
+        summary = syncer.latency.summary()
+        self.assertEqual(summary["anylist_to_alexa"]["check"]["p50"], 30.0)
+        self.assertEqual(summary["alexa_to_anylist"]["add"]["p50"], 20.0)
+        self.assertEqual(summary["alexa_to_anylist"]["delete"]["count"], 1)
+
+    def test_operations_without_timestamps_are_not_recorded(self):
+        anylist_list = FakeAnyListState([FakeItem("1", "Milk", checked=True)])
+        alexa_api = FakeAlexaApi(["Milk"])
+        journal = Journal()
+        journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, {"op": Synchronizer.OP_ALEXA_REMOVE, "name": "Milk", "state": "pending"})
+        syncer = make_syncer(anylist_list, alexa_api, journal)
+
+        syncer._commit_transaction()
+
+        self.assertEqual(alexa_api.calls, [("remove", "Milk")])
+        self.assertEqual(syncer.latency.summary(), {})
+
+
+class OptimisticAlexaTests(unittest.TestCase):
+    def make(self, alexa_api, operations, verify_every):
+        journal = Journal()
+        for operation in operations:
+            journal.add(Synchronizer.JOURNAL_KEY_OPERATIONS, dict(operation, state=Synchronizer.OP_STATE_PENDING))
+        syncer = make_syncer(FakeAnyListState([]), alexa_api, journal)
+        syncer._alexa_verify_every = verify_every
+        alexa_api.scrapes = 0
+        alexa_api.refreshed = []
+        return syncer
+
+    def test_alexa_is_only_scraped_every_few_changes_and_at_the_end(self):
+        alexa_api = FakeAlexaApi(["Milk"])
+        names = ["Eggs", "Bread", "Tea", "Coffee", "Rice"]
+        syncer = self.make(alexa_api, [{"op": Synchronizer.OP_ALEXA_ADD, "name": name} for name in names], 3)
+
+        syncer._commit_transaction()
+
+        self.assertEqual(alexa_api.scrapes, 2)
+        # From the top of a refreshed page each time
+        self.assertEqual(alexa_api.refreshed, [True, True])
+        self.assertEqual(syncer._alexa_list, ["Milk"] + names)
+        self.assertFalse(syncer._journal.is_dirty)
+
+    def test_changes_that_did_not_stick_are_made_again(self):
+        alexa_api = FakeAlexaApi(["Milk"], dropped=["Eggs"])
+        syncer = self.make(alexa_api, [
+            {"op": Synchronizer.OP_ALEXA_ADD, "name": "Eggs"},
+            {"op": Synchronizer.OP_ALEXA_RENAME, "old": "Milk", "new": "Oat milk"},
+        ], 10)
+
+        syncer._commit_transaction()
+
+        self.assertEqual(alexa_api.calls, [("add", "Eggs"), ("update", "Milk", "Oat milk"), ("add", "Eggs")])
+        self.assertEqual(sorted(syncer._alexa_list), ["Eggs", "Oat milk"])
+
+    def test_latency_is_recorded_once_alexa_was_checked(self):
+        alexa_api = FakeAlexaApi(["Milk"], dropped=["Eggs"])
+        syncer = self.make(alexa_api, [
+            {"op": Synchronizer.OP_ALEXA_ADD, "name": "Eggs", "kind": "add", "seen_at": 1000.0},
+        ], 10)
+        scrape = alexa_api.get_alexa_list
+        recorded_at_scrape = []
+
+        def checked_scrape(refresh=True):
+            recorded_at_scrape.append(syncer.latency.summary())
+            return scrape(refresh)
+
+        alexa_api.get_alexa_list = checked_scrape
+        with patch.object(time, "time", return_value=1030.0):
+            syncer._commit_transaction()
+
+        # Not when the add was sent, it didn't stick and had to be made again
+        self.assertEqual(recorded_at_scrape, [{}])
+        self.assertEqual(syncer.latency.summary()["anylist_to_alexa"]["add"]["count"], 1)
+
+    def test_missing_items_are_checked_right_away(self):
+        alexa_api = FakeAlexaApi(["Milk", "Eggs"])
+        syncer = self.make(alexa_api, [
+            {"op": Synchronizer.OP_ALEXA_REMOVE, "name": "Eggs"},
+            {"op": Synchronizer.OP_ALEXA_ADD, "name": "Bread"},
+        ], 10)
+        # Someone else removed Eggs in the meantime
+        alexa_api.items.remove("Eggs")
+
+        syncer._commit_transaction()
+
+        self.assertEqual(alexa_api.scrapes, 2)
+        self.assertEqual(syncer._alexa_list, ["Milk", "Bread"])
+
+    def test_unchecked_changes_are_not_marked_done(self):
+        alexa_api = FakeAlexaApi([], fail_on=("add", "Bread"))
+        syncer = self.make(alexa_api, [
+            {"op": Synchronizer.OP_ALEXA_ADD, "name": "Eggs"},
+            {"op": Synchronizer.OP_ALEXA_ADD, "name": "Bread"},
+        ], 10)
+
+        with self.assertRaisesRegex(RuntimeError, "simulated crash"):
+            syncer._commit_transaction()
+
+        # Eggs was never checked, so it's made again (and found already there) after a restart
+        operations = syncer._journal.get(Synchronizer.JOURNAL_KEY_OPERATIONS)
+        self.assertEqual([op["state"] for op in operations], [Synchronizer.OP_STATE_PENDING] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
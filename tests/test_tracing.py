@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+import types
+import unittest
+from unittest.mock import patch
+
+from tests.test_support import install_runtime_stubs
+
+
+install_runtime_stubs()
+
+import alexa  # noqa: E402
+from tracing import CycleTracer  # noqa: E402
+
+
+class FakeTracing:
+    def __init__(self, trace_size=100):
+        self.trace_size = trace_size
+        self.calls = []
+
+    def start(self, **kwargs):
+        self.calls.append("start")
+
+    def start_chunk(self):
+        self.calls.append("start_chunk")
+
+    def stop_chunk(self, path=None):
+        self.calls.append("stop_chunk" if path is None else "save_chunk")
+        if path is not None:
+            with open(path, "wb") as file:
+                file.write(b"x" * self.trace_size)
+
+    def stop(self):
+        self.calls.append("stop")
+
+
+class CycleTracerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tracing = FakeTracing()
+        self.tracer = CycleTracer(types.SimpleNamespace(tracing=self.tracing), self.tmp.name, slow_seconds=60, max_bytes=250)
+
+    def _cycle(self, failed=False, elapsed=0):
+        with patch.object(time, "monotonic", return_value=1000):
+            self.tracer.start_cycle()
+        with patch.object(time, "monotonic", return_value=1000 + elapsed), patch("builtins.print"):
+            return self.tracer.finish_cycle(failed=failed)
+
+    def test_fast_cycles_are_dropped(self):
+        self.assertIsNone(self._cycle(elapsed=5))
+        self.assertIsNone(self._cycle(elapsed=10))
+
+        self.assertEqual(self.tracing.calls, ["start", "start_chunk", "stop_chunk", "start_chunk", "stop_chunk"])
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_failed_and_slow_cycles_are_kept(self):
+        failed = self._cycle(failed=True, elapsed=1)
+        slow = self._cycle(elapsed=60)
+
+        self.assertTrue(failed.endswith("_failed_trace.zip"))
+        self.assertTrue(slow.endswith("_slow_trace.zip"))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), sorted([os.path.basename(failed), os.path.basename(slow)]))
+
+    def test_oldest_traces_are_deleted_over_the_quota(self):
+        paths = []
+        for age in range(4):
+            path = self._cycle(failed=True)
+            # Make sure they don't all have the same mtime
+            os.utime(path, (age, age))
+            paths.append(path)
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), sorted(os.path.basename(path) for path in paths[-2:]))
+
+    def test_tracing_errors_do_not_break_the_cycle(self):
+        def broken(**kwargs):
+            raise RuntimeError("tracing not supported")
+
+        self.tracing.start = broken
+
+        with patch("builtins.print"):
+            self.tracer.start_cycle()
+        self.assertIsNone(self.tracer.finish_cycle(failed=True))
+
+
+class AlexaTracingTests(unittest.TestCase):
+    def test_cycles_are_traced_when_a_tracer_is_set(self):
+        instance = alexa.AlexaShoppingList.__new__(alexa.AlexaShoppingList)
+        tracing = FakeTracing()
+        with tempfile.TemporaryDirectory() as tmp:
+            instance.tracer = CycleTracer(types.SimpleNamespace(tracing=tracing), tmp)
+
+            instance.start_cycle()
+            with patch("builtins.print"):
+                instance.finish_cycle(failed=True)
+
+            self.assertEqual(len(os.listdir(tmp)), 1)
+        self.assertEqual(tracing.calls, ["start", "start_chunk", "save_chunk"])
+
+
+if __name__ == "__main__":
+    unittest.main()
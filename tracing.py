@@ -0,0 +1,95 @@
+import os
+import time
+from datetime import datetime
+
+
+class CycleTracer:
+    """Records a Playwright trace of every sync cycle, and keeps it only if the cycle was worth a look.
+
+    A trace (screenshots, DOM snapshots and network) is recorded as one chunk per
+    cycle. The chunk is written to out_dir when the cycle failed or took at least
+    slow_seconds, otherwise it is thrown away. The oldest traces are deleted once
+    the ones kept add up to more than max_bytes.
+    """
+
+    def __init__(self, context, out_dir, slow_seconds=60, max_bytes=200 * 1024 * 1024):
+        self._tracing = context.tracing
+        self.out_dir = out_dir
+        self.slow_seconds = slow_seconds
+        self.max_bytes = max_bytes
+        self._started = False
+        self._chunk_started_at = None
+
+    def start_cycle(self):
+        try:
+            if not self._started:
+                self._tracing.start(screenshots=True, snapshots=True, sources=False)
+                self._started = True
+            elif self._chunk_started_at is not None:
+                # The last cycle never finished, drop what it recorded
+                self._tracing.stop_chunk()
+            self._tracing.start_chunk()
+            self._chunk_started_at = time.monotonic()
+        except Exception as e:
+            print(f"Could not start the Playwright trace: {e}")
+            self._chunk_started_at = None
+
+    def finish_cycle(self, failed=False):
+        """Stops the trace of the cycle, returns the path it was saved to or None if it was dropped."""
+        if self._chunk_started_at is None:
+            return None
+        elapsed = time.monotonic() - self._chunk_started_at
+        self._chunk_started_at = None
+
+        if not failed and elapsed < self.slow_seconds:
+            try:
+                self._tracing.stop_chunk()
+            except Exception as e:
+                print(f"Could not stop the Playwright trace: {e}")
+            return None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        reason = "failed" if failed else "slow"
+        path = os.path.join(self.out_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S.%f')}_{reason}_trace.zip")
+        try:
+            self._tracing.stop_chunk(path=path)
+        except Exception as e:
+            print(f"Could not save the Playwright trace: {e}")
+            return None
+        print(f"Saved trace of {reason} Alexa cycle ({elapsed:.1f}s) to {path}")
+        self._enforce_quota()
+        return path
+
+    def stop(self):
+        if not self._started:
+            return
+        self._started = False
+        self._chunk_started_at = None
+        try:
+            self._tracing.stop()
+        except Exception:
+            pass
+
+    def _enforce_quota(self):
+        traces = []
+        for name in os.listdir(self.out_dir):
+            if not name.endswith("_trace.zip"):
+                continue
+            path = os.path.join(self.out_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            traces.append((stat.st_mtime, name, stat.st_size, path))
+
+        total = sum(size for _, _, size, _ in traces)
+        # Oldest first, but never the trace that was just saved
+        for _, _, size, path in sorted(traces)[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            print(f"Deleted {path} to keep traces under {self.max_bytes // (1024 * 1024)} MB")